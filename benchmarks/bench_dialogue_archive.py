@@ -0,0 +1,125 @@
+"""Архивация переписки: сколько места возвращает проход компактора и мешает ли он живым записям.
+
+    python benchmarks/bench_dialogue_archive.py --rows 500000 --users 5000 --codec zlib
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from storage.database import Database  # noqa: E402
+from storage.dialogue_archive import DialogueArchiver  # noqa: E402
+from storage.dialogue_store import DialogueStore  # noqa: E402
+
+PHRASES = [
+    "Ассаляму алейкум! Расскажите немного о себе.",
+    "Я работаю инженером, люблю горы и хорошие книги.",
+    "Какие у вас ожидания от будущей семьи?",
+    "Для меня важно, чтобы супруг(а) соблюдал(а) намаз.",
+    "Спасибо, было приятно пообщаться, продолжим завтра.",
+]
+
+
+def _pct(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def _fill(db: Database, rows: int, users: int, old_share: float) -> None:
+    # первые old_share строк — «старые» (90 дней назад), остальные — свежие
+    rng = random.Random(7)
+    old = int(rows * old_share)
+    chunk = 50_000
+    for lo in range(0, rows, chunk):
+        hi = min(rows, lo + chunk)
+        await db.executemany(
+            "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, "
+            "CASE WHEN ? THEN datetime('now', '-90 days') ELSE CURRENT_TIMESTAMP END)",
+            (
+                (str(rng.randrange(users)), "user" if i % 2 else "assistant", f"{rng.choice(PHRASES)} {i}", i < old)
+                for i in range(lo, hi)
+            ),
+        )
+    # сводка уже покрывает всю переписку: без неё компактор сообщения пользователя не трогает
+    await db.execute(
+        "INSERT INTO dialogue_summaries (user_id, summary, covered_until_id) "
+        "SELECT user_id, 'сводка', MAX(id) FROM messages GROUP BY user_id"
+    )
+
+
+def _file_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--old-share", type=float, default=0.8)
+    parser.add_argument("--codec", default="zlib", choices=["zlib", "lzma"])
+    parser.add_argument("--batch-rows", type=int, default=500)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db = Database(path)
+    await db.init()
+    await _fill(db, args.rows, args.users, args.old_share)
+    async with db.writer() as conn:
+        await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    store = DialogueStore(db)
+    sample_user = "1"
+    before_history = await store.get_full_history(sample_user)
+    size_before = _file_size(path)
+    print(f"seeded {args.rows} messages for {args.users} users: {size_before / 2**20:.1f} MiB")
+
+    # живые записи во время прохода: задержка add_message
+    stop = asyncio.Event()
+    latencies: list[float] = []
+
+    async def writer() -> None:
+        while not stop.is_set():
+            started = time.perf_counter()
+            await store.add_message(str(random.randrange(args.users)), "user", "новое сообщение")
+            latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(0.005)
+
+    # для сравнения — те же записи без компактора
+    task = asyncio.create_task(writer())
+    await asyncio.sleep(3)
+    stop.set()
+    await task
+    baseline, latencies = latencies, []
+    stop.clear()
+
+    archiver = DialogueArchiver(db, codec=args.codec, batch_rows=args.batch_rows)
+    task = asyncio.create_task(writer())
+    report = await archiver.compact_once()
+    stop.set()
+    await task
+    async with db.writer() as conn:
+        await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size_after = _file_size(path)
+
+    after_history = await store.get_full_history(sample_user)
+    same = [(m["id"], m["content"]) for m in before_history] == [(m["id"], m["content"]) for m in after_history[: len(before_history)]]
+    print(
+        f"archived {report['messages']} messages of {report['users']} users in {report['seconds']}s: "
+        f"{report['raw_bytes'] / 2**20:.1f} MiB JSON → {report['archived_bytes'] / 2**20:.1f} MiB {args.codec}"
+    )
+    print(f"bytes reclaimed: {report['bytes_reclaimed'] / 2**20:.1f} MiB; file {size_before / 2**20:.1f} → {size_after / 2**20:.1f} MiB")
+    print(f"add_message idle:              p50 {_pct(baseline, 0.5):.2f} ms, p99 {_pct(baseline, 0.99):.2f} ms, max {max(baseline):.2f} ms")
+    print(f"add_message during compaction: p50 {_pct(latencies, 0.5):.2f} ms, p99 {_pct(latencies, 0.99):.2f} ms, max {max(latencies):.2f} ms")
+    print(f"full history of user {sample_user} unchanged: {same} ({len(before_history)} messages)")
+    await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""Латентность add_message/get_recent_messages по мере роста таблицы messages.
+
+    python benchmarks/bench_dialogue_scale.py --rows 1000000
+    python benchmarks/bench_dialogue_scale.py --rows 1000000 --drop-indexes   # для сравнения
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from storage.database import Database  # noqa: E402
+from storage.dialogue_store import DialogueStore  # noqa: E402
+
+
+def _pct(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def _fill(db: Database, start: int, stop: int, users: int) -> None:
+    chunk = 50_000
+    for lo in range(start, stop, chunk):
+        hi = min(stop, lo + chunk)
+        await db.executemany(
+            "INSERT INTO messages (user_id, role, content) VALUES (?, ?, ?)",
+            (
+                (str(i % users), "user" if i % 2 else "assistant", f"сообщение {i} " * 4)
+                for i in range(lo, hi)
+            ),
+        )
+
+
+async def _measure(store: DialogueStore, users: int, samples: int) -> tuple[list[float], list[float]]:
+    writes: list[float] = []
+    reads: list[float] = []
+    for _ in range(samples):
+        user_id = str(random.randrange(users))
+        t0 = time.perf_counter()
+        await store.add_message(user_id=user_id, role="user", content="привет")
+        t1 = time.perf_counter()
+        await store.get_recent_messages(user_id=user_id, limit=12)
+        t2 = time.perf_counter()
+        writes.append((t1 - t0) * 1000)
+        reads.append((t2 - t1) * 1000)
+    return writes, reads
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--checkpoints", type=int, default=5)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--db", default=None, help="путь к файлу БД (по умолчанию временный)")
+    parser.add_argument("--drop-indexes", action="store_true")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench.db")
+    db = Database(path)
+    await db.init()
+    if args.drop_indexes:
+        await db.execute("DROP INDEX IF EXISTS idx_messages_user_id")
+    store = DialogueStore(db)
+    await store.init()
+
+    print(f"db={path} indexes={'off' if args.drop_indexes else 'on'}")
+    print(f"{'rows':>10} {'write p50':>10} {'write p99':>10} {'read p50':>10} {'read p99':>10}  (ms)")
+    filled = 0
+    for step in range(args.checkpoints + 1):
+        target = args.rows * step // args.checkpoints
+        await _fill(db, filled, target, args.users)
+        filled = target
+        writes, reads = await _measure(store, args.users, args.samples)
+        print(
+            f"{filled:>10} {_pct(writes, 0.5):>10.3f} {_pct(writes, 0.99):>10.3f} "
+            f"{_pct(reads, 0.5):>10.3f} {_pct(reads, 0.99):>10.3f}"
+        )
+    await store.close()
+    await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
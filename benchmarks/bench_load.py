@@ -0,0 +1,305 @@
+"""Нагрузочный прогон всего бота в одном процессе: вебхук → aiogram → SQLite → LLM → Bot API.
+
+    python benchmarks/bench_load.py --users 300 --mix chat=0.6,form=0.2,pay=0.1,contact=0.1 --llm-latency-ms 800
+    python benchmarks/bench_load.py --users 300 --compare benchmarks/results/<прошлый прогон>.json
+
+Приложение main:app поднимается в этом же процессе (lifespan + ASGI-транспорт), Telegram Bot API —
+заглушка из benchmarks/fakes.py на локальном порту, LLM — AI_PROVIDER=stub с логнормальной задержкой.
+Сценарии пользователей: chat — свободный текст, form — анкета /create_profile целиком,
+pay — /pay у мужчины со взаимной симпатией, contact — /contact у участницы симпатии.
+Каждый пользователь шлёт апдейты по одному (следующий — после обработки предыдущего), как в Telegram.
+Задержка — от POST /telegram/webhook до конца обработки апдейта (очередь + хендлеры).
+--llm-capacity N: LLM — OpenAI-совместимая HTTP-заглушка (фиксированная задержка), отвечающая 429
+с Retry-After сверх N одновременных запросов; проверка предела и выключателя в services/llm_guard.py.
+Итог сохраняется в JSON (--out), --compare печатает разницу с прошлым прогоном.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import fakes  # noqa: E402
+
+SCENARIOS = ("chat", "form", "pay", "contact")
+PARTNER_OFFSET = 5_000_000
+
+FORM_ANSWERS = [
+    "/create_profile", "male", "Инженер, люблю горы и книги", "29", "Россия", "Казань", "Россия", "татарин",
+    "русский, татарский", "холост", "нет", "средний", "регулярно", "борода", "высшее, инженер-строитель",
+    "проектировщик", "пропустить", "180", "среднее", "нет", "нет", "строго", "да", "чат", "горы, книги, шахматы",
+]
+CHAT_PHRASES = [
+    "Ассаляму алейкум! Расскажи, как лучше начать знакомство?",
+    "Какие вопросы стоит задать на первой встрече?",
+    "Как обсудить с семьёй будущего супруга?",
+    "Что важно знать о никахе?",
+]
+
+
+def _pct(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _summary(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {"count": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    return {
+        "count": len(samples),
+        "p50_ms": round(_pct(samples, 0.5), 2),
+        "p95_ms": round(_pct(samples, 0.95), 2),
+        "p99_ms": round(_pct(samples, 0.99), 2),
+        "max_ms": round(max(samples), 2),
+    }
+
+
+def _parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, share = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(share)
+    return mix
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _update(update_id: int, user_id: int, text: str) -> dict[str, Any]:
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}", "language_code": "ru"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+def _messages(scenario: str, count: int, rng: random.Random) -> list[str]:
+    if scenario == "form":
+        return FORM_ANSWERS
+    if scenario == "chat":
+        return [rng.choice(CHAT_PHRASES) for _ in range(count)]
+    return [f"/{scenario}"] * count
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    os.environ.update(fakes.stub_env(
+        f"http://127.0.0.1:{args.fake_port}",
+        os.path.join(tempfile.mkdtemp(), "bench.db"),
+        llm_latency_ms=args.llm_latency_ms,
+        llm_sigma=args.llm_sigma,
+        streaming=args.streaming,
+    ))
+    os.environ["UPDATE_MAX_BACKLOG"] = str(max(1000, args.users * 2))
+    if args.llm_capacity:
+        # LLM — OpenAI-совместимая заглушка с пределом одновременных запросов (429 сверх него)
+        os.environ["AI_PROVIDER"] = "openai_compatible"
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.fake_port}/v1"
+    if args.hedge:
+        # запасной провайдер — такая же заглушка с независимой задержкой
+        os.environ["AI_BACKUP_PROVIDER"] = "stub"
+        os.environ["AI_HEDGE_AFTER_MS"] = str(args.hedge_after_ms)
+    # настройки читаются при импорте и кэшируются — импорт только после окружения
+    import httpx
+
+    import main
+    from services.metrics import DB_LOCK_WAIT_SECONDS, LLM_HEDGES, LLM_SECONDS, TELEGRAM_SECONDS, UPDATE_SECONDS
+
+    fake_app = fakes.create_app(llm_latency=args.llm_latency_ms / 1000, llm_capacity=args.llm_capacity)
+    fake_server, fake_task = await fakes.serve(fake_app, args.fake_port)
+
+    rng = random.Random(args.seed)
+    weights = _parse_mix(args.mix)
+    plan = [rng.choices(list(weights), weights=list(weights.values()))[0] for _ in range(args.users)]
+
+    sent: dict[int, float] = {}
+    done: dict[int, asyncio.Future[float]] = {}
+
+    async def track(handler: Any, event: Any, data: dict[str, Any]) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            future = done.get(event.update_id)
+            if future is not None and not future.done():
+                future.set_result(time.perf_counter())
+
+    try:
+        async with main.lifespan(main.app):
+            app = main.app
+            app.state.dp.update.outer_middleware(track)
+            # взаимные симпатии для /pay и /contact: pay — мужчина, contact — участница
+            for n, scenario in enumerate(plan):
+                if scenario in {"pay", "contact"}:
+                    user_id = 10_000 + n
+                    male, female = (user_id, user_id + PARTNER_OFFSET) if scenario == "pay" else (user_id + PARTNER_OFFSET, user_id)
+                    await app.state.match_store.create_match(
+                        male_id=str(male), female_id=str(female), mutual=True,
+                        male_username=f"user{male}", female_username=f"user{female}",
+                    )
+            for histogram in (DB_LOCK_WAIT_SECONDS, LLM_SECONDS, TELEGRAM_SECONDS, UPDATE_SECONDS):
+                histogram.clear()
+
+            latencies: dict[str, list[float]] = defaultdict(list)
+            retries = 0
+            semaphore = asyncio.Semaphore(args.concurrency)
+            next_update_id = 0
+            transport = httpx.ASGITransport(app=app)
+
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+                async def user(n: int, scenario: str) -> None:
+                    nonlocal retries, next_update_id
+                    user_id = 10_000 + n
+                    for text in _messages(scenario, args.messages, random.Random(args.seed + n)):
+                        next_update_id += 1
+                        update_id = next_update_id
+                        done[update_id] = asyncio.get_running_loop().create_future()
+                        while True:
+                            async with semaphore:
+                                sent.setdefault(update_id, time.perf_counter())
+                                resp = await client.post("/telegram/webhook", json=_update(update_id, user_id, text))
+                            if resp.status_code == 200:
+                                break
+                            retries += 1
+                            await asyncio.sleep(0.2)
+                        finished = await done[update_id]
+                        del done[update_id]
+                        latencies[scenario].append((finished - sent.pop(update_id)) * 1000)
+
+                started = time.perf_counter()
+                await asyncio.gather(*(user(n, scenario) for n, scenario in enumerate(plan)))
+                elapsed = time.perf_counter() - started
+
+            scheduler = app.state.update_scheduler.stats()
+            total = sum(len(v) for v in latencies.values())
+            lock_waits = {}
+            for lock in ("writer", "reader"):
+                count, seconds = DB_LOCK_WAIT_SECONDS.totals(lock)
+                lock_waits[lock] = {
+                    "acquisitions": count,
+                    "total_wait_s": round(seconds, 3),
+                    "mean_ms": round(seconds / count * 1000, 3) if count else 0.0,
+                    "p99_ms": round(DB_LOCK_WAIT_SECONDS.quantile(0.99, lock) * 1000, 3),
+                }
+            return {
+                "revision": _git_revision(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "config": {
+                    "users": args.users,
+                    "messages": args.messages,
+                    "mix": weights,
+                    "concurrency": args.concurrency,
+                    "llm_latency_ms": args.llm_latency_ms,
+                    "llm_sigma": args.llm_sigma,
+                    "streaming": args.streaming,
+                    "hedge": args.hedge,
+                    "llm_capacity": args.llm_capacity,
+                    "seed": args.seed,
+                    "cpus": os.cpu_count(),
+                },
+                "updates": total,
+                "seconds": round(elapsed, 2),
+                "throughput": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+                "retries": retries,
+                "failed": scheduler["failed"],
+                "latency": {"all": _summary([x for v in latencies.values() for x in v])}
+                | {name: _summary(latencies[name]) for name in SCENARIOS if latencies[name]},
+                "lock_waits": lock_waits,
+                "llm_calls": LLM_SECONDS.totals("reply", "ok")[0] + LLM_SECONDS.totals("stream_first_chunk", "ok")[0],
+                "llm_hedges": {event: int(LLM_HEDGES.value(event)) for event in ("hedge", "fallback", "backup_won")},
+                "llm_rejected_by_provider": fake_app.state.stats.llm_rejected,
+                "llm_state": app.state.ai_client.state(),
+                "telegram_requests": sum(fake_server.config.app.state.stats.methods.values()),
+            }
+    finally:
+        fake_server.should_exit = True
+        await fake_task
+
+
+def _print(result: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    def delta(new: float, old: float | None) -> str:
+        if old is None or not old:
+            return ""
+        return f" ({(new - old) / old * 100:+.0f}%)"
+
+    old_latency = (baseline or {}).get("latency", {})
+    print(
+        f"rev {result['revision']}: {result['updates']} updates in {result['seconds']}s, "
+        f"{result['throughput']} upd/s{delta(result['throughput'], (baseline or {}).get('throughput'))}, "
+        f"retries {result['retries']}, failed {result['failed']}"
+    )
+    print(f"{'scenario':<8} {'count':>6} {'p50 ms':>14} {'p95 ms':>14} {'p99 ms':>14}")
+    for name, row in result["latency"].items():
+        old = old_latency.get(name, {})
+        cells = [f"{row[k]:.0f}{delta(row[k], old.get(k))}" for k in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"{name:<8} {row['count']:>6} {cells[0]:>14} {cells[1]:>14} {cells[2]:>14}")
+    if result.get("llm_rejected_by_provider"):
+        print(f"llm provider answered 429 to {result['llm_rejected_by_provider']} requests")
+    for role, state in result.get("llm_state", {}).get("providers", {}).items():
+        print(
+            f"llm {role}: limit {state.get('limit')}, circuit {state.get('circuit')} (opened {state.get('circuit_opened')}), "
+            f"retries {state.get('retries')}, rejected {state.get('rejected')}"
+        )
+    hedges = result.get("llm_hedges", {})
+    if any(hedges.values()):
+        print(f"llm backup: {hedges['hedge']} hedges, {hedges['fallback']} fallbacks, backup answered first {hedges['backup_won']}")
+    for lock, row in result["lock_waits"].items():
+        print(
+            f"sqlite {lock} lock: {row['acquisitions']} acquisitions, total wait {row['total_wait_s']}s, "
+            f"mean {row['mean_ms']} ms, p99 {row['p99_ms']} ms"
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=5, help="сообщений на пользователя в chat/pay/contact")
+    parser.add_argument("--mix", default="chat=0.6,form=0.2,pay=0.1,contact=0.1")
+    parser.add_argument("--concurrency", type=int, default=40, help="одновременных запросов вебхука (max_connections у Telegram)")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="медиана задержки LLM")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="разброс логнормальной задержки LLM")
+    parser.add_argument("--streaming", action="store_true", help="AI_STREAMING=true (ответ правками сообщения)")
+    parser.add_argument("--llm-capacity", type=int, default=0, help="LLM через HTTP-заглушку с 429 сверх N одновременных запросов")
+    parser.add_argument("--hedge", action="store_true", help="запасная заглушка LLM и хеджирование запросов")
+    parser.add_argument("--hedge-after-ms", type=float, default=0, help="порог хеджа (0 — p95 последних ответов)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fake-port", type=int, default=8580)
+    parser.add_argument("--out", help="куда сохранить JSON (по умолчанию benchmarks/results/load-<время>-<ревизия>.json)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    result = await run(args)
+    baseline = json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    _print(result, baseline)
+    out = pathlib.Path(args.out) if args.out else ROOT / "benchmarks" / "results" / f"load-{time.strftime('%Y%m%d-%H%M%S')}-{result['revision']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"saved {out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
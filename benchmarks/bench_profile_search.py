@@ -0,0 +1,164 @@
+"""Поиск анкет по атрибутам: разбор JSON в Python и json_extract в SQL против индекса profile_search.
+
+    python benchmarks/bench_profile_search.py --profiles 100000 --repeat 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from storage.database import Database  # noqa: E402
+from storage.profile_store import ProfileStore  # noqa: E402
+
+CITIES = ["Москва", "Казань", "Махачкала", "Грозный", "Уфа", "Санкт-Петербург", "Нальчик", "Алматы", "Ташкент", "Стамбул"]
+COUNTRIES = ["Россия", "Казахстан", "Узбекистан", "Турция", "Германия"]
+LANGUAGES = ["русский", "татарский", "аварский", "английский", "арабский", "турецкий", "чеченский", "узбекский"]
+RELIGIOSITY = ["начальный", "средний", "высокий"]
+MARITAL = ["холост/незамужем", "разведен(а)", "вдовец/вдова"]
+PRAYER = ["регулярно", "иногда", "нет"]
+
+# (название, фильтры search_profiles)
+QUERIES: list[tuple[str, dict[str, Any]]] = [
+    ("city+gender+age", {"city": "Казань", "gender": "female", "age_min": 22, "age_max": 27}),
+    ("language+gender", {"language": "аварский", "gender": "male"}),
+    ("country+religiosity+age", {"country": "Турция", "religiosity": "высокий", "age_min": 30, "age_max": 35}),
+    ("gender+age", {"gender": "female", "age_min": 25, "age_max": 25}),
+    # редкое сочетание: скану без индекса приходится пройти всю таблицу
+    ("rare: city+lang+relig+age", {"city": "Нальчик", "language": "узбекский", "religiosity": "высокий", "gender": "female", "age_min": 58, "age_max": 60}),
+]
+
+
+def _pct(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _random_profile(rng: random.Random, i: int) -> dict[str, Any]:
+    return {
+        "user_id": str(1_000_000 + i),
+        "username": f"user{i}",
+        "gender": rng.choice(["male", "female"]),
+        "bio": "о себе " * 5,
+        "attributes": {
+            "age": rng.randint(18, 60),
+            "country": rng.choice(COUNTRIES),
+            "city": rng.choice(CITIES),
+            "languages": rng.sample(LANGUAGES, rng.randint(1, 3)),
+            "religiosity": rng.choice(RELIGIOSITY),
+            "marital_status": rng.choice(MARITAL),
+            "prayer": rng.choice(PRAYER),
+            "hobbies": ["чтение", "спорт"],
+        },
+    }
+
+
+def _matches(profile: tuple[Any, ...], flt: dict[str, Any]) -> bool:
+    # «как раньше»: json.loads каждой строки и сравнение в Python
+    attrs = json.loads(profile[2] or "{}")
+    if flt.get("gender") and profile[1] != flt["gender"]:
+        return False
+    age = attrs.get("age")
+    if "age_min" in flt and (age is None or age < flt["age_min"]):
+        return False
+    if "age_max" in flt and (age is None or age > flt["age_max"]):
+        return False
+    for field in ("city", "country", "religiosity"):
+        if flt.get(field) and str(attrs.get(field, "")).casefold() != flt[field].casefold():
+            return False
+    if flt.get("language") and flt["language"] not in [str(x).casefold() for x in attrs.get("languages") or []]:
+        return False
+    return True
+
+
+async def _python_scan(db: Database, flt: dict[str, Any], limit: int) -> int:
+    rows = await db.fetchall("SELECT user_id, gender, attributes FROM profiles ORDER BY user_id")
+    return len([r for r in rows if _matches(r, flt)][:limit])
+
+
+async def _json_extract_scan(db: Database, flt: dict[str, Any], limit: int) -> int:
+    where, params = [], []
+    if flt.get("gender"):
+        where.append("gender = ?")
+        params.append(flt["gender"])
+    if "age_min" in flt:
+        where.append("json_extract(attributes, '$.age') >= ?")
+        params.append(flt["age_min"])
+    if "age_max" in flt:
+        where.append("json_extract(attributes, '$.age') <= ?")
+        params.append(flt["age_max"])
+    for field in ("city", "country", "religiosity"):
+        if flt.get(field):
+            # точное сравнение: lower() в SQLite не приводит регистр кириллицы
+            where.append(f"json_extract(attributes, '$.{field}') = ?")
+            params.append(flt[field])
+    if flt.get("language"):
+        where.append("EXISTS (SELECT 1 FROM json_each(attributes, '$.languages') WHERE value = ?)")
+        params.append(flt["language"])
+    rows = await db.fetchall(
+        f"SELECT user_id FROM profiles WHERE {' AND '.join(where)} ORDER BY user_id LIMIT ?", (*params, limit)
+    )
+    return len(rows)
+
+
+async def _indexed(store: ProfileStore, flt: dict[str, Any], limit: int) -> int:
+    items, _ = await store.search_profiles(limit=limit, **flt)
+    return len(items)
+
+
+async def _measure(fn: Callable[[], Awaitable[int]], repeat: int) -> tuple[float, float, int]:
+    found = await fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return _pct(samples, 0.5), _pct(samples, 0.95), found
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--skip-python", action="store_true", help="не мерить полный разбор JSON в Python")
+    args = parser.parse_args()
+
+    db = Database(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    await db.init()
+    store = ProfileStore(db)
+    await store.init()
+
+    rng = random.Random(42)
+    started = time.perf_counter()
+    for start in range(0, args.profiles, 1000):
+        await store.upsert_profiles_many([_random_profile(rng, i) for i in range(start, min(args.profiles, start + 1000))])
+    print(f"seeded {args.profiles} profiles in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'query':<26} {'method':<14} {'p50 ms':>9} {'p95 ms':>9} {'rows':>6}")
+    for name, flt in QUERIES:
+        methods: list[tuple[str, Callable[[], Awaitable[int]]]] = []
+        if not args.skip_python:
+            methods.append(("python json", lambda: _python_scan(db, flt, args.limit)))
+        methods.append(("json_extract", lambda: _json_extract_scan(db, flt, args.limit)))
+        methods.append(("indexed", lambda: _indexed(store, flt, args.limit)))
+        for method, fn in methods:
+            repeat = max(3, args.repeat // 5) if method == "python json" else args.repeat
+            p50, p95, found = await _measure(fn, repeat)
+            print(f"{name:<26} {method:<14} {p50:>9.2f} {p95:>9.2f} {found:>6}")
+
+    await store.close()
+    await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""Похожие анкеты по тексту: построение индекса, одиночные запросы и пачка запросов.
+
+    python benchmarks/bench_similarity.py --profiles 100000 --repeat 30 [--mmap]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+from typing import Any
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from services.similarity import SimilarityIndex  # noqa: E402
+from storage.database import Database  # noqa: E402
+from storage.profile_store import ProfileStore  # noqa: E402
+
+INTERESTS = (
+    "книги спорт футбол путешествия кулинария готовка программирование рисование музыка кино горы море "
+    "плавание бег йога фотография история языки шахматы танцы садоводство"
+).split()
+
+
+def _pct(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _random_profile(rng: random.Random, i: int) -> dict[str, Any]:
+    return {
+        "user_id": str(1_000_000 + i),
+        "gender": rng.choice(["male", "female"]),
+        "bio": f"Люблю {' и '.join(rng.sample(INTERESTS, 3))}. Работаю, ищу серьёзные отношения.",
+        "attributes": {"hobbies": rng.sample(INTERESTS, 2)},
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--mmap", action="store_true", help="матрица в memory-mapped файле")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db = Database(os.path.join(workdir, "bench.db"))
+    await db.init()
+    store = ProfileStore(db)
+    await store.init()
+
+    rng = random.Random(42)
+    for start in range(0, args.profiles, 1000):
+        await store.upsert_profiles_many([_random_profile(rng, i) for i in range(start, min(args.profiles, start + 1000))])
+
+    index = SimilarityIndex(path=os.path.join(workdir, "similarity.f32") if args.mmap else None)
+    started = time.perf_counter()
+    await index.load(store)
+    print(f"load {len(index)} profiles: {time.perf_counter() - started:.2f}s ({'mmap' if args.mmap else 'memory'})")
+
+    ids = [str(1_000_000 + i) for i in rng.sample(range(args.profiles), args.batch)]
+    samples = []
+    for user_id in ids[: args.repeat]:
+        started = time.perf_counter()
+        index.similar(user_id, 10, gender="female")
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"similar top-10: p50 {_pct(samples, 0.5):.2f} ms, p95 {_pct(samples, 0.95):.2f} ms")
+
+    started = time.perf_counter()
+    index.similar_many(ids, 10)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"similar_many x{len(ids)}: {elapsed:.1f} ms ({elapsed / len(ids):.2f} ms per query)")
+
+    index.close()
+    await store.close()
+    await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Латентность подготовки запроса к LLM в on_message: прежняя цепочка вызовов против UserContextLoader.
+
+    python benchmarks/bench_user_context.py --iterations 2000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from services.business_rules import BusinessRules  # noqa: E402
+from services.user_context import UserContextLoader  # noqa: E402
+from storage.database import Database  # noqa: E402
+from storage.dialogue_store import DialogueStore  # noqa: E402
+from storage.match_store import MatchStore  # noqa: E402
+from storage.profile_store import ProfileStore  # noqa: E402
+
+
+def _pct(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def _seed(db: Database, profiles: ProfileStore, matches: MatchStore, users: int) -> None:
+    for u in range(users):
+        await profiles.upsert_profile(
+            user_id=str(u),
+            gender="male" if u % 2 == 0 else "female",
+            bio="о себе " * 10,
+            attributes={"age": 20 + u % 20, "city": "Казань", "languages": ["ru", "tt"]},
+        )
+    for u in range(0, users, 2):
+        await matches.create_match(male_id=str(u), female_id=str(u + 1), mutual=True)
+    await db.executemany(
+        "INSERT INTO messages (user_id, role, content) VALUES (?, ?, ?)",
+        ((str(i % users), "user" if i % 2 else "assistant", "текст сообщения " * 5) for i in range(users * 40)),
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = Database(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    await db.init()
+    dialogues = DialogueStore(db, write_behind=True)
+    matches = MatchStore(db)
+    profiles = ProfileStore(db)
+    for store in (dialogues, matches, profiles):
+        await store.init()
+    await _seed(db, profiles, matches, args.users)
+    rules = BusinessRules()
+    loader = UserContextLoader(profiles, matches, dialogues)
+
+    async def cursor_fetch(sql: str, params: tuple) -> None:
+        # прежний способ чтения: execute + fetch + close — три перехода в поток aiosqlite
+        async with db.reader() as conn:
+            cur = await conn.execute(sql, params)
+            await cur.fetchall()
+            await cur.close()
+
+    async def legacy(user_id: str) -> None:
+        await cursor_fetch("SELECT * FROM matches WHERE male_id = ? OR female_id = ? ORDER BY id DESC LIMIT 1", (user_id, user_id))
+        await cursor_fetch("SELECT * FROM profiles WHERE user_id = ?", (user_id,))
+        await db.execute("INSERT INTO messages (user_id, role, content) VALUES (?, ?, ?)", (user_id, "user", "привет"))
+        await rules.build_system_prompt(user_id=user_id, profile_context="p", match_context="m")
+        await cursor_fetch("SELECT role, content FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT 12", (user_id,))
+
+    async def sequential(user_id: str) -> None:
+        await matches.get_latest_match_for_user(user_id)
+        await profiles.get_profile(user_id)
+        await dialogues.add_message(user_id=user_id, role="user", content="привет")
+        await rules.build_system_prompt(user_id=user_id, profile_context="p", match_context="m")
+        await dialogues.get_recent_messages(user_id=user_id, limit=12)
+
+    async def combined(user_id: str) -> None:
+        await loader.load(user_id, history_limit=11)
+        await dialogues.add_message(user_id=user_id, role="user", content="привет")
+        await rules.build_system_prompt(user_id=user_id, profile_context="p", match_context="m")
+
+    for name, fn in (("legacy", legacy), ("handler chain", sequential), ("UserContextLoader", combined)):
+        samples = []
+        for _ in range(args.iterations):
+            user_id = str(random.randrange(args.users))
+            t0 = time.perf_counter()
+            await fn(user_id)
+            samples.append((time.perf_counter() - t0) * 1000)
+        print(f"{name:>18}: p50={_pct(samples, 0.5):.3f} ms  p95={_pct(samples, 0.95):.3f} ms  p99={_pct(samples, 0.99):.3f} ms")
+
+    await dialogues.close()
+    await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
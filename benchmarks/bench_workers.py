@@ -0,0 +1,177 @@
+"""Пропускная способность вебхука: один процесс main:app против фронта с N процессами (front:app).
+
+    python benchmarks/bench_workers.py --workers 1,4 --users 200 --messages 5 --llm-latency-ms 300
+
+Telegram Bot API и LLM — заглушки из benchmarks/fakes.py. Каждый пользователь шлёт сообщения
+по одному (следующее — после 200 OK, как Telegram), пользователи параллельно до --concurrency.
+Задержка — от отправки апдейта до sendMessage с ответом на него.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+import httpx
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+TOKEN = "123456:AAbenchmarkbenchmarkbenchmarkbenchmark"
+
+
+def _pct(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _update(update_id: int, user_id: int, text: str) -> dict[str, Any]:
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "language_code": "ru"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+async def _wait_http(client: httpx.AsyncClient, url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} is not up after {timeout:.0f}s")
+
+
+async def _run(args: argparse.Namespace, workers: int, fake_url: str) -> dict[str, Any]:
+    workdir = tempfile.mkdtemp()
+    env = {
+        **os.environ,
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "TELEGRAM_WEBHOOK_URL": "",
+        "TELEGRAM_WEBHOOK_SECRET": "",
+        "TELEGRAM_API_BASE_URL": fake_url,
+        "AI_PROVIDER": "openai",
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{fake_url}/v1",
+        "AI_STREAMING": "true" if args.streaming else "false",
+        "DIALOGUE_DB_PATH": os.path.join(workdir, "bench.db"),
+        "MAIN_BOT_PROFILE_UPSERT_URL": "",
+        "WORKERS": str(workers),
+        "WORKER_BASE_PORT": str(args.port + 10),
+        "UPDATE_MAX_BACKLOG": str(args.users * args.messages * 2),
+    }
+    # один процесс — прежний запуск main:app без фронта
+    module = "main:app" if workers == 1 else "front:app"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    base = f"http://127.0.0.1:{args.port}"
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    try:
+        async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+            await _wait_http(client, f"{base}/health", 180)
+            await client.post(f"{fake_url}/reset")
+
+            sent: dict[str, float] = {}
+            semaphore = asyncio.Semaphore(args.concurrency)
+            retries = 0
+
+            async def user(n: int) -> None:
+                nonlocal retries
+                user_id = 10_000 + n
+                for i in range(args.messages):
+                    marker = f"msg-{n * args.messages + i}"
+                    update = _update(n * args.messages + i + 1, user_id, f"{marker} привет, расскажи о себе")
+                    while True:
+                        async with semaphore:
+                            sent.setdefault(marker, time.time())
+                            resp = await client.post(f"{base}/telegram/webhook", json=update)
+                        if resp.status_code == 200:
+                            break
+                        retries += 1
+                        await asyncio.sleep(0.5)
+
+            total = args.users * args.messages
+            started = time.time()
+            await asyncio.gather(*(user(n) for n in range(args.users)))
+            deadline = time.monotonic() + args.timeout
+            while True:
+                stats = (await client.get(f"{fake_url}/stats")).json()
+                if stats["replies"] >= total or time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(0.2)
+            replies: dict[str, float] = stats["reply_times"]
+            latencies = [(replies[m] - sent[m]) * 1000 for m in replies if m in sent]
+            elapsed = (max(replies.values()) if replies else time.time()) - started
+            return {
+                "workers": workers,
+                "mode": module,
+                "updates": total,
+                "replied": len(replies),
+                "retries": retries,
+                "seconds": elapsed,
+                "throughput": len(replies) / elapsed if elapsed > 0 else 0.0,
+                "p50": _pct(latencies, 0.5) if latencies else 0.0,
+                "p95": _pct(latencies, 0.95) if latencies else 0.0,
+                "p99": _pct(latencies, 0.99) if latencies else 0.0,
+                "llm_calls": stats["llm_calls"],
+            }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,4", help="через запятую; 1 — main:app без фронта")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=40, help="одновременных запросов вебхука (max_connections у Telegram)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--streaming", action="store_true", help="AI_STREAMING=true (ответ правками сообщения)")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--fake-port", type=int, default=8590)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    fakes = subprocess.Popen(
+        [sys.executable, str(ROOT / "benchmarks" / "fakes.py"), "--port", str(args.fake_port), "--llm-latency-ms", str(args.llm_latency_ms)],
+        cwd=ROOT,
+    )
+    try:
+        async with httpx.AsyncClient() as client:
+            await _wait_http(client, f"{fake_url}/stats", 30)
+        print(f"cpus: {os.cpu_count()}, users: {args.users} x {args.messages} messages, llm latency {args.llm_latency_ms:.0f} ms")
+        print(f"{'workers':>7} {'mode':<10} {'replied':>9} {'upd/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'retries':>7}")
+        for workers in [int(w) for w in args.workers.split(",")]:
+            r = await _run(args, workers, fake_url)
+            print(
+                f"{r['workers']:>7} {r['mode']:<10} {r['replied']:>4}/{r['updates']:<4} {r['throughput']:>8.1f} "
+                f"{r['p50']:>8.0f} {r['p95']:>8.0f} {r['p99']:>8.0f} {r['retries']:>7}"
+            )
+    finally:
+        fakes.terminate()
+        fakes.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,210 @@
+"""Заглушки внешних сервисов для бенчмарков: Telegram Bot API и OpenAI-совместимый LLM в одном приложении.
+
+    python benchmarks/fakes.py --port 8090 --llm-latency-ms 300
+
+Бот: TELEGRAM_API_BASE_URL=http://127.0.0.1:8090, LLM: OPENAI_BASE_URL=http://127.0.0.1:8090/v1.
+Ответ LLM начинается с последнего сообщения пользователя, поэтому по тексту sendMessage
+видно, на какое сообщение пришёл ответ (GET /stats → reply_times).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import re
+import time
+from collections import Counter
+from typing import Any, AsyncIterator
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MARKER_RE = re.compile(r"msg-\d+")
+
+
+class FakeStats:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.methods: Counter[str] = Counter()
+        self.llm_calls = 0
+        self.llm_streams = 0
+        self.llm_rejected = 0
+        # маркер сообщения пользователя → время первого ответа бота с ним
+        self.reply_times: dict[str, float] = {}
+        self.message_id = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "methods": dict(self.methods),
+            "llm_calls": self.llm_calls,
+            "llm_streams": self.llm_streams,
+            "llm_rejected": self.llm_rejected,
+            "replies": len(self.reply_times),
+            "reply_times": self.reply_times,
+        }
+
+
+async def _form(request: Request) -> dict[str, Any]:
+    # aiogram шлёт поля формой (urlencoded, без файлов), сложные значения — JSON-строками
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return json.loads(body or b"{}")
+    return {k: v[-1] for k, v in parse_qs(body.decode()).items()}
+
+
+def create_app(
+    *, llm_latency: float = 0.3, llm_words: int = 30, stream_chunk_delay: float = 0.02, llm_capacity: int = 0
+) -> FastAPI:
+    app = FastAPI()
+    stats = FakeStats()
+    app.state.stats = stats
+    # llm_capacity > 0: сверх стольких одновременных запросов LLM отвечает 429 с Retry-After, как OpenAI
+    llm_active = 0
+
+    @app.get("/stats")
+    async def get_stats() -> dict[str, Any]:
+        return stats.as_dict()
+
+    @app.post("/reset")
+    async def reset() -> dict[str, bool]:
+        stats.reset()
+        return {"ok": True}
+
+    @app.post("/bot{token}/{method}")
+    async def bot_api(token: str, method: str, request: Request) -> dict[str, Any]:
+        fields = await _form(request)
+        stats.methods[method] += 1
+        if method not in {"sendMessage", "editMessageText"}:
+            return {"ok": True, "result": True}
+        text = str(fields.get("text", ""))
+        marker = MARKER_RE.search(text)
+        if marker and marker.group() not in stats.reply_times:
+            stats.reply_times[marker.group()] = time.time()
+        if method == "sendMessage":
+            stats.message_id += 1
+        message_id = int(fields.get("message_id") or stats.message_id)
+        chat_id = int(fields.get("chat_id") or 0)
+        return {
+            "ok": True,
+            "result": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": text,
+            },
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Any:
+        nonlocal llm_active
+        body = await request.json()
+        if llm_capacity and llm_active >= llm_capacity:
+            stats.llm_rejected += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": str(int(llm_latency * 1000))},
+            )
+        llm_active += 1
+        return await _completion(body)
+
+    def _done() -> None:
+        nonlocal llm_active
+        llm_active -= 1
+
+    async def _completion(body: dict[str, Any]) -> Any:
+        # место занято до ответа, у потока — до первого куска
+        stats.llm_calls += 1
+        last = next((m["content"] for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+        words = [last[:40]] + ["слово"] * llm_words
+        created = int(time.time())
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(llm_latency)
+            finally:
+                _done()
+            text = " ".join(words)
+            return {
+                "id": "fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(words), "total_tokens": 100 + len(words)},
+            }
+
+        stats.llm_streams += 1
+
+        async def events() -> AsyncIterator[bytes]:
+            try:
+                await asyncio.sleep(llm_latency)
+            finally:
+                _done()
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": "fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+                if i:
+                    await asyncio.sleep(stream_chunk_delay)
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def stub_env(fake_url: str, db_path: str, *, llm_latency_ms: float, llm_sigma: float, streaming: bool) -> dict[str, str]:
+    # окружение для main:app в этом же процессе: Bot API — заглушка, LLM — AI_PROVIDER=stub
+    return {
+        "TELEGRAM_BOT_TOKEN": "123456:AAbenchmarkbenchmarkbenchmarkbenchmark",
+        "TELEGRAM_WEBHOOK_URL": "",
+        "TELEGRAM_WEBHOOK_SECRET": "",
+        "TELEGRAM_API_BASE_URL": fake_url,
+        "AI_PROVIDER": "stub",
+        "AI_STUB_LATENCY_MS": str(llm_latency_ms),
+        "AI_STUB_LATENCY_SIGMA": str(llm_sigma),
+        "AI_STREAMING": "true" if streaming else "false",
+        "DIALOGUE_DB_PATH": db_path,
+        "MAIN_BOT_PROFILE_UPSERT_URL": "",
+        "PAYMENT_PROVIDER": "mock",
+        "CAPTURE_ENABLED": "false",
+    }
+
+
+async def serve(app: FastAPI, port: int) -> tuple[Any, "asyncio.Task[None]"]:
+    # заглушка в текущем цикле событий; остановка — server.should_exit = True и await task
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            raise SystemExit(f"fake server did not start on port {port}")
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-words", type=int, default=30)
+    parser.add_argument("--llm-capacity", type=int, default=0, help="одновременных запросов LLM до 429 (0 — без предела)")
+    args = parser.parse_args()
+    app = create_app(llm_latency=args.llm_latency_ms / 1000, llm_words=args.llm_words, llm_capacity=args.llm_capacity)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Воспроизведение записанного трафика (CAPTURE_ENABLED, services/capture.py).
+
+    python benchmarks/replay.py data/capture/requests.jsonl --speed 1
+    python benchmarks/replay.py data/capture/requests.jsonl --speed 10 --out before.json
+    python benchmarks/replay.py data/capture/requests.jsonl --speed 0 --compare before.json
+    python benchmarks/replay.py data/capture/requests.jsonl --target http://127.0.0.1:8000 --auth-token ...
+
+По умолчанию — свежий экземпляр main:app в этом процессе (пустая база во временном каталоге,
+Bot API — заглушка из benchmarks/fakes.py, LLM — AI_PROVIDER=stub). Запросы идут по одному в порядке
+записи и с исходными интервалами, делёнными на --speed (0 — без пауз), поэтому прогон повторяем.
+Вместе с файлом читаются его ротированные части (.N … .1), от старых к новым.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Iterator
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import fakes  # noqa: E402
+from bench_load import _git_revision, _summary  # noqa: E402
+
+AUTH_PATHS = {"/webhook/sympathy", "/profiles/sync"}
+# текст сообщений в записи — псевдоним (CAPTURE_REDACT_KEYS); вместо него — шаблонная реплика
+PSEUDONYM_RE = re.compile(r"r_[0-9a-f]{12}")
+PLACEHOLDER_TEXT = "Расскажите, пожалуйста, подробнее о себе и своих ожиданиях."
+
+
+def _placeholder_text(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            k: PLACEHOLDER_TEXT if k == "text" and isinstance(v, str) and PSEUDONYM_RE.fullmatch(v) else _placeholder_text(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_placeholder_text(v) for v in value]
+    return value
+
+
+def _body(record: dict[str, Any]) -> bytes:
+    if record["path"] != "/telegram/webhook":
+        return record["body"].encode("utf-8")
+    try:
+        update = json.loads(record["body"])
+    except ValueError:
+        return record["body"].encode("utf-8")
+    return json.dumps(_placeholder_text(update), ensure_ascii=False).encode("utf-8")
+
+
+def _capture_files(path: str) -> list[pathlib.Path]:
+    # RotatingFileHandler: path — самый новый, path.1 … path.N — всё старше
+    base = pathlib.Path(path)
+    rotated = [p for p in base.parent.glob(base.name + ".*") if p.suffix[1:].isdigit()]
+    rotated.sort(key=lambda p: int(p.suffix[1:]), reverse=True)
+    return rotated + ([base] if base.exists() else [])
+
+
+def _records(paths: list[str], limit: int | None) -> Iterator[dict[str, Any]]:
+    count = 0
+    for path in paths:
+        for file in _capture_files(path):
+            with file.open(encoding="utf-8") as fh:
+                for line in fh:
+                    if not line.strip():
+                        continue
+                    yield json.loads(line)
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+
+
+async def _replay(client: Any, records: list[dict[str, Any]], args: argparse.Namespace) -> dict[str, Any]:
+    statuses: Counter[str] = Counter()
+    latencies: dict[str, list[float]] = defaultdict(list)
+    max_lag = 0.0
+    first = records[0]["t"] if records else 0.0
+    started = time.perf_counter()
+    for record in records:
+        if args.speed > 0:
+            due = started + (record["t"] - first) / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        headers = dict(record.get("headers") or {})
+        headers.setdefault("content-type", "application/json")
+        if record["path"] in AUTH_PATHS and args.auth_token:
+            headers["Authorization"] = f"Bearer {args.auth_token}"
+        if record["path"] == "/telegram/webhook" and args.webhook_secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = args.webhook_secret
+        sent = time.perf_counter()
+        resp = await client.post(record["path"], content=_body(record), headers=headers)
+        latencies[record["path"]].append((time.perf_counter() - sent) * 1000)
+        statuses[f"{record['path']} {resp.status_code}"] += 1
+    return {
+        "requests": len(records),
+        "send_seconds": round(time.perf_counter() - started, 2),
+        "recorded_seconds": round(records[-1]["t"] - first, 2) if records else 0.0,
+        "max_lag_ms": round(max_lag * 1000, 1),
+        "statuses": dict(sorted(statuses.items())),
+        "http_latency": {path: _summary(values) for path, values in sorted(latencies.items())},
+    }
+
+
+async def _run_local(records: list[dict[str, Any]], args: argparse.Namespace) -> dict[str, Any]:
+    os.environ.update(fakes.stub_env(
+        f"http://127.0.0.1:{args.fake_port}",
+        os.path.join(tempfile.mkdtemp(), "replay.db"),
+        llm_latency_ms=args.llm_latency_ms,
+        llm_sigma=args.llm_sigma,
+        streaming=args.streaming,
+    ))
+    os.environ["MAIN_BOT_AUTH_TOKEN"] = args.auth_token
+    os.environ["UPDATE_MAX_BACKLOG"] = str(max(1000, len(records)))
+    import httpx
+
+    import main
+    from services.metrics import DB_LOCK_WAIT_SECONDS, UPDATE_SECONDS
+
+    fake_server, fake_task = await fakes.serve(fakes.create_app(), args.fake_port)
+    try:
+        async with main.lifespan(main.app):
+            app = main.app
+            for histogram in (DB_LOCK_WAIT_SECONDS, UPDATE_SECONDS):
+                histogram.clear()
+            started = time.perf_counter()
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay") as client:
+                result = await _replay(client, records, args)
+            # апдейты обрабатываются в фоне — ждём, пока очередь опустеет
+            scheduler = app.state.update_scheduler
+            while scheduler.pending:
+                await asyncio.sleep(0.05)
+            result["total_seconds"] = round(time.perf_counter() - started, 2)
+            result["updates"] = {
+                **{k: scheduler.stats()[k] for k in ("processed", "failed", "rejected")},
+                "handle_p50_ms": round(UPDATE_SECONDS.quantile(0.5, "ok") * 1000, 1),
+                "handle_p95_ms": round(UPDATE_SECONDS.quantile(0.95, "ok") * 1000, 1),
+                "handle_p99_ms": round(UPDATE_SECONDS.quantile(0.99, "ok") * 1000, 1),
+            }
+            result["lock_waits"] = {
+                lock: {
+                    "acquisitions": DB_LOCK_WAIT_SECONDS.totals(lock)[0],
+                    "total_wait_s": round(DB_LOCK_WAIT_SECONDS.totals(lock)[1], 3),
+                    "p99_ms": round(DB_LOCK_WAIT_SECONDS.quantile(0.99, lock) * 1000, 3),
+                }
+                for lock in ("writer", "reader")
+            }
+            result["telegram_requests"] = sum(fake_server.config.app.state.stats.methods.values())
+            return result
+    finally:
+        fake_server.should_exit = True
+        await fake_task
+
+
+async def _run_remote(records: list[dict[str, Any]], args: argparse.Namespace) -> dict[str, Any]:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.target, timeout=60) as client:
+        return await _replay(client, records, args)
+
+
+def _print(result: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    def delta(new: float, old: float | None) -> str:
+        return f" ({(new - old) / old * 100:+.0f}%)" if old else ""
+
+    base = baseline or {}
+    print(
+        f"rev {result['revision']}: {result['requests']} requests ({result['recorded_seconds']}s recorded) "
+        f"sent in {result['send_seconds']}s at speed {result['speed']}, max lag {result['max_lag_ms']} ms"
+    )
+    if "total_seconds" in result:
+        print(f"all updates handled after {result['total_seconds']}s{delta(result['total_seconds'], base.get('total_seconds'))}")
+    for key, count in result["statuses"].items():
+        print(f"  {key}: {count}")
+    for path, row in result["http_latency"].items():
+        old = base.get("http_latency", {}).get(path, {})
+        print(f"  {path}: p50 {row['p50_ms']} ms{delta(row['p50_ms'], old.get('p50_ms'))}, p99 {row['p99_ms']} ms{delta(row['p99_ms'], old.get('p99_ms'))}")
+    if "updates" in result:
+        row, old = result["updates"], base.get("updates", {})
+        print(
+            f"update handling: p50 {row['handle_p50_ms']} ms{delta(row['handle_p50_ms'], old.get('handle_p50_ms'))}, "
+            f"p95 {row['handle_p95_ms']} ms, p99 {row['handle_p99_ms']} ms{delta(row['handle_p99_ms'], old.get('handle_p99_ms'))}, "
+            f"failed {row['failed']}, rejected {row['rejected']}"
+        )
+        for lock, row in result["lock_waits"].items():
+            print(f"sqlite {lock} lock: {row['acquisitions']} acquisitions, total wait {row['total_wait_s']}s, p99 {row['p99_ms']} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("capture", nargs="+", help="файлы записи (ротированные .N подхватываются сами)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 — как записано, N — в N раз быстрее, 0 — без пауз")
+    parser.add_argument("--limit", type=int, help="воспроизвести только первые N запросов")
+    parser.add_argument("--target", help="URL запущенного экземпляра вместо свежего в этом процессе")
+    parser.add_argument("--auth-token", default="replay", help="Bearer для /webhook/sympathy и /profiles/sync")
+    parser.add_argument("--webhook-secret", default="", help="секрет вебхука Telegram у --target")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-sigma", type=float, default=0.5)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--fake-port", type=int, default=8581)
+    parser.add_argument("--out", help="сохранить итог в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    # запись идёт после ответа, поэтому в файле порядок завершения — воспроизводим в порядке прихода
+    records = sorted(_records(args.capture, args.limit), key=lambda r: r["t"])
+    if not records:
+        raise SystemExit("capture is empty")
+    result = await (_run_remote(records, args) if args.target else _run_local(records, args))
+    result.update({"revision": _git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "speed": args.speed})
+    baseline = json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    _print(result, baseline)
+    if args.out:
+        pathlib.Path(args.out).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,23 +1,238 @@
 from __future__ import annotations
 
-from openai import AsyncOpenAI
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from services.ai_providers import ChatProvider, Messages
+from services.llm_guard import LLMUnavailable
+from services.metrics import LLM_HEDGES, LLM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_REPLY = "Извините, ИИ временно недоступен."
+
+T = TypeVar("T")
+
+# адаптивный порог хеджирования — p95 последних ответов основного провайдера
+_HEDGE_WINDOW = 200
+_HEDGE_MIN_SAMPLES = 20
+# фоновые вызовы (сводка истории) не хеджируются и не уходят в запасной провайдер:
+# пользователь их не ждёт, а долгие запросы раздували бы p95 ответов
+_BACKGROUND_CALLS = frozenset({"summary"})
 
 
 class AIClient:
-    def __init__(self, provider: str = "openai", openai_api_key: str | None = None) -> None:
-        self._provider = provider
-        self._openai = None
-        if provider == "openai":
-            self._openai = AsyncOpenAI(api_key=openai_api_key)
-
-    async def generate_reply(self, system_prompt: str, history: list[dict[str, str]]) -> str:
-        if self._provider == "openai" and self._openai:
-            messages = [{"role": "system", "content": system_prompt}] + history
-            resp = await self._openai.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=400,
-            )
-            return resp.choices[0].message.content or ""
-        return "Извините, ИИ временно недоступен."
+    def __init__(
+        self,
+        primary: ChatProvider,
+        backup: Optional[ChatProvider] = None,
+        *,
+        background: Optional[ChatProvider] = None,
+        hedge_after: float = 0.0,
+        deadline: float = 0.0,
+    ) -> None:
+        self._primary = primary
+        # запасной провайдер: хедж, если основной не ответил за порог, и замена, если основной упал
+        self._backup = backup
+        # основной провайдер для фоновых вызовов со своим пределом: не занимает места ответов пользователям
+        self._background = background
+        # порог хеджа, сек: 0 — p95 последних ответов основного (до набора выборки — без хеджа)
+        self._hedge_after = hedge_after
+        # предельное время всего запроса вместе с хеджем, сек (0 — без предела)
+        self._deadline = deadline
+        self._latencies: dict[str, deque[float]] = {
+            "reply": deque(maxlen=_HEDGE_WINDOW),
+            "stream_first_chunk": deque(maxlen=_HEDGE_WINDOW),
+            "summary": deque(maxlen=_HEDGE_WINDOW),
+        }
+
+    @property
+    def providers(self) -> list[ChatProvider]:
+        return [p for p in (self._primary, self._backup, self._background) if p is not None]
+
+    async def close(self) -> None:
+        # фоновый провайдер — обёртка над основным, закрывается вместе с ним
+        await self._primary.close()
+        if self._backup is not None:
+            await self._backup.close()
+
+    def state(self) -> dict[str, Any]:
+        roles = {"primary": self._primary, "backup": self._backup, "background": self._background}
+        return {
+            "providers": {role: p.state() for role, p in roles.items() if p is not None},
+            "hedge_budget_ms": {
+                call: round(budget * 1000, 1) if (budget := self.hedge_budget(call)) is not None else None
+                for call in self._latencies
+            },
+        }
+
+    def hedge_budget(self, call: str) -> Optional[float]:
+        if self._backup is None or call in _BACKGROUND_CALLS:
+            return None
+        if self._hedge_after > 0:
+            return self._hedge_after
+        samples = self._latencies[call]
+        if len(samples) < _HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    async def _race(
+        self,
+        call: str,
+        attempt: Callable[[ChatProvider], Awaitable[T]],
+        discard: Callable[[T], Awaitable[None]],
+    ) -> T:
+        # основной запрос; по истечении порога или при ошибке основного — запасной.
+        # Берётся первый успешный ответ, второй запрос отменяется
+        budget = self.hedge_budget(call)
+        first, fallback = self._primary, self._backup
+        if call in _BACKGROUND_CALLS:
+            first, fallback = self._background or self._primary, None
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(attempt(first))
+        backup: Optional[asyncio.Future[T]] = None
+        running: set[asyncio.Future[T]] = {primary}
+        error: Optional[BaseException] = None
+        try:
+            while running:
+                timeout = None
+                if backup is None and budget is not None:
+                    timeout = max(0.0, started + budget - time.perf_counter())
+                done, running = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    LLM_HEDGES.inc("hedge")
+                    backup = asyncio.ensure_future(attempt(self._backup))  # type: ignore[arg-type]
+                    running.add(backup)
+                    continue
+                if primary in done and primary.exception() is None:
+                    self._latencies[call].append(time.perf_counter() - started)
+                # при одновременном завершении предпочитаем основной
+                for task in sorted(done, key=lambda t: t is not primary):
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    for other in done:
+                        if other is not task and other.exception() is None:
+                            _abandon(other, discard)
+                    if task is backup:
+                        LLM_HEDGES.inc("backup_won")
+                    return task.result()
+                if primary in done and backup is None and fallback is not None:
+                    if not isinstance(error, LLMUnavailable):
+                        logger.warning("Primary AI provider failed (%r), trying backup", error)
+                    LLM_HEDGES.inc("fallback")
+                    backup = asyncio.ensure_future(attempt(fallback))
+                    running.add(backup)
+            assert error is not None
+            raise error
+        finally:
+            if primary in running and backup is not None:
+                # отменённый основной — нижняя оценка его задержки: без неё p95 сползал бы вниз
+                self._latencies[call].append(time.perf_counter() - started)
+            for task in running:
+                _abandon(task, discard)
+
+    async def generate_reply(self, system_prompt: str, history: list[dict[str, str]], *, call: str = "reply") -> str:
+        # call — вид вызова: свои окно задержек и метки метрик; "summary" — фоновый, без хеджа
+        messages = [{"role": "system", "content": system_prompt}] + history
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self._deadline or None):
+                reply = await self._race(call, lambda provider: provider.complete(messages), _noop)
+        except TimeoutError:
+            LLM_SECONDS.observe(time.perf_counter() - started, call, "deadline")
+            logger.warning("AI %s exceeded the %.1fs deadline", call, self._deadline)
+            return FALLBACK_REPLY
+        except LLMUnavailable:
+            # выключатель разомкнут или очередь полна — отвечаем сразу, не копя ожидающих
+            LLM_SECONDS.observe(time.perf_counter() - started, call, "rejected")
+            return FALLBACK_REPLY
+        except Exception:
+            LLM_SECONDS.observe(time.perf_counter() - started, call, "error")
+            raise
+        LLM_SECONDS.observe(time.perf_counter() - started, call, "ok")
+        return reply
+
+    async def stream_reply(self, system_prompt: str, history: list[dict[str, str]]) -> AsyncIterator[str]:
+        # те же параметры, что у generate_reply, но ответ приходит кусками по мере генерации.
+        # Хедж — по первому куску: именно его ждёт пользователь
+        messages = [{"role": "system", "content": system_prompt}] + history
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + self._deadline if self._deadline else None
+        try:
+            async with asyncio.timeout_at(deadline_at):
+                chunks, first = await self._race(
+                    "stream_first_chunk", lambda provider: _first_chunk(provider, messages), _close_stream
+                )
+        except TimeoutError:
+            LLM_SECONDS.observe(time.perf_counter() - started, "stream_first_chunk", "deadline")
+            logger.warning("AI stream did not start within the %.1fs deadline", self._deadline)
+            yield FALLBACK_REPLY
+            return
+        except LLMUnavailable:
+            LLM_SECONDS.observe(time.perf_counter() - started, "stream_first_chunk", "rejected")
+            yield FALLBACK_REPLY
+            return
+        except Exception:
+            LLM_SECONDS.observe(time.perf_counter() - started, "stream_first_chunk", "error")
+            raise
+        LLM_SECONDS.observe(time.perf_counter() - started, "stream_first_chunk", "ok")
+        try:
+            if first is None:
+                return
+            yield first
+            while True:
+                try:
+                    if deadline_at is None:
+                        chunk = await chunks.__anext__()
+                    else:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline_at - loop.time()))
+                except StopAsyncIteration:
+                    return
+                except TimeoutError:
+                    # начатый ответ не заменяем заглушкой — пользователь получает то, что успело прийти
+                    logger.warning("AI stream cut at the %.1fs deadline", self._deadline)
+                    return
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+
+async def _first_chunk(provider: ChatProvider, messages: Messages) -> tuple[Any, Optional[str]]:
+    chunks = provider.stream(messages)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return chunks, None
+    except BaseException:
+        await chunks.aclose()
+        raise
+    return chunks, first
+
+
+async def _close_stream(result: tuple[Any, Optional[str]]) -> None:
+    await result[0].aclose()
+
+
+async def _noop(_: Any) -> None:
+    pass
+
+
+def _abandon(task: asyncio.Future[T], discard: Callable[[T], Awaitable[None]]) -> None:
+    # проигравший запрос: отмена без ожидания; если он всё же успел ответить — освобождаем ресурсы
+    def done(task: asyncio.Future[T]) -> None:
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            asyncio.ensure_future(discard(task.result()))
+
+    if task.done():
+        done(task)
+        return
+    task.cancel()
+    task.add_done_callback(done)
@@ -51,22 +51,142 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str
     TELEGRAM_WEBHOOK_URL: str | None = None
     TELEGRAM_WEBHOOK_SECRET: str | None = None
+    # свой Bot API сервер (локальный telegram-bot-api, заглушка в бенчмарках); пусто — api.telegram.org
+    TELEGRAM_API_BASE_URL: str | None = None
 
     # App
     APP_BASE_URL: str | None = None
     APP_PORT: int = 8000
+    # обработка апдейтов вебхука: общий лимит параллельности, бэклог, время дренажа при остановке
+    UPDATE_CONCURRENCY: int = 32
+    UPDATE_MAX_BACKLOG: int = 1000
+    UPDATE_DRAIN_TIMEOUT: float = 25.0
+    # несколько процессов (uvicorn front:app): фронт раскладывает апдейты по WORKERS
+    # процессам main:app по chat.id; WORKER_ID фронт выставляет сам, у одиночного процесса пусто
+    WORKERS: int = 1
+    WORKER_ID: int | None = None
+    WORKER_BASE_PORT: int = 8100
+    WORKER_START_TIMEOUT: float = 120.0
+    # апдейтов в одной пересылке фронт → процесс
+    WORKER_FORWARD_BATCH: int = 100
+    # при WORKERS > 1: как часто процесс забирает из базы анкеты, изменённые другими процессами
+    PROFILE_CHANGE_POLL_SECONDS: float = 1.0
+    # общий пул исходящих HTTP-соединений (отправка анкет в основной бот)
+    HTTP_TIMEOUT_SECONDS: float = 10.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP2_ENABLED: bool = True
 
     # AI
+    # провайдер из реестра services/ai_providers.py: openai, openai_compatible (свой OPENAI_BASE_URL), stub
     AI_PROVIDER: str = "openai"
     OPENAI_API_KEY: str | None = None
+    OPENAI_BASE_URL: str | None = None
+    AI_MODEL: str = "gpt-4o-mini"
+    AI_TEMPERATURE: float = 0.7
+    AI_MAX_TOKENS: int = 400
+    # запасной провайдер/модель: хедж медленных запросов и замена при ошибке основного.
+    # Включается любым из PROVIDER/MODEL/BASE_URL; пустые поля берутся у основного
+    AI_BACKUP_PROVIDER: str = ""
+    AI_BACKUP_MODEL: str = ""
+    AI_BACKUP_BASE_URL: str = ""
+    AI_BACKUP_API_KEY: str = ""
+    # запасной запрос уходит, если основной молчит дольше порога (0 — p95 последних ответов основного)
+    AI_HEDGE_AFTER_MS: float = 0.0
+    # предел на весь запрос к LLM, сек: по истечении — FALLBACK_REPLY (0 — без предела)
+    AI_DEADLINE_SECONDS: float = 30.0
+    # предел одновременных запросов к каждому провайдеру (AIMD): растёт на 1 за «окно» под нагрузкой,
+    # падает вдвое при 429/5xx или ответе дольше цели; сверх AI_QUEUE_MAX ждущих — сразу FALLBACK_REPLY
+    AI_CONCURRENCY_INITIAL: int = 32
+    AI_CONCURRENCY_MIN: int = 4
+    AI_CONCURRENCY_MAX: int = 64
+    AI_LATENCY_TARGET_MS: float = 10000.0
+    AI_QUEUE_MAX: int = 200
+    # фоновые вызовы (сводки истории): свой постоянный предел и очередь, не занимают места ответов
+    AI_BACKGROUND_CONCURRENCY: int = 2
+    AI_BACKGROUND_QUEUE_MAX: int = 20
+    # выключатель: после N ошибок подряд запросы не отправляются COOLDOWN сек (или Retry-After, если дольше)
+    AI_BREAKER_FAILURES: int = 5
+    AI_BREAKER_COOLDOWN_SECONDS: float = 30.0
+    # повторы 429/5xx/обрывов: пауза из Retry-After, без него — экспоненциальная; дольше MAX_WAIT не ждём
+    AI_RETRIES: int = 2
+    AI_RETRY_MAX_WAIT_SECONDS: float = 20.0
+    # AI_PROVIDER=stub: детерминированный ответ без сети с задержкой (медиана, разброс логнормального)
+    AI_STUB_LATENCY_MS: float = 0.0
+    AI_STUB_LATENCY_SIGMA: float = 0.0
+    # потоковая выдача ответа в Telegram (правки сообщения не чаще интервала, сек)
+    AI_STREAMING: bool = True
+    AI_STREAM_EDIT_INTERVAL: float = 1.0
+    # окно истории по бюджету токенов; выпавшие сообщения сжимаются в сводку в фоне
+    HISTORY_TOKEN_BUDGET: int = 1500
+    HISTORY_FETCH_LIMIT: int = 40
+    HISTORY_SUMMARY_MIN_MESSAGES: int = 8
 
     # Storage
     DIALOGUE_DB_PATH: str = "./data/dialogues.db"
+    DB_READ_POOL_SIZE: int = 4
+    # групповая запись сообщений диалога (write-behind): меньше fsync, но при аварийном
+    # завершении теряются строки последнего интервала — включается явно
+    DIALOGUE_WRITE_BEHIND: bool = False
+    DIALOGUE_FLUSH_INTERVAL_MS: int = 50
+    DIALOGUE_FLUSH_MAX_ROWS: int = 256
+    # архивация переписки: сообщения старше N дней (кроме последних KEEP_RECENT у пользователя
+    # и ещё не вошедших в сводку) сжимаются в message_archives, место возвращается в файл.
+    # Удаляет строки messages — включается явно
+    DIALOGUE_ARCHIVE_ENABLED: bool = False
+    DIALOGUE_ARCHIVE_AFTER_DAYS: float = 30.0
+    DIALOGUE_ARCHIVE_KEEP_RECENT: int = 40
+    DIALOGUE_ARCHIVE_INTERVAL_SECONDS: float = 3600.0
+    DIALOGUE_ARCHIVE_BATCH_ROWS: int = 500
+    # zlib | lzma (плотнее, но медленнее)
+    DIALOGUE_ARCHIVE_CODEC: str = "zlib"
+    # кэш профилей в памяти процесса (0 — выключен)
+    PROFILE_CACHE_SIZE: int = 10000
+    PROFILE_CACHE_TTL_SECONDS: float = 300.0
+    # подбор анкет (/suggest, /profiles/{user_id}/suggestions): матрица признаков в памяти
+    RECOMMENDER_ENABLED: bool = True
+    # похожие анкеты по тексту «о себе»/интересов (/similar, /profiles/{user_id}/similar)
+    SIMILARITY_ENABLED: bool = True
+    SIMILARITY_DIMENSIONS: int = 256
+    # файл для матрицы векторов (memory-mapped); пусто — матрица в памяти процесса
+    SIMILARITY_INDEX_PATH: str | None = None
+    # состояния анкеты (aiogram FSM) в базе: переживают перезапуск; false — MemoryStorage
+    FSM_PERSISTENT: bool = True
+    # брошенная анкета удаляется через столько секунд после последнего ответа
+    FSM_TTL_SECONDS: float = 172800.0
+    FSM_FLUSH_INTERVAL_MS: int = 50
+    FSM_CACHE_SIZE: int = 10000
+    # копия user_latest_match в памяти (выключать, если в базу пишут другие процессы)
+    MATCH_MIRROR_ENABLED: bool = True
+    # сколько пользователей держать в копии (LRU); остальные читаются из базы
+    MATCH_MIRROR_SIZE: int = 100000
+
+    # запись входящих запросов (вебхуки, /profiles/sync) в JSONL для benchmarks/replay.py;
+    # строковые значения ключей CAPTURE_REDACT_KEYS заменяются псевдонимами (HMAC с солью);
+    # text — текст сообщений (команды бота остаются), при воспроизведении подставляется шаблонный
+    CAPTURE_ENABLED: bool = False
+    CAPTURE_PATH: str = "./data/capture/requests.jsonl"
+    CAPTURE_MAX_MB: int = 100
+    CAPTURE_BACKUPS: int = 5
+    CAPTURE_REDACT_KEYS: str = "first_name,last_name,username,phone_number,male_username,female_username,text"
+    # секрет; пустая — случайная соль на каждый запуск записи (псевдонимы между запусками не совпадают)
+    CAPTURE_REDACT_SALT: str = ""
+
+    # Prometheus-метрики на GET /metrics (гистограммы хранилищ, LLM, Bot API, вебхука)
+    METRICS_ENABLED: bool = True
 
     # Auth от основного бота
     MAIN_BOT_AUTH_TOKEN: str | None = None
     # URL вебхука основного бота для апсерта профиля (когда анкета создаётся в ИИ-боте)
     MAIN_BOT_PROFILE_UPSERT_URL: str | None = None
+    # массовая синхронизация анкет (/profiles/sync/batch): записей в одной транзакции
+    PROFILE_SYNC_BATCH_SIZE: int = 500
+    # outbox отправки анкет в основной бот: размер пачки, параллельность, повторы
+    PROFILE_OUTBOX_BATCH_SIZE: int = 50
+    PROFILE_OUTBOX_CONCURRENCY: int = 8
+    PROFILE_OUTBOX_MAX_BACKOFF_SECONDS: float = 300.0
+    PROFILE_OUTBOX_MAX_ATTEMPTS: int = 20
 
 
 class WebhookConfig(BaseModel):
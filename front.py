@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from config import WEBHOOK, get_settings
+from services.capture import CaptureMiddleware, create_capture
+from services.metrics import merge_expositions
+from services.telegram_api import create_bot
+from storage.database import Database
+
+# Режим нескольких процессов: uvicorn front:app при WORKERS > 1.
+# Фронт запускает WORKERS процессов main:app на 127.0.0.1:WORKER_BASE_PORT+i, раскладывает
+# апдейты вебхука по chat.id (апдейты одного чата всегда идут в один процесс и по порядку)
+# и один раз регистрирует вебхук. Остальные HTTP-запросы проксируются по кругу, кроме тех,
+# чей ответ зависит от процесса: они идут во все процессы (_FAN_OUT) или в фиксированный (_PINNED).
+
+logger = logging.getLogger(__name__)
+
+# заголовки, которые прокси не передаёт дальше
+_HOP_HEADERS = {"host", "connection", "keep-alive", "transfer-encoding", "te", "upgrade", "content-length"}
+# состояние в памяти процесса: ответ — по каждому процессу (и сумма, если ответы — числа)
+_FAN_OUT = frozenset({"admin/telegram/queue", "profiles/cache/stats", "admin/llm", "admin/prompts/reload"})
+# фоновые задачи, которые выполняет только процесс 0 (компактор переписки, отправка outbox)
+_PINNED = {"admin/dialogues/compact": 0, "profiles/outbox/stats": 0}
+
+
+def update_shard(data: dict[str, Any], shards: int) -> int:
+    # тот же ключ, что у UpdateScheduler (update_chat_key): чат, иначе пользователь, иначе сам апдейт
+    for name, event in data.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"]) % shards
+        user = event.get("from")
+        if isinstance(user, dict) and "id" in user:
+            return int(user["id"]) % shards
+        break
+    return int(data.get("update_id") or 0) % shards
+
+
+class WorkerShard:
+    """Процесс-обработчик и очередь апдейтов его чатов: пересылка пачками, одна пачка в полёте."""
+
+    def __init__(self, index: int, port: int, http: httpx.AsyncClient, *, max_batch: int, headers: dict[str, str]) -> None:
+        self.index = index
+        self.url = f"http://127.0.0.1:{port}"
+        self._port = port
+        self._http = http
+        self._max_batch = max(1, max_batch)
+        self._headers = {**headers, "Content-Type": "application/json"}
+        self._queue: deque[tuple[bytes, asyncio.Future[bool]]] = deque()
+        self._wakeup = asyncio.Event()
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.forwarded = 0
+        self.rejected = 0
+
+    def submit(self, body: bytes) -> asyncio.Future[bool]:
+        future: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        self._queue.append((body, future))
+        self._wakeup.set()
+        return future
+
+    async def run_forwarder(self) -> None:
+        # пока пачка в полёте, новые апдейты копятся и уходят следующей пачкой — порядок сохраняется
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self._max_batch))]
+                accepted = 0
+                try:
+                    resp = await self._http.post(
+                        f"{self.url}/telegram/updates",
+                        content=b"[" + b",".join(body for body, _ in batch) + b"]",
+                        headers=self._headers,
+                    )
+                    if resp.status_code == 200:
+                        accepted = int(resp.json()["accepted"])
+                    else:
+                        logger.warning("worker %d rejected updates: HTTP %d", self.index, resp.status_code)
+                except httpx.HTTPError as exc:
+                    logger.warning("worker %d unreachable: %s", self.index, exc)
+                self.forwarded += accepted
+                self.rejected += len(batch) - accepted
+                for i, (_, future) in enumerate(batch):
+                    if not future.done():
+                        future.set_result(i < accepted)
+
+    def fail_pending(self) -> None:
+        while self._queue:
+            _, future = self._queue.popleft()
+            if not future.done():
+                future.set_result(False)
+
+    async def start(self, env: dict[str, str]) -> None:
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(self._port), "--no-access-log",
+            env={**env, "WORKER_ID": str(self.index)},
+        )
+
+    async def wait_ready(self, timeout: float) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            if self.process is not None and self.process.returncode is not None:
+                raise RuntimeError(f"worker {self.index} exited with code {self.process.returncode}")
+            try:
+                if (await self._http.get(f"{self.url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if loop.time() > deadline:
+                raise RuntimeError(f"worker {self.index} did not start in {timeout:.0f}s")
+            await asyncio.sleep(0.2)
+
+    async def supervise(self, env: dict[str, str], start_timeout: float) -> None:
+        # упавший процесс перезапускается; апдейты его чатов до готовности отклоняются (503)
+        while True:
+            assert self.process is not None
+            code = await self.process.wait()
+            logger.error("worker %d exited with code %s, restarting", self.index, code)
+            self.fail_pending()
+            await asyncio.sleep(1.0)
+            await self.start(env)
+            try:
+                await self.wait_ready(start_timeout)
+            except RuntimeError:
+                logger.exception("worker %d restart failed", self.index)
+
+    async def stop(self, timeout: float) -> None:
+        # SIGTERM: uvicorn завершает lifespan, процесс дорабатывает принятые апдейты
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    settings = get_settings()
+    workers = max(1, settings.WORKERS)
+
+    # миграции — один раз здесь, до запуска процессов
+    db = Database(settings.DIALOGUE_DB_PATH, readers=0)
+    await db.init()
+    await db.close()
+
+    http = httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, read=None),
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=workers * 8),
+    )
+    headers = {WEBHOOK.header_secret: settings.TELEGRAM_WEBHOOK_SECRET} if settings.TELEGRAM_WEBHOOK_SECRET else {}
+    shards = [
+        WorkerShard(i, settings.WORKER_BASE_PORT + i, http, max_batch=settings.WORKER_FORWARD_BATCH, headers=headers)
+        for i in range(workers)
+    ]
+    env = {**os.environ, "WORKERS": str(workers)}
+    tasks: list[asyncio.Task[None]] = []
+    bot = create_bot(settings.TELEGRAM_BOT_TOKEN, api_base_url=settings.TELEGRAM_API_BASE_URL)
+    capture = create_capture(settings) if settings.CAPTURE_ENABLED else None
+    app.state.capture = capture
+    try:
+        if capture is not None:
+            capture.start()
+        for shard in shards:
+            await shard.start(env)
+        await asyncio.gather(*(shard.wait_ready(settings.WORKER_START_TIMEOUT) for shard in shards))
+        for shard in shards:
+            tasks.append(asyncio.create_task(shard.run_forwarder(), name=f"front-forward-{shard.index}"))
+            tasks.append(asyncio.create_task(
+                shard.supervise(env, settings.WORKER_START_TIMEOUT), name=f"front-supervise-{shard.index}"
+            ))
+        logger.info("front: %d workers ready", workers)
+
+        app.state.shards = shards
+        app.state.round_robin = itertools.cycle(shards)
+        app.state.http = http
+
+        if settings.TELEGRAM_WEBHOOK_URL:
+            await bot.set_webhook(
+                url=settings.TELEGRAM_WEBHOOK_URL + WEBHOOK.path,
+                secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+                drop_pending_updates=True,
+            )
+        yield
+    finally:
+        if settings.TELEGRAM_WEBHOOK_URL:
+            await bot.delete_webhook(drop_pending_updates=False)
+        await bot.session.close()
+        for task in tasks:
+            if task.get_name().startswith("front-supervise"):
+                task.cancel()
+        await asyncio.gather(*(shard.stop(settings.UPDATE_DRAIN_TIMEOUT + 5) for shard in shards))
+        for task in tasks:
+            task.cancel()
+        for shard in shards:
+            shard.fail_pending()
+        await http.aclose()
+        if capture is not None:
+            capture.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CaptureMiddleware)
+
+
+@app.get("/health")
+async def health(request: Request) -> dict[str, Any]:
+    shards: list[WorkerShard] = request.app.state.shards
+    alive = sum(1 for s in shards if s.process is not None and s.process.returncode is None)
+    return {"status": "ok" if alive == len(shards) else "degraded", "workers": len(shards), "alive": alive}
+
+
+@app.get("/front/stats")
+async def front_stats(request: Request) -> list[dict[str, int]]:
+    shards: list[WorkerShard] = request.app.state.shards
+    return [{"worker": s.index, "forwarded": s.forwarded, "rejected": s.rejected} for s in shards]
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request) -> PlainTextResponse:
+    # метрики всех процессов одним ответом: ряды различает метка worker
+    shards: list[WorkerShard] = request.app.state.shards
+    http: httpx.AsyncClient = request.app.state.http
+
+    async def scrape(shard: WorkerShard) -> str:
+        try:
+            resp = await http.get(f"{shard.url}/metrics")
+        except httpx.HTTPError:
+            return ""
+        return resp.text if resp.status_code == 200 else ""
+
+    texts = await asyncio.gather(*(scrape(shard) for shard in shards))
+    return PlainTextResponse(merge_expositions(texts), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post(WEBHOOK.path)
+async def telegram_webhook(request: Request) -> Response:
+    settings = get_settings()
+    secret = request.headers.get(WEBHOOK.header_secret)
+    if settings.TELEGRAM_WEBHOOK_SECRET and secret != settings.TELEGRAM_WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="invalid secret")
+
+    body = await request.body()
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid json")
+    shards: list[WorkerShard] = request.app.state.shards
+    # 200 — апдейт принят процессом; иначе Telegram доставит его повторно
+    if not await shards[update_shard(data, len(shards))].submit(body):
+        return Response(status_code=503, headers={"Retry-After": "1"})
+    return Response(status_code=200)
+
+
+def _forward_headers(request: Request) -> list[tuple[bytes, bytes]]:
+    return [(k, v) for k, v in request.headers.raw if k.decode("latin-1").lower() not in _HOP_HEADERS]
+
+
+def _is_counters(body: Any) -> bool:
+    return isinstance(body, dict) and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in body.values())
+
+
+async def _fan_out(request: Request, path: str) -> Response:
+    shards: list[WorkerShard] = request.app.state.shards
+    http: httpx.AsyncClient = request.app.state.http
+    body = await request.body()
+
+    async def ask(shard: WorkerShard) -> dict[str, Any]:
+        try:
+            resp = await http.request(
+                request.method,
+                httpx.URL(f"{shard.url}/{path}", query=request.url.query.encode()),
+                headers=_forward_headers(request),
+                content=body,
+            )
+        except httpx.HTTPError as exc:
+            return {"worker": shard.index, "status": 502, "error": str(exc)}
+        try:
+            payload = resp.json()
+        except ValueError:
+            payload = resp.text
+        return {"worker": shard.index, "status": resp.status_code, "body": payload}
+
+    answers = await asyncio.gather(*(ask(shard) for shard in shards))
+    result: dict[str, Any] = {"workers": answers}
+    if all(a["status"] == 200 and _is_counters(a.get("body")) for a in answers):
+        result["total"] = {k: sum(a["body"].get(k, 0) for a in answers) for k in answers[0]["body"]}
+    # ошибку авторизации и т. п. отдаём как есть: у всех процессов она одна
+    status = answers[0]["status"] if len({a["status"] for a in answers}) == 1 else 207
+    return Response(json.dumps(result, ensure_ascii=False), status_code=status, media_type="application/json")
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def proxy(request: Request, path: str) -> Response:
+    # API для основного бота и админки: любой процесс, тела запроса и ответа идут потоком
+    if path in _FAN_OUT:
+        return await _fan_out(request, path)
+    shards: list[WorkerShard] = request.app.state.shards
+    shard: WorkerShard = shards[_PINNED[path]] if path in _PINNED else next(request.app.state.round_robin)
+    http: httpx.AsyncClient = request.app.state.http
+    upstream = http.build_request(
+        request.method,
+        httpx.URL(f"{shard.url}/{path}", query=request.url.query.encode()),
+        headers=_forward_headers(request),
+        content=request.stream(),
+    )
+    try:
+        resp = await http.send(upstream, stream=True)
+    except httpx.HTTPError as exc:
+        raise HTTPException(status_code=502, detail=f"worker {shard.index} unavailable: {exc}")
+    return StreamingResponse(
+        resp.aiter_raw(),
+        status_code=resp.status_code,
+        headers={k: v for k, v in resp.headers.items() if k.lower() not in _HOP_HEADERS},
+        background=BackgroundTask(resp.aclose),
+    )
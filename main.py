@@ -1,68 +1,296 @@
 from __future__ import annotations
 
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from typing import AsyncIterator, Callable, Optional
 
-from fastapi import FastAPI
+import httpx
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import get_settings, WEBHOOK
+from storage.database import Database
+from storage.dialogue_archive import DialogueArchiver
 from storage.dialogue_store import DialogueStore
+from storage.fsm_storage import SQLiteStorage
 from storage.match_store import MatchStore
 from storage.profile_store import ProfileStore
 from client import AIClient
 from services.business_rules import BusinessRules
+from services.history import HistorySummarizer
+from services.update_scheduler import UpdateScheduler
+from services.ai_providers import create_providers
+from services.capture import CaptureMiddleware, TrafficCapture, create_capture
+from services.http_client import create_http_client
+from services.llm_guard import GuardedProvider, guard_background, guard_provider
+from services.metrics import REGISTRY, instrument_methods
+from services.payment_provider import load_provider
+from services.payments import PaymentsService
+from services.profile_outbox import ProfileOutbox
+from services.recommender import Recommender
+from services.telegram_api import create_bot
+from services.similarity import SimilarityIndex
 import routers.telegram_webhook as telegram_webhook
 from routers.sympathy import sympathy_router
 from routers.test_ai import test_ai_router
 from routers.payments import payments_router
 from routers.profiles import profiles_router
+from routers.admin import admin_router
 
 
 class AppState:
     bot: Bot
     dp: Dispatcher
+    fsm_storage: BaseStorage
+    db: Database
     dialogue_store: DialogueStore
+    dialogue_archiver: Optional[DialogueArchiver]
     match_store: MatchStore
     profile_store: ProfileStore
     ai_client: AIClient
     rules: BusinessRules
+    update_scheduler: UpdateScheduler
+    http_client: httpx.AsyncClient
+    payments: PaymentsService
+    profile_outbox: Optional[ProfileOutbox]
+    recommender: Optional[Recommender]
+    similarity: Optional[SimilarityIndex]
+    capture: Optional[TrafficCapture]
+
+
+def _register_metrics(
+    worker_id: Optional[int],
+    scheduler: UpdateScheduler,
+    dialogue_store: DialogueStore,
+    match_store: MatchStore,
+    profile_store: ProfileStore,
+    fsm_storage: BaseStorage,
+    ai_client: AIClient,
+) -> None:
+    # время каждого вызова хранилищ; остальное — колбэками, читаются только при запросе /metrics
+    instrument_methods(dialogue_store, "dialogue")
+    instrument_methods(match_store, "match")
+    instrument_methods(profile_store, "profile")
+    if worker_id is not None:
+        REGISTRY.const_labels = {"worker": str(worker_id)}
+
+    REGISTRY.gauge("bot_updates_in_flight", "Updates being handled right now.", callback=lambda: scheduler.in_flight)
+    REGISTRY.gauge("bot_updates_pending", "Accepted updates not handled yet.", callback=lambda: scheduler.pending)
+    REGISTRY.counter(
+        "bot_updates_total", "Updates by result.", ("result",),
+        callback=lambda: {("processed",): scheduler.processed, ("failed",): scheduler.failed, ("rejected",): scheduler.rejected},
+    )
+    REGISTRY.gauge("bot_dialogue_pending_rows", "Dialogue messages waiting for the write-behind flush.", callback=lambda: dialogue_store.pending_count)
+    cache = profile_store.cache
+    caches: dict[tuple[str, ...], Callable[[], int]] = {
+        ("profiles",): lambda: len(cache),
+        ("matches",): lambda: match_store.cached_count,
+    }
+    if isinstance(fsm_storage, SQLiteStorage):
+        storage = fsm_storage
+        caches[("fsm",)] = lambda: storage.cached_count
+        REGISTRY.gauge(
+            "bot_fsm_sessions", "FSM sessions in memory and waiting for the flush.", ("state",),
+            callback=lambda: {("cached",): storage.cached_count, ("pending",): storage.pending_count},
+        )
+    REGISTRY.gauge("bot_cache_entries", "Entries in in-process caches.", ("cache",), callback=lambda: {k: f() for k, f in caches.items()})
+    REGISTRY.counter(
+        "bot_profile_cache_requests_total", "Profile cache lookups.", ("result",),
+        callback=lambda: {("hit",): cache.hits, ("miss",): cache.misses},
+    )
+
+    guards = [p for p in ai_client.providers if isinstance(p, GuardedProvider)]
+    REGISTRY.gauge(
+        "bot_llm_concurrency_limit", "Adaptive limit of concurrent LLM requests.", ("role",),
+        callback=lambda: {(g.role,): g.limiter.limit for g in guards},
+    )
+    REGISTRY.gauge(
+        "bot_llm_requests_in_flight", "LLM requests holding a limiter slot.", ("role",),
+        callback=lambda: {(g.role,): g.limiter.in_flight for g in guards},
+    )
+    REGISTRY.gauge(
+        "bot_llm_requests_queued", "LLM requests waiting for a limiter slot.", ("role",),
+        callback=lambda: {(g.role,): g.limiter.queued for g in guards},
+    )
+    REGISTRY.gauge(
+        "bot_llm_circuit_open", "LLM circuit breaker: 0 closed, 0.5 half-open, 1 open.", ("role",),
+        callback=lambda: {(g.role,): {"closed": 0.0, "half_open": 0.5, "open": 1.0}[g.breaker.state] for g in guards},
+    )
+    REGISTRY.counter(
+        "bot_llm_retries_total", "LLM requests retried after 429/5xx or a connection error.", ("role",),
+        callback=lambda: {(g.role,): g.retries for g in guards},
+    )
+    REGISTRY.counter(
+        "bot_llm_rejected_total", "LLM requests answered with the fallback without calling the provider.", ("role", "reason"),
+        callback=lambda: {(g.role, reason): n for g in guards for reason, n in g.rejected.items()},
+    )
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     settings = get_settings()
+    # за фронтом (front.py) вебхук регистрирует фронт; при нескольких процессах в базу пишут
+    # и соседи — копии в памяти, которые они не видят, выключаются или опрашивают базу
+    behind_front = settings.WORKER_ID is not None
+    shared_db = settings.WORKERS > 1
 
-    dialogue_store = DialogueStore(settings.DIALOGUE_DB_PATH)
+    # одна база на все хранилища: WAL, один писатель + пул читателей
+    db = Database(settings.DIALOGUE_DB_PATH, readers=settings.DB_READ_POOL_SIZE)
+    await db.init()
+
+    dialogue_store = DialogueStore(
+        db,
+        write_behind=settings.DIALOGUE_WRITE_BEHIND,
+        flush_interval_ms=settings.DIALOGUE_FLUSH_INTERVAL_MS,
+        flush_max_rows=settings.DIALOGUE_FLUSH_MAX_ROWS,
+    )
     await dialogue_store.init()
 
-    match_store = MatchStore(settings.DIALOGUE_DB_PATH)
+    # старая переписка → сжатые архивы; по расписанию работает один процесс, вручную — /admin/dialogues/compact
+    archiver: Optional[DialogueArchiver] = None
+    if settings.DIALOGUE_ARCHIVE_ENABLED:
+        archiver = DialogueArchiver(
+            db,
+            archive_after_days=settings.DIALOGUE_ARCHIVE_AFTER_DAYS,
+            keep_recent=max(settings.DIALOGUE_ARCHIVE_KEEP_RECENT, settings.HISTORY_FETCH_LIMIT),
+            batch_rows=settings.DIALOGUE_ARCHIVE_BATCH_ROWS,
+            codec=settings.DIALOGUE_ARCHIVE_CODEC,
+            interval=settings.DIALOGUE_ARCHIVE_INTERVAL_SECONDS,
+        )
+        if settings.WORKER_ID in (None, 0):
+            await archiver.init()
+
+    match_store = MatchStore(db, mirror=settings.MATCH_MIRROR_ENABLED and not shared_db, mirror_size=settings.MATCH_MIRROR_SIZE)
     await match_store.init()
 
-    profile_store = ProfileStore(settings.DIALOGUE_DB_PATH)
+    # общий HTTP-клиент: переиспользует соединения для исходящих запросов
+    http_client = create_http_client(
+        timeout=settings.HTTP_TIMEOUT_SECONDS,
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        http2=settings.HTTP2_ENABLED,
+    )
+
+    # анкеты для основного бота: outbox в той же базе, отправка в фоне с повторами
+    outbox: Optional[ProfileOutbox] = None
+    if settings.MAIN_BOT_PROFILE_UPSERT_URL and settings.MAIN_BOT_AUTH_TOKEN:
+        outbox = ProfileOutbox(
+            db,
+            http_client,
+            url=settings.MAIN_BOT_PROFILE_UPSERT_URL,
+            auth_token=settings.MAIN_BOT_AUTH_TOKEN,
+            batch_size=settings.PROFILE_OUTBOX_BATCH_SIZE,
+            concurrency=settings.PROFILE_OUTBOX_CONCURRENCY,
+            max_backoff=settings.PROFILE_OUTBOX_MAX_BACKOFF_SECONDS,
+            max_attempts=settings.PROFILE_OUTBOX_MAX_ATTEMPTS,
+        )
+        # отправляет один процесс, остальные только пишут в outbox
+        if settings.WORKER_ID in (None, 0):
+            await outbox.init()
+
+    profile_store = ProfileStore(
+        db,
+        cache_size=settings.PROFILE_CACHE_SIZE,
+        cache_ttl=settings.PROFILE_CACHE_TTL_SECONDS,
+        outbox=outbox,
+        change_poll_interval=settings.PROFILE_CHANGE_POLL_SECONDS if shared_db else 0.0,
+    )
     await profile_store.init()
 
-    ai_client = AIClient(provider=settings.AI_PROVIDER, openai_api_key=settings.OPENAI_API_KEY)
+    # матрица признаков анкет для /suggest: строится один раз, дальше обновляется при записи
+    recommender: Optional[Recommender] = None
+    if settings.RECOMMENDER_ENABLED:
+        recommender = Recommender()
+        await recommender.load(profile_store)
+        profile_store.add_listener(recommender.update)
+
+    # векторы текста анкет для /similar: так же строятся при запуске и обновляются при записи
+    similarity: Optional[SimilarityIndex] = None
+    if settings.SIMILARITY_ENABLED:
+        index_path = settings.SIMILARITY_INDEX_PATH or None
+        if index_path and behind_front:
+            index_path = f"{index_path}.{settings.WORKER_ID}"
+        similarity = SimilarityIndex(dimensions=settings.SIMILARITY_DIMENSIONS, path=index_path)
+        await similarity.load(profile_store)
+        profile_store.add_listener(similarity.update)
+
+    payments = PaymentsService(match_store, load_provider())
+
+    primary_ai, backup_ai = create_providers(settings)
+    primary_guard = guard_provider(primary_ai, "primary", settings)
+    ai_client = AIClient(
+        primary_guard,
+        guard_provider(backup_ai, "backup", settings) if backup_ai is not None else None,
+        background=guard_background(primary_guard, settings),
+        hedge_after=settings.AI_HEDGE_AFTER_MS / 1000,
+        deadline=settings.AI_DEADLINE_SECONDS,
+    )
     rules = BusinessRules()
+    summarizer = HistorySummarizer(
+        dialogue_store,
+        ai_client,
+        min_messages=settings.HISTORY_SUMMARY_MIN_MESSAGES,
+    )
+
+    bot = create_bot(settings.TELEGRAM_BOT_TOKEN, api_base_url=settings.TELEGRAM_API_BASE_URL)
+    # состояние анкеты в общей базе: незаконченная анкета продолжается после деплоя
+    fsm_storage: BaseStorage
+    if settings.FSM_PERSISTENT:
+        fsm_storage = SQLiteStorage(
+            db,
+            ttl=settings.FSM_TTL_SECONDS,
+            flush_interval_ms=settings.FSM_FLUSH_INTERVAL_MS,
+            cache_size=settings.FSM_CACHE_SIZE,
+        )
+        await fsm_storage.init()
+    else:
+        fsm_storage = MemoryStorage()
+    dp = Dispatcher(storage=fsm_storage)
+
+    update_scheduler = UpdateScheduler(
+        lambda update: dp.feed_update(bot=bot, update=update),
+        concurrency=settings.UPDATE_CONCURRENCY,
+        max_backlog=settings.UPDATE_MAX_BACKLOG,
+    )
 
-    bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    if settings.METRICS_ENABLED:
+        _register_metrics(settings.WORKER_ID, update_scheduler, dialogue_store, match_store, profile_store, fsm_storage, ai_client)
 
     # aiogram-обработчики (чат-логика)
     from routers.telegram import create_router
-    dp.include_router(create_router(dialogue_store, match_store, profile_store, ai_client, rules))
+    dp.include_router(create_router(
+        dialogue_store, match_store, profile_store, ai_client, rules, summarizer, payments, recommender, similarity
+    ))
 
     app.state.bot = bot
+    app.state.update_scheduler = update_scheduler
     app.state.dp = dp
+    app.state.fsm_storage = fsm_storage
+    app.state.db = db
     app.state.dialogue_store = dialogue_store
+    app.state.dialogue_archiver = archiver
     app.state.ai_client = ai_client
     app.state.rules = rules
     app.state.match_store = match_store
     app.state.profile_store = profile_store
+    app.state.http_client = http_client
+    app.state.payments = payments
+    app.state.profile_outbox = outbox
+    app.state.recommender = recommender
+    app.state.similarity = similarity
+
+    # за фронтом запросы записывает фронт (весь трафик в одном файле)
+    capture: Optional[TrafficCapture] = None
+    if settings.CAPTURE_ENABLED and not behind_front:
+        capture = create_capture(settings)
+        capture.start()
+    app.state.capture = capture
 
     # установка вебхука (если задан URL)
-    if settings.TELEGRAM_WEBHOOK_URL:
+    if settings.TELEGRAM_WEBHOOK_URL and not behind_front:
         await bot.set_webhook(
             url=settings.TELEGRAM_WEBHOOK_URL + WEBHOOK.path,
             secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
@@ -72,14 +300,31 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     try:
         yield
     finally:
-        await bot.delete_webhook(drop_pending_updates=False)
+        if not behind_front:
+            await bot.delete_webhook(drop_pending_updates=False)
+        # дорабатываем принятые апдейты, пока сессия бота и хранилища ещё открыты
+        await update_scheduler.drain(timeout=settings.UPDATE_DRAIN_TIMEOUT)
         await bot.session.close()
+        await fsm_storage.close()
+        await summarizer.close()
+        await ai_client.close()
+        if outbox is not None:
+            await outbox.close()
+        await http_client.aclose()
+        if archiver is not None:
+            await archiver.close()
         await dialogue_store.close()
         await match_store.close()
         await profile_store.close()
+        if similarity is not None:
+            similarity.close()
+        if capture is not None:
+            capture.stop()
+        await db.close()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(CaptureMiddleware)
 
 
 @app.get("/health")
@@ -87,9 +332,17 @@ async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    if not get_settings().METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="metrics disabled")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # FastAPI-роуты
 app.include_router(telegram_webhook.telegram_router)
 app.include_router(sympathy_router)
 app.include_router(test_ai_router)
 app.include_router(payments_router)
 app.include_router(profiles_router)
+app.include_router(admin_router)
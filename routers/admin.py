@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+
+from config import get_settings
+
+admin_router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+def _check_auth(authorization: str | None) -> None:
+    settings = get_settings()
+    token = None
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ", 1)[1]
+    if not token or token != settings.MAIN_BOT_AUTH_TOKEN:
+        raise HTTPException(status_code=401, detail="unauthorized")
+
+
+@admin_router.post("/prompts/reload")
+async def reload_prompts(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> dict[str, list[str]]:
+    _check_auth(authorization)
+    locales = request.app.state.rules.reload()
+    return {"locales": locales}
+
+
+@admin_router.get("/dialogues/{user_id}/history")
+async def dialogue_history(
+    request: Request,
+    user_id: str,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> list[dict[str, Any]]:
+    # вся переписка, включая заархивированную
+    _check_auth(authorization)
+    return await request.app.state.dialogue_store.get_full_history(user_id)
+
+
+@admin_router.post("/dialogues/compact")
+async def compact_dialogues(
+    request: Request,
+    vacuum: bool = Query(False),
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> dict[str, Any]:
+    # vacuum=true: однократный полный VACUUM базы без auto_vacuum — все записи ждут до его конца
+    _check_auth(authorization)
+    archiver = request.app.state.dialogue_archiver
+    if archiver is None:
+        raise HTTPException(status_code=503, detail="dialogue archive disabled")
+    return await archiver.compact_once(vacuum=vacuum)
+
+
+@admin_router.get("/dialogues/compact")
+async def compaction_report(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> dict[str, Any]:
+    _check_auth(authorization)
+    archiver = request.app.state.dialogue_archiver
+    if archiver is None:
+        raise HTTPException(status_code=503, detail="dialogue archive disabled")
+    return archiver.last_report or {}
+
+
+@admin_router.get("/telegram/queue")
+async def telegram_queue(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> dict[str, int]:
+    # глубина очереди апдейтов этого процесса
+    _check_auth(authorization)
+    return request.app.state.update_scheduler.stats()
+
+
+@admin_router.get("/llm")
+async def llm_state(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> dict[str, Any]:
+    # предел одновременных запросов, очередь и выключатель по каждому провайдеру
+    _check_auth(authorization)
+    return request.app.state.ai_client.state()
@@ -1,44 +1,218 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Header, Body, Query
+import base64
+import json
+import logging
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Iterator
+
+from fastapi import APIRouter, HTTPException, Header, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 from config import get_settings
+from services.json_stream import JsonStreamError, iter_json_records
 from storage.profile_store import ProfileStore
 
+logger = logging.getLogger(__name__)
+
 profiles_router = APIRouter(prefix="/profiles", tags=["profiles"])
 
+
+def _check_auth(authorization: str | None) -> None:
+    settings = get_settings()
+    token = None
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ", 1)[1]
+    if not token or token != settings.MAIN_BOT_AUTH_TOKEN:
+        raise HTTPException(status_code=401, detail="unauthorized")
+
+
+def _encode_cursor(key: tuple[str, ...]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, size: int = 2) -> tuple[str, ...]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(key, list) or len(key) != size or not all(isinstance(k, str) for k in key):
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    return tuple(key)
+
+
+def _parse_updated_since(value: str) -> str:
+    # ISO 8601 (с часовым поясом или без — тогда UTC) → формат CURRENT_TIMESTAMP в SQLite
+    try:
+        moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="updated_since must be an ISO 8601 timestamp")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# Объявлен раньше /{user_id}, иначе "export" примется за user_id.
+# Полная выгрузка NDJSON, от старых изменений к новым; у каждой записи есть updated_at.
+# Для инкрементальной синхронизации передайте updated_since = последний полученный updated_at.
+@profiles_router.get("/export")
+async def export_profiles(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+    updated_since: str | None = Query(default=None),
+) -> StreamingResponse:
+    _check_auth(authorization)
+    store: ProfileStore = request.app.state.profile_store
+    since = _parse_updated_since(updated_since) if updated_since else None
+
+    async def body() -> AsyncIterator[bytes]:
+        lines: list[str] = []
+        async for profile in store.iter_profiles(updated_since=since):
+            lines.append(json.dumps(profile, ensure_ascii=False))
+            if len(lines) >= 500:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+                lines.clear()
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+# Поиск анкет по индексированным полям (storage/profile_index.py); текст сравнивается
+# без учёта регистра и лишних пробелов. Следующая страница — по X-Next-Cursor.
+@profiles_router.get("/search")
+async def search_profiles(
+    request: Request,
+    response: Response,
+    gender: str | None = Query(default=None, pattern="^(male|female)$"),
+    age_min: int | None = Query(default=None, ge=0, le=150),
+    age_max: int | None = Query(default=None, ge=0, le=150),
+    country: str | None = Query(default=None),
+    city: str | None = Query(default=None),
+    language: str | None = Query(default=None),
+    religiosity: str | None = Query(default=None),
+    marital_status: str | None = Query(default=None),
+    prayer: str | None = Query(default=None),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(default=None),
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> list[dict]:
+    _check_auth(authorization)
+    store: ProfileStore = request.app.state.profile_store
+    items, next_key = await store.search_profiles(
+        gender=gender,
+        age_min=age_min,
+        age_max=age_max,
+        language=language,
+        limit=limit,
+        after=_decode_cursor(cursor, 1)[0] if cursor else None,
+        country=country,
+        city=city,
+        religiosity=religiosity,
+        marital_status=marital_status,
+        prayer=prayer,
+    )
+    if next_key is not None:
+        response.headers["X-Next-Cursor"] = _encode_cursor((next_key,))
+    return items
+
 @profiles_router.get("/{user_id}")
-async def get_profile(user_id: str) -> dict:
-    store: ProfileStore = profiles_router.router.app.state.profile_store  # type: ignore[attr-defined]
+async def get_profile(request: Request, user_id: str) -> dict:
+    store: ProfileStore = request.app.state.profile_store
     profile = await store.get_profile(user_id)
     if not profile:
         raise HTTPException(status_code=404, detail="profile not found")
     return profile
 
 @profiles_router.get("/by_number/{number}")
-async def get_profile_by_number(number: int) -> dict:
-    store: ProfileStore = profiles_router.router.app.state.profile_store  # type: ignore[attr-defined]
+async def get_profile_by_number(request: Request, number: int) -> dict:
+    store: ProfileStore = request.app.state.profile_store
     profile = await store.find_by_number(number)
     if not profile:
         raise HTTPException(status_code=404, detail="profile not found")
     return profile
 
+@profiles_router.get("/cache/stats")
+async def profile_cache_stats(request: Request) -> dict[str, int]:
+    store: ProfileStore = request.app.state.profile_store
+    return store.cache.stats()
+
+@profiles_router.get("/outbox/stats")
+async def profile_outbox_stats(request: Request) -> dict[str, int]:
+    outbox = request.app.state.profile_outbox
+    if outbox is None:
+        return {"pending": 0, "retrying": 0, "dead": 0}
+    return await outbox.stats()
+
+@profiles_router.get("/{user_id}/suggestions")
+async def profile_suggestions(
+    request: Request,
+    user_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> list[dict]:
+    _check_auth(authorization)
+    recommender = request.app.state.recommender
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="recommender disabled")
+    if user_id not in recommender:
+        raise HTTPException(status_code=404, detail="profile not found")
+    store: ProfileStore = request.app.state.profile_store
+    items = []
+    for candidate_id, score in recommender.suggest(user_id, limit):
+        profile = await store.get_profile(candidate_id)
+        if profile:
+            items.append({"score": score, "profile": profile})
+    return items
+
+@profiles_router.get("/{user_id}/similar")
+async def similar_profiles(
+    request: Request,
+    user_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    gender: str | None = Query(default=None),
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> list[dict]:
+    _check_auth(authorization)
+    similarity = request.app.state.similarity
+    if similarity is None:
+        raise HTTPException(status_code=503, detail="similarity index disabled")
+    if user_id not in similarity:
+        raise HTTPException(status_code=404, detail="profile not found")
+    store: ProfileStore = request.app.state.profile_store
+    items = []
+    for candidate_id, score in similarity.similar(user_id, limit, gender=gender):
+        profile = await store.get_profile(candidate_id)
+        if profile:
+            items.append({"score": score, "profile": profile})
+    return items
+
+# Следующая страница — по курсору из заголовка X-Next-Cursor (нет заголовка — страниц больше нет).
+# offset оставлен для старых клиентов: при нём курсор не выдаётся.
 @profiles_router.get("")
-async def list_profiles(limit: int = Query(50, ge=1, le=200), offset: int = Query(0, ge=0)) -> list[dict]:
-    store: ProfileStore = profiles_router.router.app.state.profile_store  # type: ignore[attr-defined]
-    return await store.list_profiles(limit=limit, offset=offset)
+async def list_profiles(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = Query(default=None),
+) -> list[dict]:
+    store: ProfileStore = request.app.state.profile_store
+    if offset and not cursor:
+        return await store.list_profiles(limit=limit, offset=offset)
+    items, next_key = await store.list_profiles_page(limit=limit, after=_decode_cursor(cursor) if cursor else None)  # type: ignore[arg-type]
+    if next_key is not None:
+        response.headers["X-Next-Cursor"] = _encode_cursor(next_key)
+    return items
+
 
 @profiles_router.post("/webhook/profile_upsert")
 async def profile_upsert(
+    request: Request,
     authorization: str | None = Header(default=None, alias="Authorization"),
     payload: dict | None = Body(default=None),
 ) -> dict[str, str]:
-    settings = get_settings()
-    token = None
-    if authorization and authorization.startswith("Bearer "):
-        token = authorization.split(" ", 1)[1]
-    if not token or token != settings.MAIN_BOT_AUTH_TOKEN:
-        raise HTTPException(status_code=401, detail="unauthorized")
+    _check_auth(authorization)
     if payload is None:
         raise HTTPException(status_code=400, detail="payload required")
 
@@ -46,7 +220,7 @@ async def profile_upsert(
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id required")
 
-    store: ProfileStore = profiles_router.router.app.state.profile_store  # type: ignore[attr-defined]
+    store: ProfileStore = request.app.state.profile_store
     await store.upsert_profile(
         user_id=user_id,
         username=payload.get("username"),
@@ -58,27 +232,13 @@ async def profile_upsert(
     return {"status": "ok"}
 
 
-# Compatibility endpoint for Bot A: POST /profiles/sync
-@profiles_router.post("/sync")
-async def profiles_sync(
-    authorization: str | None = Header(default=None, alias="Authorization"),
-    payload: dict | None = Body(default=None),
-) -> dict[str, str]:
-    settings = get_settings()
-    token = None
-    if authorization and authorization.startswith("Bearer "):
-        token = authorization.split(" ", 1)[1]
-    if not token or token != settings.MAIN_BOT_AUTH_TOKEN:
-        raise HTTPException(status_code=401, detail="unauthorized")
-    if payload is None:
-        raise HTTPException(status_code=400, detail="payload required")
-
-    # Map Bot A shape → local profile
+def _map_bot_a_profile(payload: dict[str, Any]) -> dict[str, Any]:
+    # Map Bot A shape → local profile (аргументы ProfileStore.upsert_profile)
     external_user_id = payload.get("external_user_id")
     telegram_user_id = payload.get("telegram_user_id")
     user_id = str(telegram_user_id or external_user_id or "").strip()
     if not user_id:
-        raise HTTPException(status_code=400, detail="telegram_user_id or external_user_id required")
+        raise ValueError("telegram_user_id or external_user_id required")
 
     profile = payload.get("profile") or {}
     # Normalize gender to male/female when possible
@@ -105,13 +265,109 @@ async def profiles_sync(
     for k, v in (payload.get("attributes") or {}).items():
         attributes[k] = v
 
-    store: ProfileStore = profiles_router.router.app.state.profile_store  # type: ignore[attr-defined]
-    await store.upsert_profile(
-        user_id=user_id,
-        username=payload.get("username"),
-        gender=gender,
-        bio=profile.get("bio") or payload.get("bio"),
-        attributes=attributes,
-        profile_number=profile.get("global_number"),
-    )
-    return {"id": user_id, "status": "ok"}
+    # номер анкеты в SQLite — INTEGER: строку "12" приводим здесь, иначе пачка не сопоставит её с 12 из базы
+    number = profile.get("global_number")
+    if number is not None:
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid global_number: {number!r}") from None
+
+    return {
+        "user_id": user_id,
+        "username": payload.get("username"),
+        "gender": gender,
+        "bio": profile.get("bio") or payload.get("bio"),
+        "attributes": attributes,
+        "profile_number": number,
+    }
+
+
+# Compatibility endpoint for Bot A: POST /profiles/sync
+@profiles_router.post("/sync")
+async def profiles_sync(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+    payload: dict | None = Body(default=None),
+) -> dict[str, str]:
+    _check_auth(authorization)
+    if payload is None:
+        raise HTTPException(status_code=400, detail="payload required")
+    try:
+        profile = _map_bot_a_profile(payload)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    store: ProfileStore = request.app.state.profile_store
+    await store.upsert_profile(**profile)
+    return {"id": profile["user_id"], "status": "ok"}
+
+
+# Массовая синхронизация из Bot A: тело — JSON-массив или NDJSON (можно потоком).
+# Записи пишутся пачками по мере чтения тела; статусы копятся во временном файле
+# (на диске после 1 МБ) и отдаются NDJSON-ответом — память не зависит от размера тела.
+@profiles_router.post("/sync/batch")
+async def profiles_sync_batch(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> StreamingResponse:
+    _check_auth(authorization)
+    settings = get_settings()
+    store: ProfileStore = request.app.state.profile_store
+    batch_size = max(1, settings.PROFILE_SYNC_BATCH_SIZE)
+
+    out = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+    totals = {"ok": 0, "error": 0}
+    batch: list[tuple[int, dict[str, Any]]] = []
+
+    def write(item: dict[str, Any]) -> None:
+        out.write((json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    async def flush() -> None:
+        try:
+            await store.upsert_profiles_many([profile for _, profile in batch])
+            status: dict[str, Any] = {"status": "ok"}
+        except Exception as exc:
+            logger.exception("profile batch sync failed")
+            status = {"status": "error", "error": f"write failed: {type(exc).__name__}"}
+        totals[status["status"]] += len(batch)
+        for index, profile in batch:
+            write({"index": index, "id": profile["user_id"], **status})
+        batch.clear()
+
+    index = -1
+    summary: dict[str, Any] = {"status": "done"}
+    try:
+        async for record, error in iter_json_records(request.stream()):
+            index += 1
+            if error is None:
+                try:
+                    if not isinstance(record, dict):
+                        raise ValueError("json object expected")
+                    batch.append((index, _map_bot_a_profile(record)))
+                except ValueError as exc:
+                    error = str(exc)
+            if error is not None:
+                totals["error"] += 1
+                write({"index": index, "status": "error", "error": error})
+            elif len(batch) >= batch_size:
+                await flush()
+    except JsonStreamError as exc:
+        # уже прочитанные корректные записи сохраняем, остаток тела отбрасываем
+        summary = {"status": "aborted", "error": str(exc)}
+    except BaseException:
+        out.close()
+        raise
+    if batch:
+        await flush()
+    write({**summary, **totals})
+    out.seek(0)
+
+    def body() -> Iterator[bytes]:
+        try:
+            while chunk := out.read(64 * 1024):
+                yield chunk
+        finally:
+            out.close()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
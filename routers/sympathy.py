@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Header, HTTPException, Body
+from fastapi import APIRouter, Header, HTTPException, Body, Request
 
 from config import get_settings
 from storage.match_store import MatchStore
@@ -9,6 +9,7 @@ sympathy_router = APIRouter(prefix="/webhook", tags=["sympathy"])
 
 @sympathy_router.post("/sympathy")
 async def sympathy_event(
+    request: Request,
     authorization: str | None = Header(default=None, alias="Authorization"),
     payload: dict | None = Body(default=None),
 ) -> dict[str, str]:
@@ -32,7 +33,7 @@ async def sympathy_event(
     if not male_id or not female_id:
         raise HTTPException(status_code=400, detail="male_id and female_id required")
 
-    store: MatchStore = sympathy_router.router.app.state.match_store  # type: ignore[attr-defined]
+    store: MatchStore = request.app.state.match_store
     match_id = await store.create_match(
         male_id=male_id,
         female_id=female_id,
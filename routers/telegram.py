@@ -4,12 +4,18 @@ from aiogram import Router, F
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-import httpx
 from typing import Optional
 
 from storage.dialogue_store import DialogueStore
 from client import AIClient
 from services.business_rules import BusinessRules
+from services.user_context import UserContextLoader
+from services.telegram_stream import deliver_stream
+from services.history import HistorySummarizer, fit_history
+from services.metrics import ERRORS
+from services.payments import PaymentsService
+from services.recommender import Recommender
+from services.similarity import SimilarityIndex
 from storage.match_store import MatchStore
 from storage.profile_store import ProfileStore
 from config import get_settings
@@ -87,8 +93,13 @@ def create_router(
     profile_store: ProfileStore,
     ai_client: AIClient,
     rules: BusinessRules,
+    summarizer: HistorySummarizer,
+    payments: PaymentsService,
+    recommender: Optional[Recommender] = None,
+    similarity: Optional[SimilarityIndex] = None,
 ) -> Router:
     router = Router(name="chat")
+    contexts = UserContextLoader(profile_store, match_store, dialogue_store)
 
     def main_keyboard() -> ReplyKeyboardMarkup:
         return ReplyKeyboardMarkup(
@@ -118,6 +129,8 @@ def create_router(
             "Команды:\n"
             "/start — начать\n"
             "/my_matches — список взаимных совпадений\n"
+            "/suggest — подобрать подходящие анкеты\n"
+            "/similar — анкеты с похожими интересами\n"
             "/create_profile — создать/обновить анкету\n"
             "/profile — показать мою анкету\n"
             "/status — статус взаимной симпатии\n"
@@ -341,26 +354,9 @@ def create_router(
             bio=data.get("bio"),
             attributes=attrs,
             profile_number=None,
+            # в основной бот анкета уйдёт в фоне через outbox (если настроен URL)
+            publish=True,
         )
-        # Отправим апдейт в основной бот, если настроен URL
-        settings = get_settings()
-        if settings.MAIN_BOT_PROFILE_UPSERT_URL and settings.MAIN_BOT_AUTH_TOKEN:
-            try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    await client.post(
-                        settings.MAIN_BOT_PROFILE_UPSERT_URL,
-                        headers={"Authorization": f"Bearer {settings.MAIN_BOT_AUTH_TOKEN}"},
-                        json={
-                            "user_id": user_id,
-                            "username": message.from_user.username if message.from_user else None,
-                            "gender": data.get("gender"),
-                            "bio": data.get("bio"),
-                            "attributes": attrs,
-                            "profile_number": None,
-                        },
-                    )
-            except Exception:
-                pass
 
         preview = [
             "Анкета сохранена:",
@@ -393,7 +389,7 @@ def create_router(
     @router.message(F.text == "/profile")
     async def on_profile(message: Message) -> None:
         user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
-        profile = await profile_store.get_profile(user_id)
+        profile = (await contexts.load(user_id, match=False)).profile
         if not profile:
             await message.answer("Анкета не найдена. Попросите основной бот отправить/обновить анкету.")
             return
@@ -403,7 +399,7 @@ def create_router(
     @router.message(F.text == "/status")
     async def on_status(message: Message) -> None:
         user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
-        latest = await match_store.get_latest_match_for_user(user_id)
+        latest = (await contexts.load(user_id, profile=False)).latest_match
         if not latest:
             await message.answer("Активных взаимных симпатий пока нет.")
             return
@@ -426,12 +422,68 @@ def create_router(
             lines.append(_format_match_context(m))
         await message.answer("\n".join(lines))
 
+    @router.message(F.text == "/suggest")
+    async def on_suggest(message: Message) -> None:
+        user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
+        if recommender is None:
+            await message.answer("Подбор анкет временно недоступен.")
+            return
+        profile = (await contexts.load(user_id, match=False)).profile
+        if not profile or (profile.get("gender") or "").lower() not in {"male", "female"}:
+            await message.answer("Сначала заполните анкету с указанием пола: /create_profile")
+            return
+        # уже знакомые по матчам не предлагаются повторно
+        seen = {str(m["female_id"] if m["male_id"] == user_id else m["male_id"]) for m in await match_store.list_matches_for_user(user_id)}
+        suggestions = recommender.suggest(user_id, 5, exclude=seen)
+        if not suggestions:
+            await message.answer("Подходящих анкет пока нет. Загляните позже.")
+            return
+        lines = ["Вам могут подойти:"]
+        for candidate_id, score in suggestions:
+            candidate = await profile_store.get_profile(candidate_id)
+            if not candidate:
+                continue
+            attrs = candidate.get("attributes") or {}
+            parts = [f"Анкета №{candidate['profile_number']}" if candidate.get("profile_number") else "Анкета"]
+            parts += [str(v) for v in (attrs.get("age"), attrs.get("city")) if v]
+            parts.append(f"совпадение {round(score * 100)}%")
+            lines.append("• " + ", ".join(parts))
+        await message.answer("\n".join(lines))
+
+    @router.message(F.text == "/similar")
+    async def on_similar(message: Message) -> None:
+        user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
+        if similarity is None:
+            await message.answer("Поиск похожих анкет временно недоступен.")
+            return
+        profile = (await contexts.load(user_id, match=False)).profile
+        gender = (profile or {}).get("gender") or ""
+        if gender.lower() not in {"male", "female"}:
+            await message.answer("Сначала заполните анкету с указанием пола: /create_profile")
+            return
+        opposite = "female" if gender.lower() == "male" else "male"
+        similar = similarity.similar(user_id, 5, gender=opposite)
+        if not similar:
+            await message.answer("Анкет с похожими интересами пока нет. Расскажите о себе подробнее в анкете.")
+            return
+        lines = ["Похожие интересы:"]
+        for candidate_id, score in similar:
+            candidate = await profile_store.get_profile(candidate_id)
+            if not candidate:
+                continue
+            attrs = candidate.get("attributes") or {}
+            parts = [f"Анкета №{candidate['profile_number']}" if candidate.get("profile_number") else "Анкета"]
+            parts += [str(v) for v in (attrs.get("age"), attrs.get("city")) if v]
+            parts.append(f"сходство {round(score * 100)}%")
+            lines.append("• " + ", ".join(parts))
+        await message.answer("\n".join(lines))
+
     @router.message(F.text == "/pay")
     async def on_pay(message: Message) -> None:
         user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
-        latest = await match_store.get_latest_match_for_user(user_id)
-        profile = await profile_store.get_profile(user_id)
-        role = resolve_user_role(profile, latest, user_id)
+        ctx = await contexts.load(user_id)
+        latest = ctx.latest_match
+        role = resolve_user_role(ctx.profile, latest, user_id)
         if not latest or latest["male_id"] != user_id or int(latest.get("mutual", 0)) != 1:
             if role == "female":
                 await message.answer("Оплата не требуется. Вы можете начать диалог.")
@@ -445,27 +497,22 @@ def create_router(
         if invoice:
             await message.answer(f"Ссылка на оплату: {invoice}")
         else:
-            settings = get_settings()
-            base_url: Optional[str] = settings.APP_BASE_URL or settings.TELEGRAM_WEBHOOK_URL or "http://127.0.0.1:8000"
+            # счёт создаём в этом же процессе, без HTTP-запроса к самому себе
             try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    resp = await client.post(f"{base_url}/payments/create", json={"match_id": latest["id"]})
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        invoice_url = data.get("invoice_url")
-                        if invoice_url:
-                            await message.answer(f"Ссылка на оплату: {invoice_url}")
-                            return
+                invoice_url = await payments.create_invoice_for_match(latest["id"])
+                if invoice_url:
+                    await message.answer(f"Ссылка на оплату: {invoice_url}")
+                    return
             except Exception:
-                pass
+                ERRORS.inc("invoice_create")
             await message.answer("Ссылка на оплату скоро будет доступна. Обратитесь к поддержке.")
 
     @router.message(F.text == "/contact")
     async def on_contact(message: Message) -> None:
         user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
-        latest = await match_store.get_latest_match_for_user(user_id)
-        profile = await profile_store.get_profile(user_id)
-        role = resolve_user_role(profile, latest, user_id)
+        ctx = await contexts.load(user_id)
+        latest = ctx.latest_match
+        role = resolve_user_role(ctx.profile, latest, user_id)
         if not latest or int(latest.get("mutual", 0)) != 1:
             await message.answer("Пока нет взаимной симпатии, контакт недоступен.")
             return
@@ -491,8 +538,10 @@ def create_router(
     async def on_message(message: Message) -> None:
         user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
 
-        latest = await match_store.get_latest_match_for_user(user_id)
-        profile = await profile_store.get_profile(user_id)
+        settings = get_settings()
+        # профиль, матч, история и сводка одним заходом; текущее сообщение добавляем к истории сами
+        ctx = await contexts.load(user_id, history_limit=settings.HISTORY_FETCH_LIMIT, summary=True)
+        latest, profile = ctx.latest_match, ctx.profile
         role = resolve_user_role(profile, latest, user_id)
         if latest and role == "male" and int(latest.get("mutual", 0)) == 1 and int(latest.get("paid", 0)) == 0:
             invoice_url = latest.get("invoice_url")
@@ -503,16 +552,36 @@ def create_router(
                 pay_hint += " Запросите ссылку командой /pay"
             await message.answer(pay_hint)
 
-        await dialogue_store.add_message(user_id=user_id, role="user", content=message.text or "")
-
+        text = message.text or ""
         profile_ctx = _format_profile_context(profile) if profile else None
         match_ctx = _format_match_context(latest) if latest else None
-        system_prompt = await rules.build_system_prompt(user_id=user_id, profile_context=profile_ctx, match_context=match_ctx)
+        await dialogue_store.add_message(user_id=user_id, role="user", content=text)
 
-        history = await dialogue_store.get_recent_messages(user_id=user_id, limit=12)
-        reply_text = await ai_client.generate_reply(system_prompt=system_prompt, history=history)
+        # сообщения, уже вошедшие в сводку, в окно не берём
+        covered = ctx.summary["covered_until_id"] if ctx.summary else 0
+        recent = [m for m in ctx.history if m["id"] is None or m["id"] > covered]
+        window = fit_history(recent + [{"id": None, "role": "user", "content": text}], settings.HISTORY_TOKEN_BUDGET)
+        summarizer.schedule(user_id, window=window, fetched=ctx.history, summary=ctx.summary)
+        history = [{"role": m["role"], "content": m["content"]} for m in window]
 
-        await message.answer(reply_text)
+        system_prompt = await rules.build_system_prompt(
+            user_id=user_id,
+            profile_context=profile_ctx,
+            match_context=match_ctx,
+            summary_context=ctx.summary["summary"] if ctx.summary else None,
+            locale=message.from_user.language_code if message.from_user else None,
+        )
+
+        if settings.AI_STREAMING:
+            # ответ показывается по мере генерации; в историю пишем только полный текст
+            reply_text, _ = await deliver_stream(
+                message,
+                ai_client.stream_reply(system_prompt=system_prompt, history=history),
+                edit_interval=settings.AI_STREAM_EDIT_INTERVAL,
+            )
+        else:
+            reply_text = await ai_client.generate_reply(system_prompt=system_prompt, history=history)
+            await message.answer(reply_text)
         await dialogue_store.add_message(user_id=user_id, role="assistant", content=reply_text)
 
     return router
@@ -2,28 +2,48 @@ from __future__ import annotations
 
 from fastapi import APIRouter, Request, Response, HTTPException
 from aiogram.types import Update
-import asyncio
 
 from config import WEBHOOK, get_settings
-from storage.match_store import MatchStore
+from services.update_scheduler import UpdateScheduler
 
 telegram_router = APIRouter(prefix="/telegram", tags=["telegram"])
 
 
-@telegram_router.post("/webhook")
-async def telegram_webhook(request: Request) -> Response:
+def _check_secret(request: Request) -> None:
     settings = get_settings()
     secret = request.headers.get(WEBHOOK.header_secret)
     if settings.TELEGRAM_WEBHOOK_SECRET and secret != settings.TELEGRAM_WEBHOOK_SECRET:
         raise HTTPException(status_code=403, detail="invalid secret")
 
+
+@telegram_router.post("/webhook")
+async def telegram_webhook(request: Request) -> Response:
+    _check_secret(request)
     data = await request.json()
     update = Update.model_validate(data)
-    # мгновенный ответ 200 OK, обработка в фоне (устраняет таймауты Telegram)
-    asyncio.create_task(request.app.state.dp.feed_update(bot=request.app.state.bot, update=update))
+    # мгновенный ответ 200 OK, обработка в фоне (устраняет таймауты Telegram);
+    # при переполненном бэклоге — 503, Telegram доставит апдейт повторно
+    scheduler: UpdateScheduler = request.app.state.update_scheduler
+    if not scheduler.submit(update):
+        return Response(status_code=503, headers={"Retry-After": "1"})
     return Response(status_code=200)
 
 
+# Пачка апдейтов от фронта (front.py) в порядке получения. При переполнении принимается
+# начало пачки: остаток фронт отклоняет, и Telegram доставляет его повторно.
+@telegram_router.post("/updates")
+async def telegram_updates(request: Request) -> dict[str, int]:
+    _check_secret(request)
+    data = await request.json()
+    scheduler: UpdateScheduler = request.app.state.update_scheduler
+    accepted = 0
+    for item in data:
+        if not scheduler.submit(Update.model_validate(item)):
+            break
+        accepted += 1
+    return {"accepted": accepted}
+
+
 # Deep-link support: start=match_<id> | start=profile_<number>
 @telegram_router.get("/deeplink")
 async def deeplink(match_id: int | None = None, profile_number: int | None = None) -> dict[str, str | int | None]:
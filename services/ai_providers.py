@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import math
+import random
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Optional
+
+from openai import AsyncOpenAI
+
+from services.metrics import LLM_TOKENS
+
+# Бэкенды LLM для AIClient. Провайдер получает готовый список сообщений (system + история)
+# и отвечает целиком (complete) или кусками (stream); выбор по имени — через реестр ниже.
+
+Messages = list[dict[str, str]]
+
+
+class ChatProvider(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def complete(self, messages: Messages) -> str: ...
+
+    # в наследниках — async-генератор
+    @abstractmethod
+    def stream(self, messages: Messages) -> AsyncIterator[str]: ...
+
+    async def close(self) -> None:
+        pass
+
+    def state(self) -> dict[str, Any]:
+        return {"provider": self.name}
+
+
+class OpenAIProvider(ChatProvider):
+    """Chat Completions API: сам OpenAI или любой совместимый сервер по base_url (vLLM, Ollama, LM Studio…)."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        *,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        model: str = "gpt-4o-mini",
+        temperature: float = 0.7,
+        max_tokens: int = 400,
+        max_retries: int = 2,
+    ) -> None:
+        self._client = AsyncOpenAI(api_key=api_key, base_url=base_url or None, max_retries=max_retries)
+        self.model = model
+        self._temperature = temperature
+        self._max_tokens = max_tokens
+
+    async def complete(self, messages: Messages) -> str:
+        resp = await self._client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self._temperature,
+            max_tokens=self._max_tokens,
+        )
+        if resp.usage is not None:
+            LLM_TOKENS.observe(resp.usage.prompt_tokens, "prompt")
+            LLM_TOKENS.observe(resp.usage.completion_tokens, "completion")
+        return resp.choices[0].message.content or ""
+
+    async def stream(self, messages: Messages) -> AsyncIterator[str]:
+        stream = await self._client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self._temperature,
+            max_tokens=self._max_tokens,
+            stream=True,
+        )
+        # закрытие генератора (отменённый хедж, дедлайн) закрывает и HTTP-ответ
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+class StubProvider(ChatProvider):
+    """Ответ без сети: текст зависит только от запроса, задержка — логнормальная (медиана latency) с фиксированным seed."""
+
+    name = "stub"
+
+    def __init__(self, *, latency: float = 0.0, latency_sigma: float = 0.0, seed: int = 0, words: int = 30) -> None:
+        self._latency = latency
+        self._sigma = latency_sigma
+        self._rng = random.Random(seed)
+        self._words = words
+
+    def _delay(self) -> float:
+        if self._sigma <= 0:
+            return self._latency
+        return self._latency * math.exp(self._rng.gauss(0.0, self._sigma))
+
+    def _reply(self, messages: Messages) -> list[str]:
+        last = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        return [last[:40]] + ["ответ"] * self._words
+
+    async def complete(self, messages: Messages) -> str:
+        await asyncio.sleep(self._delay())
+        return " ".join(self._reply(messages))
+
+    async def stream(self, messages: Messages) -> AsyncIterator[str]:
+        await asyncio.sleep(self._delay())
+        for i, word in enumerate(self._reply(messages)):
+            if i:
+                await asyncio.sleep(0.02)
+            yield word + " "
+
+
+def _openai_compatible(*, base_url: Optional[str] = None, api_key: Optional[str] = None, **options: Any) -> ChatProvider:
+    # локальные серверы обычно не проверяют ключ, но SDK без ключа не создаётся
+    if not base_url:
+        raise ValueError("openai_compatible provider requires a base URL")
+    return OpenAIProvider(base_url=base_url, api_key=api_key or "unused", **options)
+
+
+PROVIDERS: dict[str, Callable[..., ChatProvider]] = {}
+
+
+def register_provider(name: str, factory: Callable[..., ChatProvider]) -> None:
+    # класс без complete/stream отвергаем сразу, а не на первом запросе
+    if inspect.isclass(factory) and inspect.isabstract(factory):
+        raise TypeError(f"AI provider {name!r} does not implement {', '.join(sorted(factory.__abstractmethods__))}")
+    PROVIDERS[name] = factory
+
+
+def create_provider(name: str, **options: Any) -> ChatProvider:
+    factory = PROVIDERS.get(name)
+    if factory is None:
+        raise ValueError(f"unknown AI provider {name!r}, expected one of {', '.join(sorted(PROVIDERS))}")
+    return factory(**options)
+
+
+register_provider("openai", OpenAIProvider)
+register_provider("openai_compatible", _openai_compatible)
+register_provider("stub", StubProvider)
+
+
+def _options(name: str, *, api_key: Optional[str], base_url: Optional[str], model: str, settings: Any, seed: int) -> dict[str, Any]:
+    if name == "stub":
+        return {"latency": settings.AI_STUB_LATENCY_MS / 1000, "latency_sigma": settings.AI_STUB_LATENCY_SIGMA, "seed": seed}
+    return {
+        "api_key": api_key,
+        "base_url": base_url,
+        "model": model,
+        "temperature": settings.AI_TEMPERATURE,
+        "max_tokens": settings.AI_MAX_TOKENS,
+        # повторы — в services/llm_guard.py: там видны все 429 и Retry-After
+        "max_retries": 0,
+    }
+
+
+def create_providers(settings: Any) -> tuple[ChatProvider, Optional[ChatProvider]]:
+    # основной и запасной (AI_BACKUP_*; пустые поля берутся у основного) провайдеры
+    primary = create_provider(
+        settings.AI_PROVIDER,
+        **_options(
+            settings.AI_PROVIDER,
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            model=settings.AI_MODEL,
+            settings=settings,
+            seed=0,
+        ),
+    )
+    if not (settings.AI_BACKUP_PROVIDER or settings.AI_BACKUP_MODEL or settings.AI_BACKUP_BASE_URL):
+        return primary, None
+    name = settings.AI_BACKUP_PROVIDER or settings.AI_PROVIDER
+    backup = create_provider(
+        name,
+        **_options(
+            name,
+            api_key=settings.AI_BACKUP_API_KEY or settings.OPENAI_API_KEY,
+            base_url=settings.AI_BACKUP_BASE_URL or settings.OPENAI_BASE_URL,
+            model=settings.AI_BACKUP_MODEL or settings.AI_MODEL,
+            settings=settings,
+            seed=1,
+        ),
+    )
+    return primary, backup
@@ -1,27 +1,133 @@
 from __future__ import annotations
 
+import os
 import pathlib
+import time
+from dataclasses import dataclass
 from typing import Optional
 
+_FALLBACK_PROMPT = (
+    "Ты — виртуальный собеседник, помогающий знакомиться. Пиши естественно, дружелюбно, "
+    "поддерживай диалог, задавай уместные вопросы, соблюдай безопасность и уважение."
+)
+_PROFILE_HEADER = "\n\nКонтекст профиля пользователя:\n"
+_MATCH_HEADER = "\n\nКонтекст активного матча:\n"
+_SUMMARY_HEADER = "\n\nКраткое содержание более ранней переписки:\n"
+
+
+class PromptTemplate:
+    # базовый текст хранится уже обрезанным; секции дописываются одним join без копий базы
+    def __init__(self, text: str) -> None:
+        self.base = text.rstrip()
+
+    def render(
+        self,
+        *,
+        profile_context: Optional[str] = None,
+        match_context: Optional[str] = None,
+        summary_context: Optional[str] = None,
+    ) -> str:
+        parts = [self.base]
+        if profile_context:
+            parts += (_PROFILE_HEADER, profile_context.strip())
+        if match_context:
+            parts += (_MATCH_HEADER, match_context.strip())
+        if summary_context:
+            parts += (_SUMMARY_HEADER, summary_context.strip())
+        return self.base if len(parts) == 1 else "".join(parts)
+
+
+@dataclass
+class _CachedPrompt:
+    path: pathlib.Path
+    mtime_ns: Optional[int]
+    template: PromptTemplate
+    checked_at: float
+    fallback: bool = False
+
 
 class BusinessRules:
-    def __init__(self) -> None:
+    def __init__(self, *, default_locale: str = "ru", check_interval: float = 2.0) -> None:
         self._base = pathlib.Path(__file__).parent.parent / "system_prompts"
-        self._prompt_file = self._base / "dating_ru.txt"
+        self._default_locale = default_locale
+        # mtime проверяем не чаще раза в check_interval секунд
+        self._check_interval = check_interval
+        self._cache: dict[str, _CachedPrompt] = {}
+
+    def _prompt_path(self, locale: str) -> pathlib.Path:
+        return self._base / f"dating_{locale}.txt"
 
-    async def build_system_prompt(self, user_id: str, *, profile_context: Optional[str] = None, match_context: Optional[str] = None) -> str:
+    def _resolve_locale(self, locale: Optional[str]) -> str:
+        # language_code из Telegram: "ru", "en", "pt-br" → dating_<язык>.txt
+        if locale:
+            lang = locale.replace("_", "-").split("-", 1)[0].lower()
+            if lang.isalpha():
+                return lang
+        return self._default_locale
+
+    def _load(self, locale: str) -> _CachedPrompt:
+        path = self._prompt_path(locale)
+        fallback = False
         try:
-            base = self._prompt_file.read_text(encoding="utf-8")
+            mtime_ns: Optional[int] = os.stat(path).st_mtime_ns
+            text = path.read_text(encoding="utf-8")
+            template = PromptTemplate(text)
         except FileNotFoundError:
-            base = (
-                "Ты — виртуальный собеседник, помогающий знакомиться. Пиши естественно, дружелюбно, "
-                "поддерживай диалог, задавай уместные вопросы, соблюдай безопасность и уважение."
-            )
-        extra = []
-        if profile_context:
-            extra.append("Контекст профиля пользователя:\n" + profile_context.strip())
-        if match_context:
-            extra.append("Контекст активного матча:\n" + match_context.strip())
-        if extra:
-            base = base.rstrip() + "\n\n" + "\n\n".join(extra)
-        return base
+            # файла для языка нет — берём основной; появление файла заметит проверка mtime
+            mtime_ns = None
+            if locale != self._default_locale:
+                template, fallback = self._template(self._default_locale).template, True
+            else:
+                template = PromptTemplate(_FALLBACK_PROMPT)
+        if locale == self._default_locale:
+            # языки без своего файла ссылаются на основной шаблон — сбрасываем их вместе с ним
+            for key in [k for k, e in self._cache.items() if e.fallback]:
+                del self._cache[key]
+        entry = _CachedPrompt(
+            path=path, mtime_ns=mtime_ns, template=template, checked_at=time.monotonic(), fallback=fallback
+        )
+        self._cache[locale] = entry
+        return entry
+
+    def _template(self, locale: str) -> _CachedPrompt:
+        entry = self._cache.get(locale)
+        if entry is None:
+            return self._load(locale)
+        now = time.monotonic()
+        if now - entry.checked_at < self._check_interval:
+            return entry
+        entry.checked_at = now
+        try:
+            mtime_ns: Optional[int] = os.stat(entry.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns != entry.mtime_ns:
+            return self._load(locale)
+        if entry.fallback and self._template(self._default_locale).template is not entry.template:
+            # своего файла нет — шаблон основного; основной перечитан, берём новый
+            return self._load(locale)
+        return entry
+
+    def reload(self) -> list[str]:
+        # явная перезагрузка (админ-эндпоинт): перечитываем все файлы подсказок
+        self._cache.clear()
+        locales = sorted(p.stem.split("_", 1)[1] for p in self._base.glob("dating_*.txt"))
+        for locale in locales or [self._default_locale]:
+            self._load(locale)
+        return list(self._cache)
+
+    async def build_system_prompt(
+        self,
+        user_id: str,
+        *,
+        profile_context: Optional[str] = None,
+        match_context: Optional[str] = None,
+        summary_context: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> str:
+        template = self._template(self._resolve_locale(locale)).template
+        return template.render(
+            profile_context=profile_context,
+            match_context=match_context,
+            summary_context=summary_context,
+        )
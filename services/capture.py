@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import logging.handlers
+import pathlib
+import queue
+import re
+import secrets
+import time
+from typing import Any, Optional
+
+# Запись входящего трафика для воспроизведения (benchmarks/replay.py): каждая строка JSONL —
+# {"t": время прихода, "path", "headers", "body"}. Включается CAPTURE_ENABLED; файл ротируется по размеру.
+CAPTURE_PATHS = frozenset({"/telegram/webhook", "/webhook/sympathy", "/profiles/sync", "/payments/webhook"})
+# Authorization и секрет вебхука не пишутся: при воспроизведении подставляются свои
+_KEEP_HEADERS = frozenset({"content-type", "x-signature"})
+# отклонённые проверкой доступа запросы не пишутся: тело могло быть прочитано до неё
+_SKIP_STATUSES = frozenset({401, 403})
+# команды бота («/start», «/similar@bot») не личные данные — остаются как есть, чтобы воспроизведение шло по тем же веткам
+_COMMAND_RE = re.compile(r"/\w+(@\w+)?")
+
+
+def redact(value: Any, keys: frozenset[str], salt: bytes) -> Any:
+    # строковые значения перечисленных ключей → стабильный псевдоним: один и тот же username
+    # везде заменяется одинаково, поэтому связи между запросами сохраняются
+    if isinstance(value, dict):
+        return {
+            k: _pseudonym(v, salt) if k in keys and isinstance(v, str) and not _COMMAND_RE.fullmatch(v)
+            else redact(v, keys, salt)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(v, keys, salt) for v in value]
+    return value
+
+
+def _pseudonym(value: str, salt: bytes) -> str:
+    return "r_" + hmac.new(salt, value.encode("utf-8"), hashlib.sha256).hexdigest()[:12]
+
+
+class TrafficCapture:
+    """JSONL-журнал запросов с ротацией; на диск пишет отдельный поток, цикл событий не ждёт."""
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_bytes: int = 100 * 1024 * 1024,
+        backups: int = 5,
+        redact_keys: frozenset[str] = frozenset(),
+        salt: str = "",
+    ) -> None:
+        self._path = pathlib.Path(path)
+        self._max_bytes = max_bytes
+        self._backups = max(1, backups)
+        self._redact_keys = redact_keys
+        # без соли HMAC — открытый хэш: псевдонимы обращаются перебором известных имён и телефонов.
+        # Пустая соль → случайная на эту запись (псевдонимы не совпадут с записями других запусков)
+        self._salt = salt.encode("utf-8") if salt else secrets.token_bytes(32)
+        self._queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        self._logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self.recorded = 0
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            self._path, maxBytes=self._max_bytes, backupCount=self._backups, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger.addHandler(logging.handlers.QueueHandler(self._queue))
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+
+    def stop(self) -> None:
+        # QueueListener.stop дописывает очередь до конца
+        if self._listener is None:
+            return
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._logger.handlers.clear()
+        self._listener = None
+
+    def record(self, path: str, headers: dict[str, str], body: bytes, arrived: float) -> None:
+        text = body.decode("utf-8", errors="replace")
+        if self._redact_keys:
+            # тело переписывается: подпись X-Signature к нему уже не подходит (при воспроизведении — mock-провайдер)
+            try:
+                text = json.dumps(redact(json.loads(text), self._redact_keys, self._salt), ensure_ascii=False, separators=(",", ":"))
+            except ValueError:
+                pass
+        line = json.dumps(
+            {"t": round(arrived, 6), "path": path, "headers": headers, "body": text},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        self._logger.info(line)
+        self.recorded += 1
+
+
+def create_capture(settings: Any) -> TrafficCapture:
+    return TrafficCapture(
+        settings.CAPTURE_PATH,
+        max_bytes=settings.CAPTURE_MAX_MB * 1024 * 1024,
+        backups=settings.CAPTURE_BACKUPS,
+        redact_keys=frozenset(k.strip() for k in settings.CAPTURE_REDACT_KEYS.split(",") if k.strip()),
+        salt=settings.CAPTURE_REDACT_SALT,
+    )
+
+
+class CaptureMiddleware:
+    """ASGI: копия тела запросов CAPTURE_PATHS уходит в app.state.capture, если он задан."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        capture: Optional[TrafficCapture] = None
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in CAPTURE_PATHS:
+            capture = getattr(scope["app"].state, "capture", None)
+        if capture is None:
+            await self.app(scope, receive, send)
+            return
+        arrived = time.time()
+        chunks: list[bytes] = []
+        body: Optional[bytes] = None
+        status: Optional[int] = None
+
+        # тело читает сам обработчик; здесь только копия. Запись — после ответа: запрос,
+        # отклонённый до чтения тела или с 401/403 (FastAPI читает тело до проверки токена), не пишется
+        async def tee() -> dict[str, Any]:
+            nonlocal body
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    body = b"".join(chunks)
+            return message
+
+        async def watch(message: dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, tee, watch)
+        finally:
+            if body is not None and status not in _SKIP_STATUSES:
+                headers = {
+                    k.decode("latin-1").lower(): v.decode("latin-1")
+                    for k, v in scope["headers"]
+                    if k.decode("latin-1").lower() in _KEEP_HEADERS
+                }
+                capture.record(scope["path"], headers, body, arrived)
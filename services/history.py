@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import re
+from typing import Any, Optional
+
+from client import AIClient, FALLBACK_REPLY
+from services.metrics import ERRORS
+from storage.dialogue_store import DialogueStore
+
+logger = logging.getLogger(__name__)
+
+# служебные токены на каждое сообщение в chat-формате (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|[^\W\d_A-Za-z]+|\S", re.UNICODE)
+
+_SUMMARY_PROMPT = (
+    "Ты ведёшь краткую сводку переписки пользователя с ассистентом сервиса знакомств. "
+    "Обнови сводку с учётом новых сообщений: факты о пользователе, его предпочтения, "
+    "договорённости и открытые вопросы. Пиши по-русски, без приветствий, не длиннее 120 слов."
+)
+
+
+def approx_tokens(text: str) -> int:
+    # Локальная оценка без токенизатора: латиница ~4 символа на токен, кириллица и
+    # прочие алфавиты ~3, числа ~3 цифры, знаки препинания — по токену.
+    total = 0
+    for piece in _TOKEN_RE.findall(text):
+        first = piece[0]
+        if first.isascii() and first.isalpha():
+            total += math.ceil(len(piece) / 4)
+        elif first.isalnum():
+            total += math.ceil(len(piece) / 3)
+        else:
+            total += 1
+    return total
+
+
+def message_tokens(message: dict[str, Any]) -> int:
+    return approx_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def fit_history(messages: list[dict[str, Any]], budget: int) -> list[dict[str, Any]]:
+    # с конца берём столько сообщений, сколько помещается в бюджет; последнее — всегда
+    window: list[dict[str, Any]] = []
+    used = 0
+    for message in reversed(messages):
+        cost = message_tokens(message)
+        if window and used + cost > budget:
+            break
+        window.append(message)
+        used += cost
+    window.reverse()
+    return window
+
+
+class HistorySummarizer:
+    """Фоновое обновление сводки сообщений, вышедших из окна истории."""
+
+    def __init__(
+        self,
+        dialogue_store: DialogueStore,
+        ai_client: AIClient,
+        *,
+        min_messages: int = 8,
+        max_batch: int = 200,
+    ) -> None:
+        self._dialogues = dialogue_store
+        self._ai = ai_client
+        self._min_messages = min_messages
+        self._max_batch = max_batch
+        self._tasks: dict[str, asyncio.Task[None]] = {}
+
+    def schedule(self, user_id: str, *, window: list[dict[str, Any]], fetched: list[dict[str, Any]], summary: Optional[dict[str, Any]]) -> None:
+        # Решение принимается по уже загруженным данным, без запросов к БД:
+        # всё, что старше первого сообщения окна и новее сводки, ждёт сжатия.
+        if user_id in self._tasks or not window or window[0].get("id") is None:
+            return
+        boundary = int(window[0]["id"])
+        covered = int(summary["covered_until_id"]) if summary else 0
+        dropped = sum(1 for m in fetched if m.get("id") is not None and covered < m["id"] < boundary)
+        if dropped < self._min_messages:
+            return
+        previous = summary["summary"] if summary else None
+        task = asyncio.create_task(self._refresh(user_id, previous, covered, boundary), name=f"summary-{user_id}")
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+
+    async def _refresh(self, user_id: str, previous: Optional[str], covered: int, boundary: int) -> None:
+        # первая сводка — только по последним max_batch сообщениям перед окном: проход по
+        # всей давней истории пачками стоил бы десятков последовательных запросов к LLM
+        newest = covered == 0
+        try:
+            while covered < boundary - 1:
+                batch = await self._dialogues.get_messages_between(
+                    user_id, after_id=covered, before_id=boundary, limit=self._max_batch, newest=newest
+                )
+                newest = False
+                if not batch:
+                    return
+                lines = [f"{m['role']}: {m['content']}" for m in batch]
+                request = ("Текущая сводка:\n" + previous + "\n\n" if previous else "") + "Новые сообщения:\n" + "\n".join(lines)
+                summary = (await self._ai.generate_reply(system_prompt=_SUMMARY_PROMPT, history=[{"role": "user", "content": request}], call="summary")).strip()
+                if not summary or summary == FALLBACK_REPLY:
+                    return
+                covered = int(batch[-1]["id"])
+                await self._dialogues.save_summary(user_id, summary, covered)
+                previous = summary
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            ERRORS.inc("history_summary")
+            logger.exception("summary refresh failed for user %s", user_id)
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import httpx
+
+
+def create_http_client(
+    *,
+    timeout: float = 10.0,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    http2: bool = True,
+) -> httpx.AsyncClient:
+    # один долгоживущий клиент на приложение: пул соединений, keep-alive и HTTP/2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(timeout),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator, Optional
+
+_WS = re.compile(r"[ \t\r\n]*")
+# символы, которыми может продолжиться число
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+def _parse_line(line: str) -> tuple[Optional[Any], Optional[str]]:
+    try:
+        return json.loads(line), None
+    except ValueError as exc:
+        return None, f"invalid json: {exc}"
+
+
+async def iter_json_records(
+    chunks: AsyncIterator[bytes],
+    *,
+    max_record_size: int = 1 << 20,
+) -> AsyncIterator[tuple[Optional[Any], Optional[str]]]:
+    # Разбирает тело по мере поступления: JSON-массив или NDJSON (по первому символу).
+    # Отдаёт (запись, None) или (None, ошибка) для битой строки NDJSON; в буфере —
+    # не больше одной незаконченной записи. JsonStreamError — дальше разбирать нельзя.
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    mode: Optional[str] = None  # "array" | "ndjson"
+    expect_comma = False
+    after_comma = False  # последним разобран ',' — дальше обязателен элемент, не ']'
+    closed = False
+    done = False
+    iterator = chunks.__aiter__()
+    while not done:
+        try:
+            try:
+                buf += utf8.decode(await iterator.__anext__())
+            except StopAsyncIteration:
+                buf += utf8.decode(b"", final=True)
+                done = True
+        except UnicodeDecodeError as exc:
+            raise JsonStreamError(f"invalid utf-8: {exc}") from None
+
+        if mode is None:
+            buf = buf.lstrip()
+            if not buf:
+                continue
+            if buf[0] == "[":
+                mode, buf = "array", buf[1:]
+            else:
+                mode = "ndjson"
+
+        if mode == "ndjson":
+            lines = buf.split("\n")
+            buf = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(line)
+            if done and buf.strip():
+                yield _parse_line(buf)
+                buf = ""
+        else:
+            pos = 0
+            while not closed:
+                pos = _WS.match(buf, pos).end()  # type: ignore[union-attr]
+                if pos == len(buf):
+                    break
+                if expect_comma or buf[pos] == "]":
+                    if buf[pos] == "]":
+                        if after_comma:
+                            raise JsonStreamError("trailing ',' before ']'")
+                        closed = True
+                    elif buf[pos] != ",":
+                        raise JsonStreamError("expected ',' or ']' between array items")
+                    else:
+                        after_comma = True
+                    expect_comma = False
+                    pos += 1
+                    continue
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except ValueError as exc:
+                    # незаконченный элемент ждёт следующего куска
+                    if done:
+                        raise JsonStreamError(f"invalid json: {exc}") from None
+                    break
+                tail = _NUMBER_TAIL.match(buf, end).end()  # type: ignore[union-attr]
+                if not done and not isinstance(value, (dict, list, str)) and tail == len(buf):
+                    # число у края буфера («12», «1.», «2e») может продолжиться в следующем куске
+                    break
+                pos = end
+                expect_comma = True
+                after_comma = False
+                yield value, None
+            buf = buf[pos:]
+            if closed and buf.strip():
+                raise JsonStreamError("unexpected data after json array")
+            if done and not closed:
+                raise JsonStreamError("unterminated json array")
+
+        if len(buf) > max_record_size:
+            raise JsonStreamError("record too large")
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import Counter, deque
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from openai import APIConnectionError
+
+from services.ai_providers import ChatProvider, Messages
+
+# Защита провайдера LLM: адаптивный (AIMD) предел одновременных запросов, автомат-выключатель
+# и повторы с учётом Retry-After. Перегрузка (429/5xx, обрыв соединения, ответ дольше цели)
+# уменьшает предел вдвое, быстрые ответы под нагрузкой — увеличивают на единицу за «окно».
+# Выключатель считает ошибки сервиса (5xx, обрывы), но не 429 и не ошибки самого запроса (4xx).
+
+T = TypeVar("T")
+
+# 4xx, после которых повтор имеет смысл; остальные 4xx — ошибка самого запроса, не сервиса
+_TRANSIENT_4XX = frozenset({408, 409, 429})
+
+
+class LLMUnavailable(Exception):
+    """Запрос к LLM не отправлен: выключатель разомкнут или очередь к провайдеру переполнена."""
+
+
+class CircuitOpenError(LLMUnavailable):
+    pass
+
+
+class LimiterFullError(LLMUnavailable):
+    pass
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        *,
+        initial: int = 16,
+        minimum: int = 1,
+        maximum: int = 64,
+        latency_target: float = 10.0,
+        backoff: float = 0.5,
+        max_queue: int = 200,
+    ) -> None:
+        self._min = max(1, minimum)
+        self._max = max(self._min, maximum)
+        self.limit = float(min(max(initial, self._min), self._max))
+        self._latency_target = latency_target
+        self._backoff = backoff
+        self._max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        # сглаженная задержка: не уменьшаем предел чаще раза за неё — ответы, начатые
+        # до прошлого уменьшения, о новой нагрузке ещё ничего не говорят
+        self._rtt = 0.0
+        self._last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self._max_queue:
+            raise LimiterFullError(f"{len(self._waiters)} LLM requests already queued")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # место уже выдано, а ждавший отменён — отдаём следующему
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency: Optional[float], overloaded: bool) -> None:
+        # latency — None, если ответа не было (ошибка, отмена)
+        self.in_flight -= 1
+        now = time.monotonic()
+        if latency is not None:
+            self._rtt = latency if not self._rtt else 0.8 * self._rtt + 0.2 * latency
+        if overloaded or (latency is not None and latency > self._latency_target):
+            if now - self._last_decrease >= self._rtt and self.limit > self._min:
+                self.limit = max(float(self._min), self.limit * self._backoff)
+                self._last_decrease = now
+                self.decreases += 1
+        elif latency is not None and self.in_flight + 1 >= int(self.limit):
+            # растём, только когда предел действительно выбран
+            new_limit = min(float(self._max), self.limit + 1.0 / self.limit)
+            if int(new_limit) > int(self.limit):
+                self.increases += 1
+            self.limit = new_limit
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, *, failures: int = 5, cooldown: float = 30.0) -> None:
+        self._threshold = max(1, failures)
+        self._cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._open_until = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() >= self._open_until:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probing:
+            # после паузы пропускаем один пробный запрос
+            self._probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def failure(self, retry_after: Optional[float] = None) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self._threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self._open_until = time.monotonic() + max(self._cooldown, retry_after or 0.0)
+
+    def abandon(self) -> None:
+        # пробный запрос отменён или упал не по вине сервиса — пробуем снова следующим
+        self._probing = False
+
+    def retry_in(self) -> float:
+        return max(0.0, self._open_until - time.monotonic()) if self.state == self.OPEN else 0.0
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    # Retry-After в секундах или HTTP-датой; у OpenAI ещё retry-after-ms
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class GuardedProvider(ChatProvider):
+    """Провайдер за пределом одновременных запросов и выключателем; повторяет 429/5xx с учётом Retry-After."""
+
+    def __init__(
+        self,
+        provider: ChatProvider,
+        role: str,
+        *,
+        limiter: AdaptiveLimiter,
+        breaker: CircuitBreaker,
+        retries: int = 2,
+        max_retry_wait: float = 20.0,
+    ) -> None:
+        self._provider = provider
+        self.name = provider.name
+        self.role = role
+        self.limiter = limiter
+        self.breaker = breaker
+        self._retries = retries
+        self._max_retry_wait = max_retry_wait
+        self.retries = 0
+        self.rejected: Counter[str] = Counter()
+
+    async def _enter(self) -> None:
+        if not self.breaker.allow():
+            self.rejected["circuit_open"] += 1
+            raise CircuitOpenError(f"{self.role} LLM circuit open for {self.breaker.retry_in():.1f}s")
+        try:
+            await self.limiter.acquire()
+        except BaseException as exc:
+            self.breaker.abandon()
+            if isinstance(exc, LimiterFullError):
+                self.rejected["queue_full"] += 1
+            raise
+
+    def _failed(self, exc: Exception, attempt: int, *, retry: bool) -> tuple[bool, Optional[float]]:
+        # → (перегрузка ли это, пауза перед повтором или None — не повторять)
+        status = getattr(exc, "status_code", None)
+        if isinstance(status, int) and 400 <= status < 500 and status not in _TRANSIENT_4XX:
+            return False, None
+        transient = isinstance(status, int) or isinstance(exc, APIConnectionError)
+        wait = retry_after(exc)
+        if transient and status != 429:
+            self.breaker.failure(wait)
+        else:
+            # 429 — сервис жив, это мы шлём слишком много (дело предела); прочие исключения —
+            # ошибка у нас, а не отказ сервиса
+            self.breaker.abandon()
+        if not (transient and retry) or attempt >= self._retries:
+            return transient, None
+        # без Retry-After — экспоненциальная пауза со случайным разбросом
+        delay = wait if wait is not None else 0.5 * 2 ** attempt * random.uniform(0.5, 1.0)
+        if delay > self._max_retry_wait:
+            return transient, None
+        self.retries += 1
+        return transient, delay
+
+    async def _call(self, call: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            await self._enter()
+            started = time.monotonic()
+            latency: Optional[float] = None
+            overloaded = False
+            try:
+                result = await call()
+                latency = time.monotonic() - started
+                self.breaker.success()
+                return result
+            except Exception as exc:
+                overloaded, delay = self._failed(exc, attempt, retry=True)
+                if delay is None:
+                    raise
+            finally:
+                self.breaker.abandon()
+                self.limiter.release(latency, overloaded)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def complete(self, messages: Messages) -> str:
+        return await self._call(lambda: self._provider.complete(messages))
+
+    async def stream(self, messages: Messages) -> AsyncIterator[str]:
+        # место в пределе занято весь поток; задержка для AIMD — до первого куска.
+        # Повтор — только пока пользователь ещё ничего не получил
+        attempt = 0
+        while True:
+            await self._enter()
+            chunks = self._provider.stream(messages)
+            started = time.monotonic()
+            latency: Optional[float] = None
+            overloaded = False
+            try:
+                try:
+                    first: Optional[str] = await chunks.__anext__()
+                except StopAsyncIteration:
+                    first = None
+                latency = time.monotonic() - started
+                self.breaker.success()
+                if first is not None:
+                    yield first
+                    async for chunk in chunks:
+                        yield chunk
+                return
+            except Exception as exc:
+                overloaded, delay = self._failed(exc, attempt, retry=latency is None)
+                if delay is None:
+                    raise
+            finally:
+                self.breaker.abandon()
+                self.limiter.release(latency, overloaded)
+                await chunks.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        await self._provider.close()
+
+    def state(self) -> dict[str, Any]:
+        return {
+            "provider": self.name,
+            "limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "queued": self.limiter.queued,
+            "limit_increases": self.limiter.increases,
+            "limit_decreases": self.limiter.decreases,
+            "circuit": self.breaker.state,
+            "circuit_retry_in": round(self.breaker.retry_in(), 1),
+            "consecutive_failures": self.breaker.failures,
+            "circuit_opened": self.breaker.opened,
+            "retries": self.retries,
+            "rejected": dict(self.rejected),
+        }
+
+
+def guard_provider(provider: ChatProvider, role: str, settings: Any) -> GuardedProvider:
+    return GuardedProvider(
+        provider,
+        role,
+        limiter=AdaptiveLimiter(
+            initial=settings.AI_CONCURRENCY_INITIAL,
+            minimum=settings.AI_CONCURRENCY_MIN,
+            maximum=settings.AI_CONCURRENCY_MAX,
+            latency_target=settings.AI_LATENCY_TARGET_MS / 1000,
+            max_queue=settings.AI_QUEUE_MAX,
+        ),
+        breaker=CircuitBreaker(failures=settings.AI_BREAKER_FAILURES, cooldown=settings.AI_BREAKER_COOLDOWN_SECONDS),
+        retries=settings.AI_RETRIES,
+        max_retry_wait=settings.AI_RETRY_MAX_WAIT_SECONDS,
+    )
+
+
+def guard_background(guarded: GuardedProvider, settings: Any) -> GuardedProvider:
+    # фоновые вызовы (сводки) — тот же провайдер и выключатель, но свой небольшой постоянный
+    # предел и очередь: их поток не вытесняет ответы пользователям и не переполняет AI_QUEUE_MAX
+    size = settings.AI_BACKGROUND_CONCURRENCY
+    return GuardedProvider(
+        guarded._provider,
+        "background",
+        limiter=AdaptiveLimiter(initial=size, minimum=size, maximum=size, max_queue=settings.AI_BACKGROUND_QUEUE_MAX),
+        breaker=guarded.breaker,
+        retries=settings.AI_RETRIES,
+        max_retry_wait=settings.AI_RETRY_MAX_WAIT_SECONDS,
+    )
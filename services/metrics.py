@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import math
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Optional
+
+# Метрики в формате Prometheus (text exposition 0.0.4) без внешних зависимостей.
+# На горячем пути — только словарь по кортежу меток, bisect и сложение; всё форматирование — в render().
+
+LabelValues = tuple[str, ...]
+# колбэк метрики: число (без меток) или {значения меток: число}
+MetricCallback = Callable[[], "float | dict[LabelValues, float]"]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# ожидание блокировки: обычно доли миллисекунды
+LOCK_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, help: str, labelnames: tuple[str, ...] = (), *, callback: Optional[MetricCallback] = None
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._callback = callback
+        self._values: dict[LabelValues, float] = {}
+
+    def _current(self) -> dict[LabelValues, float]:
+        if self._callback is None:
+            return self._values
+        value = self._callback()
+        return value if isinstance(value, dict) else {(): float(value)}
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], LabelValues, float]]:
+        for labels, value in sorted(self._current().items()):
+            yield self.name, self.labelnames, labels, value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: tuple[str, ...] = (), *, buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self._bounds = tuple(sorted(buckets))
+        # метки → [счётчики по корзинам (последняя — +Inf), сумма]
+        self._series: dict[LabelValues, list[Any]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self._bounds) + 1), 0.0]
+        series[0][bisect_left(self._bounds, value)] += 1
+        series[1] += value
+
+    def totals(self, *labels: str) -> tuple[int, float]:
+        series = self._series.get(labels)
+        return (sum(series[0]), series[1]) if series else (0, 0.0)
+
+    def quantile(self, q: float, *labels: str) -> float:
+        # оценка по корзинам (как histogram_quantile в Prometheus): линейно внутри корзины
+        series = self._series.get(labels)
+        if not series:
+            return 0.0
+        counts = series[0]
+        rank = q * sum(counts)
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                if i == len(self._bounds):
+                    return self._bounds[-1]
+                lower = self._bounds[i - 1] if i else 0.0
+                return lower + (self._bounds[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return 0.0
+
+    def clear(self) -> None:
+        self._series.clear()
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], LabelValues, float]]:
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self._bounds + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", names, labels + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labelnames, labels, total
+            yield f"{self.name}_count", self.labelnames, labels, cumulative
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        # метки всех рядов процесса (worker при запуске за front.py)
+        self.const_labels: dict[str, str] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # повторная регистрация с тем же именем заменяет метрику (колбэки нового lifespan)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = (), *, callback: Optional[MetricCallback] = None) -> Counter:
+        return self.register(Counter(name, help, labelnames, callback=callback))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = (), *, callback: Optional[MetricCallback] = None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, callback=callback))  # type: ignore[return-value]
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), *, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets=buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        const_names = tuple(self.const_labels)
+        const_values = tuple(self.const_labels.values())
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labelnames, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(const_names + labelnames, const_values + labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_expositions(texts: Iterable[str]) -> str:
+    # ответы нескольких процессов → один: ряды одной метрики должны идти подряд после её HELP/TYPE
+    families: dict[str, list[str]] = {}
+    for text in texts:
+        current: Optional[list[str]] = None
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                name = line.split(" ", 3)[2]
+                current = families.get(name)
+                if current is None:
+                    current = families[name] = [line]
+            elif line.startswith("# TYPE "):
+                if current is not None and len(current) == 1:
+                    current.append(line)
+            elif line and current is not None:
+                current.append(line)
+    return "\n".join(line for lines in families.values() for line in lines) + "\n"
+
+
+REGISTRY = Registry()
+
+UPDATE_SECONDS = REGISTRY.histogram(
+    "bot_update_handle_seconds", "Time to handle one Telegram update (aiogram handlers).", ("outcome",)
+)
+STORE_SECONDS = REGISTRY.histogram("bot_store_call_seconds", "Latency of storage calls.", ("store", "method"))
+LLM_SECONDS = REGISTRY.histogram("bot_llm_request_seconds", "Latency of LLM requests.", ("call", "outcome"))
+LLM_HEDGES = REGISTRY.counter(
+    "bot_llm_hedges_total", "Backup LLM requests: hedge fired, fallback after a primary error, backup answered first.", ("event",)
+)
+LLM_TOKENS = REGISTRY.histogram("bot_llm_tokens", "Tokens per LLM request.", ("kind",), buckets=TOKEN_BUCKETS)
+TELEGRAM_SECONDS = REGISTRY.histogram(
+    "bot_telegram_request_seconds", "Latency of Telegram Bot API requests.", ("method", "outcome")
+)
+DB_LOCK_WAIT_SECONDS = REGISTRY.histogram(
+    "bot_db_lock_wait_seconds", "Time spent waiting for the SQLite writer lock or a reader connection.", ("lock",),
+    buckets=LOCK_BUCKETS,
+)
+ERRORS = REGISTRY.counter("bot_errors_total", "Errors that were handled without failing the request.", ("site",))
+
+
+def instrument_methods(obj: Any, store: str, histogram: Histogram = STORE_SECONDS) -> Any:
+    # оборачивает публичные async-методы экземпляра: время каждого вызова → histogram{store, method}
+    for name, method in inspect.getmembers(obj, inspect.iscoroutinefunction):
+        if name.startswith("_") or name in {"init", "close"}:
+            continue
+        setattr(obj, name, _timed(method, histogram, store, name))
+    return obj
+
+
+def _timed(method: Callable[..., Awaitable[Any]], histogram: Histogram, *labels: str) -> Callable[..., Awaitable[Any]]:
+    @functools.wraps(method)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started, *labels)
+
+    return wrapper
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from services.payment_provider import PaymentProvider
+from storage.match_store import MatchStore
+
+CONTACT_PRICE_RUB = 1000
+
+
+class PaymentsService:
+    def __init__(self, match_store: MatchStore, provider: PaymentProvider) -> None:
+        self._matches = match_store
+        self.provider = provider
+
+    async def create_invoice_for_match(self, match_id: int) -> str:
+        invoice_url = await self.provider.create_invoice(
+            match_id=match_id,
+            amount_rub=CONTACT_PRICE_RUB,
+            description=f"Access to contact for match {match_id}",
+        )
+        await self._matches.set_invoice_url(match_id, invoice_url)
+        return invoice_url
+
+    async def mark_paid(self, match_id: int) -> None:
+        await self._matches.mark_paid(match_id)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Optional
+
+import aiosqlite
+import httpx
+
+from services.metrics import ERRORS
+from storage.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileOutbox:
+    """Надёжная доставка анкет в основной бот: запись в outbox вместе с профилем, отправка в фоне."""
+
+    def __init__(
+        self,
+        db: Database,
+        http_client: httpx.AsyncClient,
+        *,
+        url: str,
+        auth_token: str,
+        batch_size: int = 50,
+        concurrency: int = 8,
+        poll_interval: float = 5.0,
+        base_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        max_attempts: int = 20,
+    ) -> None:
+        self._db = db
+        self._http = http_client
+        self._url = url
+        self._headers = {"Authorization": f"Bearer {auth_token}"}
+        self._batch_size = max(1, batch_size)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._poll_interval = poll_interval
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._max_attempts = max(1, max_attempts)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._closing = False
+
+    async def enqueue(self, conn: aiosqlite.Connection, user_id: str, payload: dict[str, Any]) -> None:
+        # вызывается внутри транзакции записи профиля: анкета и задача на отправку коммитятся вместе
+        await conn.execute(
+            "INSERT OR REPLACE INTO profile_outbox (user_id, payload, next_attempt_at) VALUES (?, ?, ?)",
+            (user_id, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def init(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="profile-outbox")
+
+    async def close(self, timeout: float = 5.0) -> None:
+        # неотправленное остаётся в таблице и уйдёт после перезапуска
+        self._closing = True
+        self._wakeup.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                sent = await self.dispatch_once()
+            except Exception:
+                ERRORS.inc("profile_outbox")
+                logger.exception("profile outbox dispatch failed")
+                sent = 0
+            if sent >= self._batch_size:
+                continue
+            delay = await self._next_delay()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+
+    async def _next_delay(self) -> float:
+        row = await self._db.fetchone("SELECT MIN(next_attempt_at) FROM profile_outbox")
+        if not row or row[0] is None:
+            return self._poll_interval
+        return min(self._poll_interval, max(0.0, row[0] - time.time()))
+
+    async def dispatch_once(self) -> int:
+        # одна пачка: до batch_size готовых записей, отправка параллельно, итог — одной транзакцией
+        rows = await self._db.fetchall(
+            "SELECT id, payload, attempts FROM profile_outbox WHERE next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?",
+            (time.time(), self._batch_size),
+        )
+        if not rows:
+            return 0
+        results = await asyncio.gather(*(self._send(row[1]) for row in rows))
+
+        done: list[tuple[int]] = []
+        retry: list[tuple[Optional[float], str, int]] = []
+        now = time.time()
+        for (row_id, _, attempts), (ok, error, retry_after) in zip(rows, results):
+            if ok:
+                done.append((row_id,))
+                continue
+            attempts += 1
+            if attempts >= self._max_attempts:
+                logger.error("profile outbox gave up on row %s after %d attempts: %s", row_id, attempts, error)
+                retry.append((None, error, row_id))
+                continue
+            # экспоненциальная пауза с джиттером; Retry-After от сервера — нижняя граница
+            backoff = min(self._max_backoff, self._base_backoff * 2 ** (attempts - 1))
+            backoff = max(backoff * random.uniform(0.5, 1.0), retry_after or 0.0)
+            retry.append((now + backoff, error, row_id))
+
+        # если анкету успели обновить, у новой записи другой id — её не удалим и отправим позже
+        async with self._db.transaction() as conn:
+            if done:
+                await conn.executemany("DELETE FROM profile_outbox WHERE id = ?", done)
+            if retry:
+                await conn.executemany(
+                    "UPDATE profile_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    retry,
+                )
+        if retry:
+            logger.warning("profile outbox: %d sent, %d failed", len(done), len(retry))
+        return len(rows)
+
+    async def _send(self, payload: str) -> tuple[bool, str, Optional[float]]:
+        async with self._semaphore:
+            try:
+                resp = await self._http.post(
+                    self._url,
+                    content=payload,
+                    headers={**self._headers, "Content-Type": "application/json"},
+                )
+            except httpx.HTTPError as exc:
+                return False, f"{type(exc).__name__}: {exc}", None
+        if resp.is_success:
+            return True, "", None
+        retry_after: Optional[float] = None
+        try:
+            retry_after = float(resp.headers.get("Retry-After", ""))
+        except ValueError:
+            pass
+        return False, f"HTTP {resp.status_code}", retry_after
+
+    async def stats(self) -> dict[str, int]:
+        row = await self._db.fetchone(
+            "SELECT COUNT(*), COALESCE(SUM(next_attempt_at IS NULL), 0), COALESCE(SUM(attempts > 0), 0) FROM profile_outbox"
+        )
+        total, dead, retrying = row if row else (0, 0, 0)
+        return {"pending": total - dead, "retrying": retrying - dead, "dead": dead}
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+import time
+import zlib
+from typing import Any, Iterable
+
+import numpy as np
+
+from storage.profile_index import normalize_age, normalize_text, split_languages
+from storage.profile_store import ProfileStore
+
+logger = logging.getLogger(__name__)
+
+# Ответы анкеты (create_profile_finish) → уровни 0..1; ищем по началу ответа, по порядку.
+_LEVELS: dict[str, tuple[tuple[str, float], ...]] = {
+    "religiosity": (("начал", 0.0), ("сред", 0.5), ("высок", 1.0)),
+    "prayer": (("регуляр", 1.0), ("соверш", 1.0), ("всегда", 1.0), ("иногда", 0.5), ("нет", 0.0), ("не ", 0.0)),
+    "halal": (("строго", 1.0), ("в основном", 0.66), ("основн", 0.66), ("стараюсь", 0.33), ("нет", 0.0)),
+    "smoking": (("нет", 0.0), ("не ", 0.0), ("иногда", 0.5), ("редко", 0.5), ("да", 1.0)),
+    "alcohol": (("нет", 0.0), ("не ", 0.0), ("иногда", 0.5), ("редко", 0.5), ("да", 1.0)),
+    "children": (("нет", 0.0), ("есть", 1.0)),
+    "marital_status": (("холост", 0.0), ("незамуж", 0.0), ("не был", 0.0), ("развед", 1.0), ("вдов", 1.0)),
+}
+_LEVEL_FIELDS = tuple(_LEVELS)
+
+# столбцы матрицы: возраст, код города, код страны, уровни, языки (хэшированный multi-hot);
+# неизвестное значение — NaN (слагаемое даёт 0), у языков — нули
+_AGE, _CITY, _COUNTRY = 0, 1, 2
+_LEVEL_START = 3
+_LANG_START = _LEVEL_START + len(_LEVEL_FIELDS)
+LANGUAGE_BUCKETS = 32
+FEATURES = _LANG_START + LANGUAGE_BUCKETS
+
+# веса слагаемых оценки; максимум суммы — 1.0
+WEIGHTS = {
+    "age": 0.25,
+    "city": 0.15,
+    "country": 0.05,
+    "languages": 0.15,
+    "religiosity": 0.1,
+    "prayer": 0.1,
+    "halal": 0.05,
+    "smoking": 0.05,
+    "alcohol": 0.05,
+    "children": 0.025,
+    "marital_status": 0.025,
+}
+AGE_TOLERANCE = 10.0  # разница в годах, при которой вклад возраста падает до нуля
+
+_LEVEL_WEIGHTS = np.array([WEIGHTS[field] for field in _LEVEL_FIELDS], dtype=np.float32)
+
+_GENDERS = {"male": 1, "female": 2}
+
+
+def _level(field: str, value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = normalize_text(value)
+    if not text:
+        return float("nan")
+    if field == "children" and text[0].isdigit():
+        # «2», «2 ребёнка»
+        return 0.0 if text.split()[0].strip(".,") in {"0", "0.0"} else 1.0
+    for prefix, level in _LEVELS[field]:
+        if text.startswith(prefix):
+            return level
+    return float("nan")
+
+
+class Recommender:
+    """Подбор кандидатов противоположного пола: все оценки за один векторный проход по матрице анкет."""
+
+    def __init__(self, *, initial_capacity: int = 1024) -> None:
+        # хранение по столбцам: оценка читает столбцы целиком, запись строки — редкая операция
+        self._x = np.full((max(1, initial_capacity), FEATURES), np.nan, dtype=np.float32, order="F")
+        self._gender = np.zeros(max(1, initial_capacity), dtype=np.int8)
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._places: dict[str, int] = {}  # город/страна → код
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._rows
+
+    def _place(self, value: Any) -> float:
+        text = normalize_text(value)
+        if not text:
+            return float("nan")
+        return float(self._places.setdefault(text, len(self._places)))
+
+    def encode(self, profile: dict[str, Any]) -> np.ndarray:
+        attrs = profile.get("attributes") or {}
+        row = np.full(FEATURES, np.nan, dtype=np.float32)
+        age = normalize_age(attrs.get("age"))
+        if age is not None:
+            row[_AGE] = age
+        row[_CITY] = self._place(attrs.get("city"))
+        row[_COUNTRY] = self._place(attrs.get("country"))
+        for i, field in enumerate(_LEVEL_FIELDS):
+            row[_LEVEL_START + i] = _level(field, attrs.get(field))
+        row[_LANG_START:] = 0.0
+        for lang in split_languages(attrs.get("languages")):
+            row[_LANG_START + zlib.crc32(lang.encode("utf-8")) % LANGUAGE_BUCKETS] = 1.0
+        return row
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._gender)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        x = np.full((capacity, FEATURES), np.nan, dtype=np.float32, order="F")
+        x[: len(self._ids)] = self._x[: len(self._ids)]
+        gender = np.zeros(capacity, dtype=np.int8)
+        gender[: len(self._ids)] = self._gender[: len(self._ids)]
+        self._x, self._gender = x, gender
+
+    def update(self, profiles: Iterable[dict[str, Any]]) -> None:
+        # точечное обновление строк (слушатель ProfileStore); новые анкеты — в конец матрицы
+        for profile in profiles:
+            user_id = profile["user_id"]
+            row = self._rows.get(user_id)
+            if row is None:
+                row = len(self._ids)
+                self._grow(row + 1)
+                self._ids.append(user_id)
+                self._rows[user_id] = row
+            self._x[row] = self.encode(profile)
+            self._gender[row] = _GENDERS.get((profile.get("gender") or "").lower(), 0)
+
+    async def load(self, store: ProfileStore, batch_size: int = 1000) -> None:
+        started = time.monotonic()
+        batch: list[dict[str, Any]] = []
+        async for profile in store.iter_profiles(batch_size=batch_size):
+            batch.append(profile)
+            if len(batch) >= batch_size:
+                self.update(batch)
+                batch.clear()
+        self.update(batch)
+        logger.info("recommender loaded %d profiles in %.2fs", len(self._ids), time.monotonic() - started)
+
+    def suggest(self, user_id: str, k: int = 10, *, exclude: Iterable[str] = ()) -> list[tuple[str, float]]:
+        row = self._rows.get(user_id)
+        if row is None or self._gender[row] == 0 or k <= 0:
+            return []
+        n = len(self._ids)
+        x = self._x[:n]
+        me = self._x[row]
+        # нет ответа у одной из сторон — NaN, после nan_to_num слагаемое нейтрально (0)
+        levels = np.abs(x[:, _LEVEL_START:_LANG_START] - me[_LEVEL_START:_LANG_START])
+        np.subtract(1.0, levels, out=levels)
+        score = np.nan_to_num(levels, copy=False) @ _LEVEL_WEIGHTS
+        age = np.abs(x[:, _AGE] - me[_AGE])
+        age *= -WEIGHTS["age"] / AGE_TOLERANCE
+        age += WEIGHTS["age"]
+        score += np.nan_to_num(np.maximum(age, 0.0), copy=False)
+        score += WEIGHTS["city"] * (x[:, _CITY] == me[_CITY])
+        score += WEIGHTS["country"] * (x[:, _COUNTRY] == me[_COUNTRY])
+        shared = x[:, _LANG_START:] @ me[_LANG_START:]
+        score += np.minimum(shared, 2.0) * (WEIGHTS["languages"] / 2.0)
+
+        candidates = self._gender[:n] == (3 - self._gender[row])
+        candidates[row] = False
+        for other in exclude:
+            other_row = self._rows.get(other)
+            if other_row is not None:
+                candidates[other_row] = False
+        score = np.where(candidates, score, -np.inf)
+
+        count = min(k, int(candidates.sum()))
+        if count == 0:
+            return []
+        top = np.argpartition(-score, count - 1)[:count]
+        top = top[np.argsort(-score[top], kind="stable")]
+        return [(self._ids[i], round(float(score[i]), 4)) for i in top]
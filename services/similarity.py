@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+import zlib
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from storage.profile_store import ProfileStore
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_GENDERS = {"male": 1, "female": 2}
+
+
+def profile_text(profile: dict[str, Any]) -> str:
+    # «о себе» и списки интересов: из анкеты этого бота (hobbies) и из Bot A (bio, interests)
+    attrs = profile.get("attributes") or {}
+    parts: list[str] = []
+    for value in (profile.get("bio"), attrs.get("bio"), attrs.get("hobbies"), attrs.get("interests")):
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, list):
+            parts += [str(v) for v in value if v]
+    return " ".join(dict.fromkeys(parts))
+
+
+class SimilarityIndex:
+    """Похожие анкеты по тексту: хэшированные символьные n-граммы, косинус полным перебором."""
+
+    def __init__(
+        self,
+        *,
+        dimensions: int = 256,
+        ngram: int = 3,
+        path: Optional[str] = None,
+        initial_capacity: int = 1024,
+        block_rows: int = 65536,
+    ) -> None:
+        self._dim = dimensions
+        self._ngram = ngram
+        # path — матрица в memory-mapped файле (страницы держит ОС, а не куча процесса);
+        # файл пересобирается при запуске, между запусками не переиспользуется
+        self._path = path
+        self._block_rows = block_rows
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        # слова в анкетах сильно повторяются: хэши n-грамм слова считаем один раз
+        self._word_cache: dict[str, np.ndarray] = {}
+        self._word_cache_size = 100_000
+        self._gender = np.zeros(max(1, initial_capacity), dtype=np.int8)
+        self._x = self._allocate(max(1, initial_capacity))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._rows
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if self._path is None:
+            return np.zeros((capacity, self._dim), dtype=np.float32)
+        with open(self._path, "ab") as f:
+            f.truncate(capacity * self._dim * 4)
+        return np.memmap(self._path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._gender)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        gender = np.zeros(capacity, dtype=np.int8)
+        gender[: len(self._ids)] = self._gender[: len(self._ids)]
+        self._gender = gender
+        if self._path is None:
+            x = np.zeros((capacity, self._dim), dtype=np.float32)
+            x[: len(self._ids)] = self._x[: len(self._ids)]
+            self._x = x
+        else:
+            # файл удлиняется на месте, записанные строки остаются где были
+            self._x.flush()  # type: ignore[attr-defined]
+            self._x = self._allocate(capacity)
+
+    def _word_hashes(self, word: str) -> np.ndarray:
+        hashes = self._word_cache.get(word)
+        if hashes is None:
+            padded = f"<{word}>"
+            n = self._ngram
+            grams = [padded] + [padded[i : i + n] for i in range(max(1, len(padded) - n + 1))]
+            hashes = np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype=np.uint32)
+            if len(self._word_cache) >= self._word_cache_size:
+                self._word_cache.clear()
+            self._word_cache[word] = hashes
+        return hashes
+
+    def encode(self, text: str) -> np.ndarray:
+        # слово целиком и его n-граммы с границами («<кни», «ниг», «иги», «ги>») → корзины по crc32;
+        # знак из старшего бита снижает смещение от коллизий; tf сублинейный, вектор нормирован
+        vector = np.zeros(self._dim, dtype=np.float32)
+        words = _WORD_RE.findall(text.casefold())
+        if not words:
+            return vector
+        hashes = np.concatenate([self._word_hashes(w) for w in words])
+        signs = np.where(hashes >> 31, -1.0, 1.0)
+        counts = np.bincount(hashes % self._dim, weights=signs, minlength=self._dim)
+        vector[:] = np.sign(counts) * np.log1p(np.abs(counts))
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def update(self, profiles: Iterable[dict[str, Any]]) -> None:
+        # слушатель ProfileStore: пересчитываются только записанные анкеты
+        for profile in profiles:
+            user_id = profile["user_id"]
+            row = self._rows.get(user_id)
+            if row is None:
+                row = len(self._ids)
+                self._grow(row + 1)
+                self._ids.append(user_id)
+                self._rows[user_id] = row
+            self._x[row] = self.encode(profile_text(profile))
+            self._gender[row] = _GENDERS.get((profile.get("gender") or "").lower(), 0)
+
+    async def load(self, store: ProfileStore, batch_size: int = 1000) -> None:
+        started = time.monotonic()
+        batch: list[dict[str, Any]] = []
+        async for profile in store.iter_profiles(batch_size=batch_size):
+            batch.append(profile)
+            if len(batch) >= batch_size:
+                self.update(batch)
+                batch.clear()
+        self.update(batch)
+        logger.info(
+            "similarity index loaded %d profiles in %.2fs (%s)",
+            len(self._ids),
+            time.monotonic() - started,
+            f"mmap {self._path}" if self._path else "in memory",
+        )
+
+    def similar_many(
+        self, user_ids: list[str], k: int = 10, *, gender: Optional[str] = None
+    ) -> dict[str, list[tuple[str, float]]]:
+        # пачка запросов одним проходом: блок строк матрицы × все векторы запросов
+        rows = [self._rows[u] for u in user_ids if u in self._rows]
+        result: dict[str, list[tuple[str, float]]] = {u: [] for u in user_ids}
+        n = len(self._ids)
+        if not rows or k <= 0 or n == 0:
+            return result
+        queries = np.asarray(self._x[rows]).T  # (dim, q)
+        scores = np.empty((n, len(rows)), dtype=np.float32)
+        for start in range(0, n, self._block_rows):
+            stop = min(n, start + self._block_rows)
+            np.matmul(self._x[start:stop], queries, out=scores[start:stop])
+        scores[rows, np.arange(len(rows))] = -np.inf  # сам себе не пара
+        if gender in _GENDERS:
+            scores[self._gender[:n] != _GENDERS[gender]] = -np.inf
+        # пустой текст или ничего общего — не кандидат
+        scores[scores <= 0] = -np.inf
+        count = min(k, n)
+        top = np.argpartition(-scores, count - 1, axis=0)[:count]
+        for j, row in enumerate(rows):
+            picked = top[:, j]
+            picked = picked[np.argsort(-scores[picked, j], kind="stable")]
+            result[self._ids[row]] = [
+                (self._ids[i], round(float(scores[i, j]), 4)) for i in picked if np.isfinite(scores[i, j])
+            ]
+        return result
+
+    def similar(self, user_id: str, k: int = 10, *, gender: Optional[str] = None) -> list[tuple[str, float]]:
+        return self.similar_many([user_id], k, gender=gender)[user_id]
+
+    def close(self) -> None:
+        if self._path is not None:
+            del self._x
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
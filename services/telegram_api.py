@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import Response, TelegramMethod
+
+from services.metrics import TELEGRAM_SECONDS
+
+
+class RequestTimer(BaseRequestMiddleware):
+    """Время каждого запроса к Bot API → bot_telegram_request_seconds{method, outcome}."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[Any],
+        bot: Bot,
+        method: TelegramMethod[Any],
+    ) -> Response[Any]:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await make_request(bot, method)
+            outcome = "ok"
+            return response
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, method.__api_method__, outcome)
+
+
+def create_bot(token: str, *, api_base_url: Optional[str] = None) -> Bot:
+    # api_base_url — свой Bot API сервер вместо api.telegram.org (локальный сервер, заглушка)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_base_url.rstrip("/"))) if api_base_url else AiohttpSession()
+    session.middleware(RequestTimer())
+    return Bot(token=token, session=session)
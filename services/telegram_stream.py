@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from services.metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+# лимит длины текста одного сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+@dataclass
+class StreamStats:
+    first_visible_ms: Optional[float] = None
+    total_ms: float = 0.0
+    messages: int = 0
+    edits: int = 0
+    chars: int = 0
+
+
+async def deliver_stream(
+    message: Message,
+    deltas: AsyncIterator[str],
+    *,
+    edit_interval: float = 1.0,
+    empty_text: str = "…",
+) -> tuple[str, StreamStats]:
+    # «печатает…», затем первый кусок ответа и правки не чаще edit_interval секунд
+    # (лимит Telegram на редактирование); длинный текст продолжается новым сообщением
+    stats = StreamStats()
+    started = time.monotonic()
+    try:
+        await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")  # type: ignore[union-attr]
+    except Exception:
+        ERRORS.inc("telegram_chat_action")
+
+    text = ""
+    sent: Optional[Message] = None
+    offset = 0  # с какого символа text начинается текущее сообщение
+    shown = ""  # что сейчас видно в текущем сообщении
+    last_edit = 0.0
+
+    async def _send(body: str) -> None:
+        nonlocal sent, shown, last_edit
+        body = body[:MAX_MESSAGE_LENGTH]
+        while True:
+            try:
+                sent = await message.answer(body)
+                break
+            except TelegramRetryAfter as exc:
+                # флуд-контроль на отправке: ждём и повторяем, иначе ответ пропал бы целиком
+                await asyncio.sleep(exc.retry_after)
+        shown = body
+        last_edit = time.monotonic()
+        stats.messages += 1
+        if stats.first_visible_ms is None:
+            stats.first_visible_ms = (last_edit - started) * 1000
+
+    async def _edit(body: str) -> bool:
+        nonlocal shown, last_edit
+        if sent is None or body == shown:
+            return True
+        try:
+            await sent.edit_text(body)
+        except TelegramRetryAfter as exc:
+            # флуд-контроль: откладываем правку, следующая правка догонит текст
+            last_edit = time.monotonic() + exc.retry_after
+            return False
+        except TelegramBadRequest as exc:
+            if "message is not modified" not in str(exc):
+                raise
+        shown = body
+        last_edit = time.monotonic()
+        stats.edits += 1
+        return True
+
+    async def _edit_until_done(body: str) -> None:
+        while not await _edit(body):
+            await asyncio.sleep(max(0.0, last_edit - time.monotonic()))
+
+    async def _roll() -> None:
+        # текущее сообщение заполнено: дописываем его и продолжаем следующим
+        nonlocal sent, shown, offset
+        while sent is not None and len(text) - offset > MAX_MESSAGE_LENGTH:
+            await _edit_until_done(text[offset : offset + MAX_MESSAGE_LENGTH])
+            offset += MAX_MESSAGE_LENGTH
+            sent, shown = None, ""
+            if text[offset:].strip():
+                await _send(text[offset:])
+
+    while True:
+        try:
+            delta = await deltas.__anext__()
+        except StopAsyncIteration:
+            break
+        except Exception:
+            # обрыв генерации: если пользователь уже видит часть ответа — дописываем её и
+            # возвращаем как есть, чтобы в истории было то же, что в чате
+            if not text.strip():
+                raise
+            ERRORS.inc("telegram_stream")
+            logger.exception("AI stream failed after %d chars, keeping the partial reply", len(text))
+            break
+        text += delta
+        await _roll()
+        current = text[offset:]
+        if sent is None:
+            if current.strip():
+                await _send(current)
+        elif time.monotonic() - last_edit >= edit_interval:
+            await _edit(current)
+
+    await _roll()
+    if sent is not None:
+        await _edit_until_done(text[offset:])
+    elif not text.strip():
+        await _send(empty_text)
+
+    stats.total_ms = (time.monotonic() - started) * 1000
+    stats.chars = len(text)
+    logger.info(
+        "streamed reply: first_visible=%.0fms total=%.0fms edits=%d chars=%d",
+        stats.first_visible_ms or 0.0,
+        stats.total_ms,
+        stats.edits,
+        stats.chars,
+    )
+    return text, stats
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+from aiogram.types import Update
+
+from services.metrics import UPDATE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_key(update: Update) -> Hashable:
+    # порядок важен в пределах чата; апдейты без чата/пользователя обрабатываем независимо
+    try:
+        event = update.event
+    except Exception:
+        return ("update", update.update_id)
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return ("update", update.update_id)
+
+
+class UpdateScheduler:
+    """FIFO-очередь на каждый чат, общий лимит параллельности и ограниченный бэклог."""
+
+    def __init__(
+        self,
+        handler: Callable[[Update], Awaitable[Any]],
+        *,
+        concurrency: int = 32,
+        max_backlog: int = 1000,
+    ) -> None:
+        self._handler = handler
+        self._concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        self._max_backlog = max(1, max_backlog)
+        self._queues: dict[Hashable, deque[Update]] = {}
+        self._workers: set[asyncio.Task[None]] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+
+        self.pending = 0  # принято и ещё не обработано (в очередях + в работе)
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, update: Update) -> bool:
+        # False — перегрузка или остановка: вебхук отвечает ошибкой, Telegram повторит позже
+        if self._closing or self.pending >= self._max_backlog:
+            self.rejected += 1
+            return False
+        key = update_chat_key(update)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            worker = asyncio.create_task(self._run_chat(key, queue), name=f"updates-{key}")
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+        queue.append(update)
+        self.pending += 1
+        self._idle.clear()
+        return True
+
+    async def _run_chat(self, key: Hashable, queue: deque[Update]) -> None:
+        try:
+            while queue:
+                update = queue[0]
+                async with self._semaphore:
+                    self.in_flight += 1
+                    started = time.perf_counter()
+                    outcome = "ok"
+                    try:
+                        await self._handler(update)
+                        self.processed += 1
+                    except Exception:
+                        outcome = "error"
+                        self.failed += 1
+                        logger.exception("update %s failed", update.update_id)
+                    finally:
+                        self.in_flight -= 1
+                        UPDATE_SECONDS.observe(time.perf_counter() - started, outcome)
+                queue.popleft()
+                self.pending -= 1
+        finally:
+            # между последним popleft и удалением очереди нет await — новый апдейт не потеряется
+            self._queues.pop(key, None)
+            if not self._queues:
+                self._idle.set()
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        # перестаём принимать новые апдейты и ждём уже принятые; True — всё обработано
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("update drain timed out with %d pending updates", self.pending)
+            for worker in list(self._workers):
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            return False
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "chats": len(self._queues),
+            "max_queue_depth": max((len(q) for q in self._queues.values()), default=0),
+            "concurrency": self._concurrency,
+            "max_backlog": self._max_backlog,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from storage.dialogue_store import DialogueStore
+from storage.match_store import MatchStore
+from storage.profile_store import ProfileStore
+
+
+@dataclass
+class UserContext:
+    user_id: str
+    profile: Optional[dict[str, Any]] = None
+    latest_match: Optional[dict[str, Any]] = None
+    # сообщения с ключом "id" (None — ещё в очереди записи)
+    history: list[dict[str, Any]] = field(default_factory=list)
+    summary: Optional[dict[str, Any]] = None
+
+
+class UserContextLoader:
+    """Профиль, последний матч и история пользователя за один вызов перед обращением к LLM."""
+
+    def __init__(self, profile_store: ProfileStore, match_store: MatchStore, dialogue_store: DialogueStore) -> None:
+        self._profiles = profile_store
+        self._matches = match_store
+        self._dialogues = dialogue_store
+
+    async def load(
+        self,
+        user_id: str,
+        *,
+        profile: bool = True,
+        match: bool = True,
+        history_limit: int = 0,
+        summary: bool = False,
+    ) -> UserContext:
+        # Чтения идут подряд, а не через asyncio.gather: каждое — один переход в поток
+        # читателя (~30 мкс), и накладные расходы на задачи gather на горячем кэше SQLite
+        # оказались больше выигрыша от параллельности (см. benchmarks/bench_user_context.py).
+        ctx = UserContext(user_id=user_id)
+        if profile:
+            ctx.profile = await self._profiles.get_profile(user_id)
+        if match:
+            ctx.latest_match = await self._matches.get_latest_match_for_user(user_id)
+        if history_limit > 0:
+            ctx.history = await self._dialogues.get_recent_messages(user_id=user_id, limit=history_limit, with_ids=True)
+        if summary:
+            ctx.summary = await self._dialogues.get_summary(user_id)
+        return ctx
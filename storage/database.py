@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Iterable, Optional, Sequence
+
+import aiosqlite
+
+from services.metrics import DB_LOCK_WAIT_SECONDS, ERRORS
+from storage.migrations import apply_migrations
+
+
+class Database:
+    """Общий движок SQLite: один писатель и небольшой пул читателей (WAL)."""
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        readers: int = 4,
+        synchronous: str = "NORMAL",
+        cache_size_kib: int = 16384,
+        mmap_size: int = 128 * 1024 * 1024,
+        busy_timeout_ms: int = 5000,
+    ) -> None:
+        self._db_path = db_path
+        self._readers_count = max(0, readers)
+        self._synchronous = synchronous
+        self._cache_size_kib = cache_size_kib
+        self._mmap_size = mmap_size
+        self._busy_timeout_ms = busy_timeout_ms
+
+        self._writer: aiosqlite.Connection | None = None
+        self._write_lock = asyncio.Lock()
+        self._readers: list[aiosqlite.Connection] = []
+        self._idle_readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+
+    @property
+    def path(self) -> str:
+        return self._db_path
+
+    @property
+    def in_memory(self) -> bool:
+        return self._db_path == ":memory:" or self._db_path.startswith("file::memory:")
+
+    async def init(self) -> None:
+        if not self.in_memory:
+            path = pathlib.Path(self._db_path)
+            if path.parent and not path.parent.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+
+        # isolation_level=None: транзакциями управляем явно (BEGIN IMMEDIATE / COMMIT)
+        self._writer = await aiosqlite.connect(self._db_path, isolation_level=None)
+        # действует только для новой базы (до первой таблицы): место после удалений
+        # возвращается через PRAGMA incremental_vacuum (storage/dialogue_archive.py)
+        await self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await self._writer.execute("PRAGMA journal_mode=WAL")
+        await self._apply_pragmas(self._writer)
+        async with self._write_lock:
+            await apply_migrations(self._writer)
+
+        # у in-memory базы каждое соединение своё — читаем через писателя
+        if not self.in_memory:
+            for _ in range(self._readers_count):
+                conn = await aiosqlite.connect(self._db_path, isolation_level=None)
+                await self._apply_pragmas(conn)
+                await conn.execute("PRAGMA query_only=ON")
+                self._readers.append(conn)
+                self._idle_readers.put_nowait(conn)
+
+    async def _apply_pragmas(self, conn: aiosqlite.Connection) -> None:
+        await conn.execute(f"PRAGMA synchronous={self._synchronous}")
+        await conn.execute(f"PRAGMA cache_size=-{int(self._cache_size_kib)}")
+        await conn.execute(f"PRAGMA mmap_size={int(self._mmap_size)}")
+        await conn.execute(f"PRAGMA busy_timeout={int(self._busy_timeout_ms)}")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        await conn.execute("PRAGMA foreign_keys=ON")
+
+    async def close(self) -> None:
+        for conn in self._readers:
+            await conn.close()
+        self._readers.clear()
+        self._idle_readers = asyncio.Queue()
+        if self._writer:
+            # при закрытии переносим WAL в основной файл, чтобы он не рос между деплоями
+            try:
+                await self._writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except Exception:
+                ERRORS.inc("wal_checkpoint")
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        # эксклюзивный доступ к соединению-писателю без открытия транзакции
+        assert self._writer is not None
+        started = time.perf_counter()
+        async with self._write_lock:
+            DB_LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, "writer")
+            yield self._writer
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        async with self.writer() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                await conn.rollback()
+                raise
+            else:
+                await conn.commit()
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self._readers:
+            async with self.writer() as conn:
+                yield conn
+            return
+        started = time.perf_counter()
+        conn = await self._idle_readers.get()
+        DB_LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, "reader")
+        try:
+            yield conn
+        finally:
+            self._idle_readers.put_nowait(conn)
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        # одиночная запись в собственной транзакции; возвращает lastrowid
+        async with self.transaction() as conn:
+            cur = await conn.execute(sql, params)
+            return int(cur.lastrowid or 0)
+
+    async def executemany(self, sql: str, rows: Iterable[Sequence[Any]]) -> None:
+        async with self.transaction() as conn:
+            await conn.executemany(sql, rows)
+
+    # execute_fetchall — один переход в поток aiosqlite вместо трёх (execute/fetch/close)
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple[Any, ...]]:
+        async with self.reader() as conn:
+            rows = await conn.execute_fetchall(sql, params)
+        for row in rows:
+            return tuple(row)
+        return None
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> list[tuple[Any, ...]]:
+        async with self.reader() as conn:
+            rows = await conn.execute_fetchall(sql, params)
+        return [tuple(r) for r in rows]
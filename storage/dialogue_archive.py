@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import lzma
+import os
+import shutil
+import time
+import zlib
+from typing import Any, Callable, Optional
+
+from services.metrics import ERRORS
+from storage.database import Database
+
+logger = logging.getLogger(__name__)
+
+# кодек → (сжать, распаковать); название кодека хранится в каждом архиве
+_CODECS: dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (lambda raw: zlib.compress(raw, 9), zlib.decompress),
+    "lzma": (lambda raw: lzma.compress(raw, preset=6), lzma.decompress),
+}
+
+
+def pack_messages(rows: list[tuple[Any, ...]], codec: str) -> tuple[bytes, int]:
+    # строки (id, role, content, created_at) → (сжатый JSON, размер до сжатия)
+    raw = json.dumps([list(r) for r in rows], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _CODECS[codec][0](raw), len(raw)
+
+
+def unpack_messages(blob: bytes, codec: str) -> list[dict[str, Any]]:
+    rows = json.loads(_CODECS[codec][1](blob))
+    return [{"id": r[0], "role": r[1], "content": r[2], "created_at": r[3]} for r in rows]
+
+
+class _Conflict(Exception):
+    pass
+
+
+class DialogueArchiver:
+    """Старые сообщения → сжатые архивы по пользователям; место в файле возвращает инкрементальный VACUUM."""
+
+    def __init__(
+        self,
+        db: Database,
+        *,
+        archive_after_days: float = 30.0,
+        keep_recent: int = 40,
+        batch_rows: int = 500,
+        codec: str = "zlib",
+        interval: float = 3600.0,
+        vacuum_pages: int = 256,
+    ) -> None:
+        if codec not in _CODECS:
+            raise ValueError(f"unknown archive codec: {codec}")
+        self._db = db
+        self._archive_after = archive_after_days * 86400
+        # последние сообщения пользователя всегда остаются в messages: их читают окно истории и сводка
+        self._keep_recent = max(1, keep_recent)
+        self._batch_rows = max(1, batch_rows)
+        self._codec = codec
+        self._interval = interval
+        self._vacuum_pages = max(1, vacuum_pages)
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task[None]] = None
+        self.last_report: Optional[dict[str, Any]] = None
+        self._vacuum_hint_logged = False
+
+    async def init(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="dialogue-archiver")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        # первый проход — не сразу после старта, пока процесс прогревается
+        await asyncio.sleep(min(self._interval, 60.0))
+        while True:
+            try:
+                await self.compact_once()
+            except Exception:
+                ERRORS.inc("dialogue_archive")
+                logger.exception("dialogue compaction failed")
+            await asyncio.sleep(self._interval)
+
+    async def _boundary_id(self, cutoff: str) -> int:
+        # id растут вместе с created_at: последний id старше cutoff — двоичным поиском по rowid
+        row = await self._db.fetchone("SELECT MIN(id), MAX(id) FROM messages")
+        if not row or row[0] is None:
+            return 0
+        lo, hi, found = int(row[0]), int(row[1]), 0
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            probe = await self._db.fetchone("SELECT id, created_at FROM messages WHERE id >= ? ORDER BY id LIMIT 1", (mid,))
+            if probe is None or probe[1] >= cutoff:
+                hi = mid - 1
+            else:
+                found = max(found, int(probe[0]))
+                lo = int(probe[0]) + 1
+        return found
+
+    async def _archivable_until(self, user_id: str, boundary: int) -> int:
+        # не трогаем последние keep_recent сообщений и ещё не вошедшее в сводку
+        kept = await self._db.fetchone(
+            "SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+            (user_id, self._keep_recent - 1),
+        )
+        if kept is None:
+            return 0
+        summary = await self._db.fetchone("SELECT covered_until_id FROM dialogue_summaries WHERE user_id = ?", (user_id,))
+        if summary is None:
+            # сводка читает только живую таблицу: без неё архив унёс бы сообщения, которые в сводку уже не попадут
+            return 0
+        return min(boundary, int(kept[0]) - 1, int(summary[0]))
+
+    async def _write(self, groups: list[tuple[str, list[tuple[Any, ...]]]], report: dict[str, Any], seen: set[str]) -> None:
+        # одна короткая транзакция на batch_rows сообщений: живые записи ждут не дольше неё
+        packed = [(user_id, rows, *pack_messages(rows, self._codec)) for user_id, rows in groups]
+        async with self._db.transaction() as conn:
+            for user_id, rows, blob, raw_size in packed:
+                cur = await conn.execute(
+                    "DELETE FROM messages WHERE user_id = ? AND id BETWEEN ? AND ?",
+                    (user_id, rows[0][0], rows[-1][0]),
+                )
+                if cur.rowcount != len(rows):
+                    # эти сообщения уже заархивировал другой процесс — откатываем пачку целиком
+                    raise _Conflict()
+                await conn.execute(
+                    "INSERT INTO message_archives "
+                    "(user_id, first_id, last_id, first_at, last_at, message_count, codec, raw_bytes, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, rows[0][0], rows[-1][0], rows[0][3], rows[-1][3], len(rows), self._codec, raw_size, blob),
+                )
+        # пользователей считаем только после коммита: откаченная пачка ничего не заархивировала
+        for user_id, rows, blob, raw_size in packed:
+            if user_id not in seen:
+                seen.add(user_id)
+                report["users"] += 1
+            report["messages"] += len(rows)
+            report["raw_bytes"] += raw_size
+            report["archived_bytes"] += len(blob)
+
+    async def compact_once(self, *, vacuum: bool = False) -> dict[str, Any]:
+        # vacuum=True — только вручную (/admin/dialogues/compact?vacuum=true): полный VACUUM старой базы
+        # держит лок писателя всё время перезаписи файла
+        async with self._lock:
+            started = time.monotonic()
+            report: dict[str, Any] = {"users": 0, "messages": 0, "raw_bytes": 0, "archived_bytes": 0, "bytes_reclaimed": 0}
+            cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - self._archive_after))
+            boundary = await self._boundary_id(cutoff)
+            users = [r[0] for r in await self._db.fetchall("SELECT DISTINCT user_id FROM messages WHERE id <= ?", (boundary,))]
+
+            groups: list[tuple[str, list[tuple[Any, ...]]]] = []
+            seen: set[str] = set()
+            pending = 0
+            try:
+                for user_id in users:
+                    until = await self._archivable_until(user_id, boundary)
+                    after = 0
+                    while True:
+                        rows = await self._db.fetchall(
+                            "SELECT id, role, content, created_at FROM messages "
+                            "WHERE user_id = ? AND id > ? AND id <= ? ORDER BY id LIMIT ?",
+                            (user_id, after, until, self._batch_rows),
+                        )
+                        if not rows:
+                            break
+                        groups.append((user_id, rows))
+                        pending += len(rows)
+                        after = rows[-1][0]
+                        if pending >= self._batch_rows:
+                            await self._write(groups, report, seen)
+                            groups, pending = [], 0
+                            await asyncio.sleep(0)
+                if groups:
+                    await self._write(groups, report, seen)
+            except _Conflict:
+                logger.warning("dialogue compaction: concurrent run detected, stopping this pass")
+
+            report["bytes_reclaimed"] = await self._reclaim(vacuum)
+            report["seconds"] = round(time.monotonic() - started, 2)
+            self.last_report = report
+            logger.info(
+                "dialogue compaction: %d messages of %d users archived (%d → %d bytes), %d bytes reclaimed in %.1fs",
+                report["messages"], report["users"], report["raw_bytes"], report["archived_bytes"],
+                report["bytes_reclaimed"], report["seconds"],
+            )
+            return report
+
+    async def _pragma(self, name: str) -> int:
+        async with self._db.writer() as conn:
+            rows = await conn.execute_fetchall(f"PRAGMA {name}")
+        return int(list(rows)[0][0])
+
+    async def _reclaim(self, vacuum: bool) -> int:
+        page_size = await self._pragma("page_size")
+        before = await self._pragma("page_count")
+        mode = await self._pragma("auto_vacuum")
+        if mode == 2:
+            # incremental: возвращаем свободные страницы порциями, между порциями пишут другие
+            while await self._pragma("freelist_count"):
+                async with self._db.writer() as conn:
+                    await conn.execute_fetchall(f"PRAGMA incremental_vacuum({self._vacuum_pages})")
+                await asyncio.sleep(0)
+        elif mode == 0 and await self._pragma("freelist_count") and not self._db.in_memory:
+            # база создана до auto_vacuum=INCREMENTAL: перевести её может только полный VACUUM.
+            # Автоматические проходы его не запускают — освобождённые страницы просто переиспользуются
+            if not vacuum:
+                if not self._vacuum_hint_logged:
+                    self._vacuum_hint_logged = True
+                    logger.info(
+                        "%s uses auto_vacuum=NONE: freed pages are reused; POST /admin/dialogues/compact?vacuum=true "
+                        "shrinks the file once (blocks writes for the duration)", self._db.path,
+                    )
+                return (before - await self._pragma("page_count")) * page_size
+            # VACUUM нужна копия файла на диске
+            size = os.path.getsize(self._db.path)
+            free = shutil.disk_usage(os.path.dirname(os.path.abspath(self._db.path))).free
+            if free > size * 1.2:
+                logger.warning("converting %s to auto_vacuum=INCREMENTAL with a one-time VACUUM (%d MB)", self._db.path, size >> 20)
+                async with self._db.writer() as conn:
+                    await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                    await conn.execute("VACUUM")
+            else:
+                logger.warning("not enough free disk for the one-time VACUUM of %s, freed pages will be reused", self._db.path)
+        return (before - await self._pragma("page_count")) * page_size
+
@@ -1,52 +1,210 @@
 from __future__ import annotations
 
-import aiosqlite
-from typing import Sequence
-import pathlib
+import asyncio
+import logging
+from typing import Any, Optional
+
+from services.metrics import ERRORS
+from storage.database import Database
+from storage.dialogue_archive import unpack_messages
+
+logger = logging.getLogger(__name__)
+
+_INSERT_SQL = "INSERT INTO messages (user_id, role, content) VALUES (?, ?, ?)"
+_RECENT_SQL = "SELECT id, role, content FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?"
 
 
 class DialogueStore:
-    def __init__(self, db_path: str) -> None:
-        self._db_path = db_path
-        self._db: aiosqlite.Connection | None = None
+    def __init__(
+        self,
+        db: Database,
+        *,
+        write_behind: bool = False,
+        flush_interval_ms: int = 50,
+        flush_max_rows: int = 256,
+    ) -> None:
+        self._db = db
+        self._write_behind = write_behind
+        self._flush_interval = max(flush_interval_ms, 1) / 1000
+        self._flush_max_rows = max(flush_max_rows, 1)
 
-    async def init(self) -> None:
-        path = pathlib.Path(self._db_path)
-        if path.parent and not path.parent.exists():
-            path.parent.mkdir(parents=True, exist_ok=True)
+        # write-behind: строки ждут групповой записи одной транзакцией
+        self._pending: list[tuple[str, str, str]] = []
+        # батч, который сейчас пишется, и число завершённых записей — для чтения без лока писателя
+        self._flushing: list[tuple[str, str, str]] = []
+        self._flushes = 0
+        # сколько строк пользователя ещё не закоммичено (очередь + текущий батч)
+        self._unflushed: dict[str, int] = {}
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._flusher: asyncio.Task[None] | None = None
 
-        self._db = await aiosqlite.connect(str(path))
-        await self._db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        await self._db.commit()
+    async def init(self) -> None:
+        # схема создаётся миграциями (storage/migrations.py) в Database.init
+        if self._write_behind and self._flusher is None:
+            self._closing = False
+            self._flusher = asyncio.create_task(self._flush_loop(), name="dialogue-store-flusher")
 
     async def close(self) -> None:
-        if self._db:
-            await self._db.close()
-            self._db = None
+        # соединениями владеет Database, закрывается в lifespan; здесь только дописываем очередь
+        self._closing = True
+        if self._flusher is not None:
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
 
     async def add_message(self, user_id: str, role: str, content: str) -> None:
-        assert self._db is not None
-        await self._db.execute(
-            "INSERT INTO messages (user_id, role, content) VALUES (?, ?, ?)",
-            (user_id, role, content),
+        if not self._write_behind or self._flusher is None:
+            await self._db.execute(_INSERT_SQL, (user_id, role, content))
+            return
+        self._pending.append((user_id, role, content))
+        self._unflushed[user_id] = self._unflushed.get(user_id, 0) + 1
+        if len(self._pending) == 1 or len(self._pending) >= self._flush_max_rows:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._db.writer() as conn:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            self._flushing = batch
+            # BEGIN тоже внутри try: при SQLITE_BUSY батч должен вернуться в очередь
+            try:
+                await conn.execute("BEGIN IMMEDIATE")
+                await conn.executemany(_INSERT_SQL, batch)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                self._pending[:0] = batch
+                self._flushing = []
+                raise
+            self._flushing = []
+            self._flushes += 1
+            # счётчики уменьшаем под локом писателя — читатели видят либо очередь, либо БД
+            for user_id, _, _ in batch:
+                left = self._unflushed.get(user_id, 0) - 1
+                if left > 0:
+                    self._unflushed[user_id] = left
+                else:
+                    self._unflushed.pop(user_id, None)
+            return len(batch)
+
+    async def _flush_loop(self) -> None:
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closing:
+                break
+            if len(self._pending) < self._flush_max_rows:
+                # копим строки до интервала или до заполнения батча
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                ERRORS.inc("dialogue_flush")
+                logger.exception("dialogue flush failed, retrying")
+                await asyncio.sleep(self._flush_interval)
+            if self._pending:
+                self._wakeup.set()
+
+    async def get_recent_messages(self, user_id: str, limit: int = 12, *, with_ids: bool = False) -> list[dict[str, Any]]:
+        # with_ids: добавить "id" строки (None — ещё не записана из очереди)
+        def _item(row_id: Optional[int], role: str, content: str) -> dict[str, Any]:
+            if with_ids:
+                return {"id": row_id, "role": role, "content": content}
+            return {"role": role, "content": content}
+
+        if not self._unflushed.get(user_id):
+            rows = await self._db.fetchall(_RECENT_SQL, (user_id, limit))
+            return [_item(*r) for r in reversed(rows)]
+
+        # есть незаписанные строки пользователя: записанные читаем из пула читателей и добавляем
+        # очередь из памяти. Пока его строки в записываемом батче или батч записался за время
+        # чтения, строка могла попасть и в выборку, и в очередь — перечитываем, затем под локом писателя
+        for _ in range(3):
+            flushes = self._flushes
+            rows = await self._db.fetchall(_RECENT_SQL, (user_id, limit))
+            if self._flushes == flushes and all(uid != user_id for uid, _, _ in self._flushing):
+                items = [_item(*r) for r in reversed(rows)]
+                items.extend(_item(None, role, content) for uid, role, content in self._pending if uid == user_id)
+                return items[-limit:] if limit > 0 else []
+            await asyncio.sleep(0)
+        async with self._db.writer() as conn:
+            rows = await conn.execute_fetchall(_RECENT_SQL, (user_id, limit))
+            items = [_item(*r) for r in reversed(list(rows))]
+            items.extend(_item(None, role, content) for uid, role, content in self._pending if uid == user_id)
+        return items[-limit:] if limit > 0 else []
+
+    async def get_messages_between(
+        self, user_id: str, *, after_id: int, before_id: int, limit: int = 200, newest: bool = False
+    ) -> list[dict[str, Any]]:
+        # newest — последние limit сообщений перед before_id, а не первые после after_id
+        order = "DESC" if newest else "ASC"
+        rows = await self._db.fetchall(
+            f"SELECT id, role, content FROM messages WHERE user_id = ? AND id > ? AND id < ? ORDER BY id {order} LIMIT ?",
+            (user_id, after_id, before_id, limit),
         )
-        await self._db.commit()
+        if newest:
+            rows = rows[::-1]
+        return [{"id": r[0], "role": r[1], "content": r[2]} for r in rows]
 
-    async def get_recent_messages(self, user_id: str, limit: int = 12) -> list[dict[str, str]]:
-        assert self._db is not None
-        cur = await self._db.execute(
-            "SELECT role, content FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?",
-            (user_id, limit),
+    async def get_full_history(self, user_id: str) -> list[dict[str, Any]]:
+        # вся переписка для поддержки: архивы (storage/dialogue_archive.py), затем живые строки и очередь;
+        # id/created_at = None — сообщение ещё в очереди write-behind
+        archives_sql = "SELECT codec, data FROM message_archives WHERE user_id = ? ORDER BY first_id"
+        rows_sql = "SELECT id, role, content, created_at FROM messages WHERE user_id = ? ORDER BY id"
+        pending: list[tuple[str, str]] = []
+        if self._unflushed.get(user_id):
+            # как в get_recent_messages: под локом писателя очередь и БД согласованы
+            async with self._db.writer() as conn:
+                archives = await conn.execute_fetchall(archives_sql, (user_id,))
+                rows = await conn.execute_fetchall(rows_sql, (user_id,))
+                pending = [(role, content) for uid, role, content in self._pending if uid == user_id]
+        else:
+            # архив и строки — одним снимком: компактор переносит сообщения одной транзакцией
+            async with self._db.reader() as conn:
+                await conn.execute("BEGIN")
+                try:
+                    archives = await conn.execute_fetchall(archives_sql, (user_id,))
+                    rows = await conn.execute_fetchall(rows_sql, (user_id,))
+                finally:
+                    await conn.rollback()
+        messages: list[dict[str, Any]] = []
+        for codec, blob in archives:
+            messages += unpack_messages(blob, codec)
+        messages += [{"id": r[0], "role": r[1], "content": r[2], "created_at": r[3]} for r in rows]
+        messages += [{"id": None, "role": role, "content": content, "created_at": None} for role, content in pending]
+        return messages
+
+    async def get_summary(self, user_id: str) -> Optional[dict[str, Any]]:
+        row = await self._db.fetchone(
+            "SELECT summary, covered_until_id FROM dialogue_summaries WHERE user_id = ?",
+            (user_id,),
+        )
+        if not row:
+            return None
+        return {"summary": row[0], "covered_until_id": row[1]}
+
+    async def save_summary(self, user_id: str, summary: str, covered_until_id: int) -> None:
+        # сводка только двигается вперёд: устаревшее фоновое обновление не затрёт свежее
+        await self._db.execute(
+            """
+            INSERT INTO dialogue_summaries (user_id, summary, covered_until_id)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                summary=excluded.summary,
+                covered_until_id=excluded.covered_until_id,
+                updated_at=CURRENT_TIMESTAMP
+            WHERE excluded.covered_until_id > dialogue_summaries.covered_until_id
+            """,
+            (user_id, summary, covered_until_id),
         )
-        rows: Sequence[tuple[str, str]] = await cur.fetchall()
-        return list(reversed([{"role": r[0], "content": r[1]} for r in rows]))
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import astuple
+from typing import Any, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from services.metrics import ERRORS
+from storage.cache import TTLCache
+from storage.database import Database
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_SQL = "INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)"
+
+# (state, data, updated_at)
+_Record = tuple[Optional[str], dict[str, Any], float]
+# (state, data в JSON, updated_at)
+_Row = tuple[Optional[str], str, float]
+
+
+def _db_key(key: StorageKey) -> str:
+    return ":".join("" if value is None else str(value) for value in astuple(key))
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM aiogram в общей базе: кэш в памяти, изменения пишутся пачками, брошенные анкеты истекают по TTL."""
+
+    def __init__(
+        self,
+        db: Database,
+        *,
+        ttl: float = 172800.0,
+        flush_interval_ms: int = 50,
+        cache_size: int = 10000,
+        purge_interval: float = 600.0,
+    ) -> None:
+        self._db = db
+        self._ttl = ttl
+        self._flush_interval = max(flush_interval_ms, 1) / 1000
+        self._purge_interval = purge_interval
+        # кэш своих чатов: при нескольких процессах апдейты одного чата должны приходить в один процесс
+        self._cache: TTLCache[str, _Record] = TTLCache(cache_size, ttl)
+        # изменения, ещё не записанные в базу (по ключу — только последнее) и записываемые сейчас
+        self._dirty: dict[str, _Row] = {}
+        self._flushing: dict[str, _Row] = {}
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._flusher: asyncio.Task[None] | None = None
+
+    async def init(self) -> None:
+        # схема создаётся миграциями (storage/migrations.py) в Database.init
+        await self.purge_expired()
+        if self._flusher is None:
+            self._closing = False
+            self._flusher = asyncio.create_task(self._flush_loop(), name="fsm-storage-flusher")
+
+    async def close(self) -> None:
+        # aiogram тоже может вызвать close — повторный вызов ничего не делает
+        self._closing = True
+        if self._flusher is not None:
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._dirty)
+
+    @property
+    def cached_count(self) -> int:
+        return len(self._cache)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        db_key = _db_key(key)
+        _, data, _ = await self._load(db_key)
+        self._put(db_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _, _ = await self._load(_db_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        db_key = _db_key(key)
+        state, _, _ = await self._load(db_key)
+        self._put(db_key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data, _ = await self._load(_db_key(key))
+        return data.copy()
+
+    def _put(self, key: str, state: Optional[str], data: dict[str, Any]) -> None:
+        # сериализуем сразу: несериализуемые данные — ошибка в обработчике, а не в фоновой записи
+        payload = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        self._cache.set(key, (state, data, now))
+        self._dirty[key] = (state, payload, now)
+        if len(self._dirty) == 1:
+            self._wakeup.set()
+
+    async def _load(self, key: str) -> _Record:
+        record = self._cache.get(key)
+        if record is None:
+            row = self._dirty.get(key) or self._flushing.get(key)
+            if row is None:
+                row = await self._db.fetchone("SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (key,))
+                # пока читали, обработчик мог записать новое значение — оно главнее
+                record = self._cache.get(key)
+            if record is None:
+                state, payload, updated_at = row if row is not None else (None, "{}", 0.0)
+                record = (state, json.loads(payload), updated_at)
+                # пустая запись тоже кэшируется: get_state вызывается на каждый апдейт
+                self._cache.set(key, record)
+        if record[2] and record[2] + self._ttl <= time.time():
+            # брошенная анкета: в базе её удалит purge_expired
+            return None, {}, 0.0
+        return record
+
+    async def flush(self) -> int:
+        async with self._db.writer() as conn:
+            self._flushing, self._dirty = self._dirty, {}
+            if not self._flushing:
+                return 0
+            # пустое состояние (state.clear()) — удаляем строку
+            delete = [(key,) for key, (state, payload, _) in self._flushing.items() if state is None and payload == "{}"]
+            upsert = [(key, *row) for key, row in self._flushing.items() if row[0] is not None or row[1] != "{}"]
+            # BEGIN тоже внутри try: при SQLITE_BUSY изменения должны вернуться в _dirty
+            try:
+                await conn.execute("BEGIN IMMEDIATE")
+                if delete:
+                    await conn.executemany("DELETE FROM fsm_states WHERE key = ?", delete)
+                if upsert:
+                    await conn.executemany(_UPSERT_SQL, upsert)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                # более новые изменения, сделанные во время записи, не перетираем
+                for key, row in self._flushing.items():
+                    self._dirty.setdefault(key, row)
+                raise
+            finally:
+                count, self._flushing = len(self._flushing), {}
+            return count
+
+    async def purge_expired(self) -> int:
+        async with self._db.transaction() as conn:
+            cur = await conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (time.time() - self._ttl,))
+            purged = cur.rowcount or 0
+        if purged:
+            logger.info("fsm storage: purged %d expired sessions", purged)
+        return purged
+
+    async def _flush_loop(self) -> None:
+        next_purge = time.monotonic() + self._purge_interval
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, next_purge - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            else:
+                self._wakeup.clear()
+                # шаг анкеты делает update_data и set_state подряд — ждём, чтобы записать их одной строкой
+                await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() >= next_purge:
+                    await self.purge_expired()
+                    next_purge = time.monotonic() + self._purge_interval
+            except Exception:
+                ERRORS.inc("fsm_flush")
+                logger.exception("fsm storage flush failed, retrying")
+                await asyncio.sleep(self._flush_interval)
+            if self._dirty:
+                self._wakeup.set()
@@ -1,38 +1,83 @@
 from __future__ import annotations
 
-import aiosqlite
 from typing import Any, Optional
 
+import aiosqlite
+
+from storage.cache import TTLCache
+from storage.database import Database
+
+_MATCH_KEYS = [
+    "id",
+    "male_id",
+    "female_id",
+    "female_username",
+    "male_username",
+    "mutual",
+    "paid",
+    "invoice_url",
+]
+
+_UPSERT_LATEST_SQL = """
+    INSERT OR REPLACE INTO user_latest_match
+        (user_id, match_id, male_id, female_id, female_username, male_username, mutual, paid, invoice_url)
+    SELECT ?, id, male_id, female_id, female_username, male_username, mutual, paid, invoice_url
+    FROM matches WHERE id = ?
+"""
+
+_REFRESH_LATEST_SQL = """
+    UPDATE user_latest_match SET
+        female_username = m.female_username,
+        male_username = m.male_username,
+        mutual = m.mutual,
+        paid = m.paid,
+        invoice_url = m.invoice_url
+    FROM (SELECT * FROM matches WHERE id = ?) AS m
+    WHERE user_latest_match.match_id = m.id
+"""
+
 
 class MatchStore:
-    def __init__(self, db_path: str) -> None:
-        self._db_path = db_path
-        self._db: aiosqlite.Connection | None = None
+    def __init__(self, db: Database, *, mirror: bool = True, mirror_size: int = 100_000) -> None:
+        self._db = db
+        # user_id → последний матч ({} — матча нет): недавние строки user_latest_match в памяти процесса.
+        # Пишет в таблицу только этот процесс, поэтому записи не устаревают; размер ограничен LRU
+        self._mirror_enabled = mirror
+        self._latest: TTLCache[str, dict[str, Any]] = TTLCache(mirror_size, float("inf"))
 
     async def init(self) -> None:
-        self._db = await aiosqlite.connect(self._db_path)
-        await self._db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS matches (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                male_id TEXT NOT NULL,
-                female_id TEXT NOT NULL,
-                female_username TEXT,
-                male_username TEXT,
-                mutual INTEGER DEFAULT 0,
-                paid INTEGER DEFAULT 0,
-                invoice_url TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                paid_at TIMESTAMP
-            )
-            """
-        )
-        await self._db.commit()
+        # схема создаётся миграциями (storage/migrations.py) в Database.init
+        if self._mirror_enabled:
+            await self.rebuild_mirror()
 
     async def close(self) -> None:
-        if self._db:
-            await self._db.close()
-            self._db = None
+        pass
+
+    @property
+    def cached_count(self) -> int:
+        return len(self._latest)
+
+    async def rebuild_mirror(self) -> int:
+        # прогрев самыми свежими матчами; остальные пользователи подгружаются при первом запросе
+        rows = await self._db.fetchall(
+            "SELECT user_id, match_id, male_id, female_id, female_username, male_username, mutual, paid, invoice_url "
+            "FROM user_latest_match ORDER BY match_id DESC LIMIT ?",
+            (self._latest.maxsize,),
+        )
+        self._latest.clear()
+        for r in reversed(rows):
+            self._latest.set(r[0], {k: r[i + 1] for i, k in enumerate(_MATCH_KEYS)})
+        return len(self._latest)
+
+    async def _read_match(self, conn: aiosqlite.Connection, match_id: int) -> Optional[dict[str, Any]]:
+        rows = await conn.execute_fetchall(
+            "SELECT id, male_id, female_id, female_username, male_username, mutual, paid, invoice_url "
+            "FROM matches WHERE id = ?",
+            (match_id,),
+        )
+        for r in rows:
+            return {k: r[i] for i, k in enumerate(_MATCH_KEYS)}
+        return None
 
     async def create_match(
         self,
@@ -43,61 +88,69 @@ class MatchStore:
         male_username: str | None = None,
         female_username: str | None = None,
     ) -> int:
-        assert self._db is not None
-        cur = await self._db.execute(
-            """
-            INSERT INTO matches (male_id, female_id, mutual, male_username, female_username)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (male_id, female_id, 1 if mutual else 0, male_username, female_username),
-        )
-        await self._db.commit()
-        return int(cur.lastrowid)
+        async with self._db.transaction() as conn:
+            cur = await conn.execute(
+                """
+                INSERT INTO matches (male_id, female_id, mutual, male_username, female_username)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (male_id, female_id, 1 if mutual else 0, male_username, female_username),
+            )
+            match_id = int(cur.lastrowid or 0)
+            # новый матч всегда последний для обоих участников
+            await conn.executemany(_UPSERT_LATEST_SQL, [(male_id, match_id), (female_id, match_id)])
+            match = await self._read_match(conn, match_id)
+        if self._mirror_enabled and match:
+            self._latest.set(male_id, match)
+            self._latest.set(female_id, dict(match))
+        return match_id
+
+    async def _update_match(self, match_id: int, sql: str, params: tuple[Any, ...]) -> None:
+        async with self._db.transaction() as conn:
+            await conn.execute(sql, params)
+            await conn.execute(_REFRESH_LATEST_SQL, (match_id,))
+            match = await self._read_match(conn, match_id)
+        if self._mirror_enabled and match:
+            for user_id in (match["male_id"], match["female_id"]):
+                current = self._latest.get(user_id)
+                if current and current["id"] == match_id:
+                    self._latest.set(user_id, dict(match))
 
     async def set_invoice_url(self, match_id: int, invoice_url: str) -> None:
-        assert self._db is not None
-        await self._db.execute(
+        await self._update_match(
+            match_id,
             "UPDATE matches SET invoice_url = ? WHERE id = ?",
             (invoice_url, match_id),
         )
-        await self._db.commit()
 
     async def mark_paid(self, match_id: int) -> None:
-        assert self._db is not None
-        await self._db.execute(
+        await self._update_match(
+            match_id,
             "UPDATE matches SET paid = 1, paid_at = CURRENT_TIMESTAMP WHERE id = ?",
             (match_id,),
         )
-        await self._db.commit()
 
     async def get_latest_match_for_user(self, user_id: str) -> Optional[dict[str, Any]]:
-        assert self._db is not None
-        cur = await self._db.execute(
+        # копия: правка результата вызывающим не должна портить зеркало
+        if self._mirror_enabled:
+            cached = self._latest.get(user_id)
+            if cached is not None:
+                return dict(cached) or None
+        row = await self._db.fetchone(
             """
-            SELECT id, male_id, female_id, female_username, male_username, mutual, paid, invoice_url
-            FROM matches
-            WHERE male_id = ? OR female_id = ?
-            ORDER BY id DESC LIMIT 1
+            SELECT match_id, male_id, female_id, female_username, male_username, mutual, paid, invoice_url
+            FROM user_latest_match
+            WHERE user_id = ?
             """,
-            (user_id, user_id),
+            (user_id,),
         )
-        row = await cur.fetchone()
-        if not row:
-            return None
-        keys = [
-            "id",
-            "male_id",
-            "female_id",
-            "female_username",
-            "male_username",
-            "mutual",
-            "paid",
-            "invoice_url",
-        ]
-        return {k: row[i] for i, k in enumerate(keys)}
+        match = {k: row[i] for i, k in enumerate(_MATCH_KEYS)} if row else {}
+        # пока шло чтение, create_match мог уже положить более свежий матч — его не затираем
+        if self._mirror_enabled and self._latest.get(user_id) is None:
+            self._latest.set(user_id, match)
+        return dict(match) or None
 
     async def list_matches_for_user(self, user_id: str, *, only_mutual: bool | None = None) -> list[dict[str, Any]]:
-        assert self._db is not None
         if only_mutual is None:
             query = (
                 "SELECT id, male_id, female_id, female_username, male_username, mutual, paid, invoice_url "
@@ -110,16 +163,5 @@ class MatchStore:
                 "FROM matches WHERE (male_id = ? OR female_id = ?) AND mutual = ? ORDER BY id DESC"
             )
             params = (user_id, user_id, 1 if only_mutual else 0)
-        cur = await self._db.execute(query, params)
-        rows = await cur.fetchall()
-        keys = [
-            "id",
-            "male_id",
-            "female_id",
-            "female_username",
-            "male_username",
-            "mutual",
-            "paid",
-            "invoice_url",
-        ]
-        return [{k: r[i] for i, k in enumerate(keys)} for r in rows]
+        rows = await self._db.fetchall(query, params)
+        return [{k: r[i] for i, k in enumerate(_MATCH_KEYS)} for r in rows]
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Union
+
+import aiosqlite
+
+from storage.profile_index import backfill_search_rows
+
+# Шаг миграции — SQL-строка или корутина над соединением писателя
+Step = Union[str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+
+async def _dedupe_profile_numbers(conn: aiosqlite.Connection) -> None:
+    # номер анкеты оставляем только у последней обновлённой записи (при равном updated_at — у вставленной позже)
+    await conn.execute(
+        """
+        UPDATE profiles SET profile_number = NULL
+        WHERE profile_number IS NOT NULL
+          AND rowid != (
+              SELECT p.rowid FROM profiles AS p
+              WHERE p.profile_number = profiles.profile_number
+              ORDER BY p.updated_at DESC, p.rowid DESC
+              LIMIT 1
+          )
+        """
+    )
+
+
+# (версия, название, шаги); версии только растут, применённые шаги не меняем
+MIGRATIONS: list[tuple[int, str, tuple[Step, ...]]] = [
+    (
+        1,
+        "base tables",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS matches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                male_id TEXT NOT NULL,
+                female_id TEXT NOT NULL,
+                female_username TEXT,
+                male_username TEXT,
+                mutual INTEGER DEFAULT 0,
+                paid INTEGER DEFAULT 0,
+                invoice_url TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                paid_at TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS profiles (
+                user_id TEXT PRIMARY KEY,
+                username TEXT,
+                gender TEXT,
+                bio TEXT,
+                attributes TEXT,          -- JSON
+                profile_number INTEGER,   -- номер анкеты в канале (опционально)
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ),
+    ),
+    (
+        2,
+        "hot-path indexes",
+        (
+            # get_recent_messages: WHERE user_id = ? ORDER BY id DESC LIMIT ?
+            "CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id, id)",
+            # male_id = ? OR female_id = ? → объединение двух поисков по индексам
+            "CREATE INDEX IF NOT EXISTS idx_matches_male_id ON matches(male_id, id)",
+            "CREATE INDEX IF NOT EXISTS idx_matches_female_id ON matches(female_id, id)",
+            _dedupe_profile_numbers,
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_profiles_profile_number ON profiles(profile_number) "
+            "WHERE profile_number IS NOT NULL",
+            "CREATE INDEX IF NOT EXISTS idx_profiles_updated_at ON profiles(updated_at, user_id)",
+        ),
+    ),
+    (
+        3,
+        "user_latest_match projection",
+        (
+            # последний матч пользователя (в любой роли); поддерживается MatchStore при записи
+            """
+            CREATE TABLE IF NOT EXISTS user_latest_match (
+                user_id TEXT PRIMARY KEY,
+                match_id INTEGER NOT NULL,
+                male_id TEXT NOT NULL,
+                female_id TEXT NOT NULL,
+                female_username TEXT,
+                male_username TEXT,
+                mutual INTEGER DEFAULT 0,
+                paid INTEGER DEFAULT 0,
+                invoice_url TEXT
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_user_latest_match_match_id ON user_latest_match(match_id)",
+            """
+            INSERT OR REPLACE INTO user_latest_match
+                (user_id, match_id, male_id, female_id, female_username, male_username, mutual, paid, invoice_url)
+            SELECT u.user_id, m.id, m.male_id, m.female_id, m.female_username, m.male_username, m.mutual, m.paid, m.invoice_url
+            FROM (
+                SELECT user_id, MAX(id) AS match_id FROM (
+                    SELECT male_id AS user_id, id FROM matches
+                    UNION ALL
+                    SELECT female_id AS user_id, id FROM matches
+                ) GROUP BY user_id
+            ) AS u
+            JOIN matches AS m ON m.id = u.match_id
+            """,
+        ),
+    ),
+    (
+        4,
+        "dialogue summaries",
+        (
+            # сжатое содержание сообщений с id <= covered_until_id, вышедших из окна истории
+            """
+            CREATE TABLE IF NOT EXISTS dialogue_summaries (
+                user_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                covered_until_id INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ),
+    ),
+    (
+        5,
+        "profile outbox",
+        (
+            # профили для отправки в основной бот; одна запись на пользователя — новая
+            # версия анкеты вытесняет неотправленную старую (INSERT OR REPLACE);
+            # next_attempt_at = NULL — попытки исчерпаны, запись ждёт разбора
+            """
+            CREATE TABLE IF NOT EXISTS profile_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_profile_outbox_due ON profile_outbox(next_attempt_at)",
+        ),
+    ),
+    (
+        6,
+        "profile search index",
+        (
+            # нормализованные поля анкеты для поиска (storage/profile_index.py);
+            # пишутся в одной транзакции с profiles
+            """
+            CREATE TABLE IF NOT EXISTS profile_search (
+                user_id TEXT PRIMARY KEY,
+                gender TEXT,
+                age INTEGER,
+                country TEXT,
+                city TEXT,
+                religiosity TEXT,
+                marital_status TEXT,
+                prayer TEXT
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_profile_search_gender_age ON profile_search(gender, age)",
+            "CREATE INDEX IF NOT EXISTS idx_profile_search_city ON profile_search(city, age, gender)",
+            "CREATE INDEX IF NOT EXISTS idx_profile_search_country ON profile_search(country, age, gender)",
+            "CREATE INDEX IF NOT EXISTS idx_profile_search_religiosity ON profile_search(religiosity, age, gender)",
+            """
+            CREATE TABLE IF NOT EXISTS profile_languages (
+                language TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                PRIMARY KEY (language, user_id)
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_profile_languages_user_id ON profile_languages(user_id)",
+            backfill_search_rows,
+        ),
+    ),
+    (
+        7,
+        "fsm storage",
+        (
+            # состояния aiogram FSM (storage/fsm_storage.py); key — StorageKey в виде строки,
+            # updated_at (unix time) — для удаления брошенных анкет по TTL
+            """
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)",
+        ),
+    ),
+    (
+        8,
+        "message archives",
+        (
+            # старые сообщения, упакованные storage/dialogue_archive.py: сжатый JSON
+            # [[id, role, content, created_at], ...] по пользователю, id — диапазон исходных строк
+            """
+            CREATE TABLE IF NOT EXISTS message_archives (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                first_id INTEGER NOT NULL,
+                last_id INTEGER NOT NULL,
+                first_at TIMESTAMP,
+                last_at TIMESTAMP,
+                message_count INTEGER NOT NULL,
+                codec TEXT NOT NULL,
+                raw_bytes INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_message_archives_user_id ON message_archives(user_id, first_id)",
+        ),
+    ),
+]
+
+
+async def current_version(conn: aiosqlite.Connection) -> int:
+    cur = await conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    row = await cur.fetchone()
+    await cur.close()
+    return int(row[0]) if row else 0
+
+
+async def apply_migrations(conn: aiosqlite.Connection) -> int:
+    # conn — соединение писателя в autocommit-режиме; каждая версия в своей транзакции
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    version = await current_version(conn)
+    for number, name, steps in MIGRATIONS:
+        if number <= version:
+            continue
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            for step in steps:
+                if isinstance(step, str):
+                    await conn.execute(step)
+                else:
+                    await step(conn)
+            await conn.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (number, name),
+            )
+        except BaseException:
+            await conn.rollback()
+            raise
+        await conn.commit()
+        version = number
+    return version
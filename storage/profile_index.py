@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Iterable, Optional
+
+import aiosqlite
+
+# Поля анкеты, по которым ищут: копия в profile_search с нормализованными значениями.
+# SQL-функция lower() в SQLite понимает только ASCII, поэтому приводим регистр здесь
+# (casefold), а не в выражениях/generated-колонках — иначе «Москва» ≠ «москва».
+SEARCH_FIELDS = ("country", "city", "religiosity", "marital_status", "prayer")
+
+_LANG_SPLIT = re.compile(r"[,;/]")
+
+
+def normalize_text(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    text = " ".join(value.split()).casefold()
+    return text or None
+
+
+def normalize_age(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value.strip())
+    if isinstance(value, (int, float)) and 0 < value < 150:
+        return int(value)
+    return None
+
+
+def split_languages(value: Any) -> list[str]:
+    items = value if isinstance(value, list) else _LANG_SPLIT.split(value) if isinstance(value, str) else []
+    langs = {normalize_text(item) for item in items}
+    return sorted(lang for lang in langs if lang)
+
+
+def _search_row(user_id: str, gender: Optional[str], attributes: dict[str, Any]) -> tuple[Any, ...]:
+    return (
+        user_id,
+        gender,
+        normalize_age(attributes.get("age")),
+        *(normalize_text(attributes.get(field)) for field in SEARCH_FIELDS),
+    )
+
+
+async def write_search_rows(
+    conn: aiosqlite.Connection,
+    profiles: Iterable[tuple[str, Optional[str], Optional[dict[str, Any]]]],
+) -> None:
+    # вызывается в транзакции записи профилей: (user_id, gender, attributes)
+    rows = []
+    langs = []
+    for user_id, gender, attributes in profiles:
+        attributes = attributes if isinstance(attributes, dict) else {}
+        rows.append(_search_row(user_id, gender, attributes))
+        langs += [(user_id, lang) for lang in split_languages(attributes.get("languages"))]
+    if not rows:
+        return
+    await conn.executemany(
+        f"INSERT OR REPLACE INTO profile_search (user_id, gender, age, {', '.join(SEARCH_FIELDS)}) "
+        f"VALUES ({', '.join('?' * (3 + len(SEARCH_FIELDS)))})",
+        rows,
+    )
+    await conn.executemany("DELETE FROM profile_languages WHERE user_id = ?", [(r[0],) for r in rows])
+    if langs:
+        await conn.executemany("INSERT OR IGNORE INTO profile_languages (user_id, language) VALUES (?, ?)", langs)
+
+
+async def backfill_search_rows(conn: aiosqlite.Connection, batch_size: int = 1000) -> None:
+    async with conn.execute("SELECT user_id, gender, attributes FROM profiles") as cursor:
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            batch = []
+            for user_id, gender, raw in rows:
+                try:
+                    attributes = json.loads(raw or "{}")
+                except ValueError:
+                    attributes = {}
+                batch.append((user_id, gender, attributes))
+            await write_search_rows(conn, batch)
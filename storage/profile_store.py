@@ -1,37 +1,102 @@
 from __future__ import annotations
 
-import aiosqlite
+import asyncio
+import contextlib
 import json
-from typing import Any, Optional
+import logging
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Optional
+
+from services.metrics import ERRORS
+from storage.cache import TTLCache
+from storage.database import Database
+from storage.profile_index import SEARCH_FIELDS, normalize_text, write_search_rows
+
+if TYPE_CHECKING:
+    from services.profile_outbox import ProfileOutbox
+
+logger = logging.getLogger(__name__)
+
+# слушатель записей: получает записанные анкеты после коммита (индексы в памяти и т.п.)
+ProfileListener = Callable[[list[dict[str, Any]]], None]
 
 
 class ProfileStore:
-    def __init__(self, db_path: str) -> None:
-        self._db_path = db_path
-        self._db: aiosqlite.Connection | None = None
+    # Закэшированные профили отдаются как есть — вызывающий код не должен их изменять.
+    def __init__(
+        self,
+        db: Database,
+        *,
+        cache_size: int = 0,
+        cache_ttl: float = 300.0,
+        outbox: Optional["ProfileOutbox"] = None,
+        change_poll_interval: float = 0.0,
+    ) -> None:
+        self._db = db
+        self._outbox = outbox
+        self._cache: TTLCache[str, dict[str, Any]] = TTLCache(cache_size, cache_ttl)
+        self._by_number: TTLCache[int, str] = TTLCache(cache_size, cache_ttl)
+        # растёт при каждой записи: чтение, начатое до записи, не кладёт в кэш устаревший профиль
+        self._generation = 0
+        self._listeners: list[ProfileListener] = []
+        # > 0: анкеты пишут и другие процессы — их изменения забираются из базы раз в интервал
+        self._poll_interval = change_poll_interval
+        self._poll_since: Optional[str] = None
+        self._poll_seen: dict[str, dict[str, Any]] = {}
+        self._poller: Optional[asyncio.Task[None]] = None
+
+    @property
+    def cache(self) -> TTLCache[str, dict[str, Any]]:
+        return self._cache
+
+    def add_listener(self, listener: ProfileListener) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, profiles: list[dict[str, Any]]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(profiles)
+            except Exception:
+                ERRORS.inc("profile_listener")
+                logger.exception("profile listener %r failed", listener)
 
     async def init(self) -> None:
-        self._db = await aiosqlite.connect(self._db_path)
-        await self._db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS profiles (
-                user_id TEXT PRIMARY KEY,
-                username TEXT,
-                gender TEXT,
-                bio TEXT,
-                attributes TEXT,          -- JSON
-                profile_number INTEGER,   -- номер анкеты в канале (опционально)
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        await self._db.commit()
+        # схема создаётся миграциями (storage/migrations.py) в Database.init
+        if self._poll_interval > 0 and self._poller is None:
+            row = await self._db.fetchone("SELECT MAX(updated_at) FROM profiles")
+            self._poll_since = row[0] if row else None
+            self._poller = asyncio.create_task(self._poll_loop(), name="profile-change-poller")
 
     async def close(self) -> None:
-        if self._db:
-            await self._db.close()
-            self._db = None
+        if self._poller is not None:
+            self._poller.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._poller
+            self._poller = None
+
+    async def poll_changes(self) -> int:
+        # Изменения с прошлого опроса: кэш сбрасывается, слушатели (индексы в памяти) обновляются.
+        # updated_at — с точностью до секунды, поэтому последняя секунда перечитывается каждый раз;
+        # уже виденные в ней версии анкет повторно не рассылаются.
+        changed = [profile async for profile in self.iter_profiles(updated_since=self._poll_since)]
+        if not changed:
+            return 0
+        fresh = [p for p in changed if self._poll_seen.get(p["user_id"]) != p]
+        self._poll_since = changed[-1]["updated_at"]
+        self._poll_seen = {p["user_id"]: p for p in changed if p["updated_at"] == self._poll_since}
+        if fresh:
+            self._invalidate(*(p["user_id"] for p in fresh))
+            if self._listeners:
+                self._notify(fresh)
+        return len(fresh)
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            try:
+                await self.poll_changes()
+            except Exception:
+                ERRORS.inc("profile_change_poll")
+                logger.exception("profile change poll failed")
 
     async def upsert_profile(
         self,
@@ -42,35 +107,158 @@ class ProfileStore:
         bio: Optional[str] = None,
         attributes: Optional[dict[str, Any]] = None,
         profile_number: Optional[int] = None,
+        publish: bool = False,
     ) -> None:
-        assert self._db is not None
+        # publish=True — анкету нужно доставить в основной бот (через outbox, в той же транзакции)
+        publish = publish and self._outbox is not None
         attrs = json.dumps(attributes or {}, ensure_ascii=False)
-        await self._db.execute(
-            """
-            INSERT INTO profiles (user_id, username, gender, bio, attributes, profile_number)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                username=excluded.username,
-                gender=excluded.gender,
-                bio=excluded.bio,
-                attributes=excluded.attributes,
-                profile_number=excluded.profile_number,
-                updated_at=CURRENT_TIMESTAMP
-            """,
-            (user_id, username, gender, bio, attrs, profile_number),
-        )
-        await self._db.commit()
+        displaced: list[str] = []
+        async with self._db.transaction() as conn:
+            if profile_number is not None:
+                # номер анкеты уникален: переходит к новому владельцу
+                rows = await conn.execute_fetchall(
+                    "SELECT user_id FROM profiles WHERE profile_number = ? AND user_id != ?",
+                    (profile_number, user_id),
+                )
+                displaced = [r[0] for r in rows]
+                await conn.execute(
+                    "UPDATE profiles SET profile_number = NULL WHERE profile_number = ? AND user_id != ?",
+                    (profile_number, user_id),
+                )
+            await conn.execute(
+                """
+                INSERT INTO profiles (user_id, username, gender, bio, attributes, profile_number)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username=excluded.username,
+                    gender=excluded.gender,
+                    bio=excluded.bio,
+                    attributes=excluded.attributes,
+                    profile_number=excluded.profile_number,
+                    updated_at=CURRENT_TIMESTAMP
+                """,
+                (user_id, username, gender, bio, attrs, profile_number),
+            )
+            await write_search_rows(conn, [(user_id, gender, attributes)])
+            if publish:
+                await self._outbox.enqueue(  # type: ignore[union-attr]
+                    conn,
+                    user_id,
+                    {
+                        "user_id": user_id,
+                        "username": username,
+                        "gender": gender,
+                        "bio": bio,
+                        "attributes": attributes or {},
+                        "profile_number": profile_number,
+                    },
+                )
+        self._invalidate(user_id, *displaced)
+        if publish:
+            self._outbox.notify()  # type: ignore[union-attr]
+        if self._listeners:
+            self._notify(
+                [
+                    {
+                        "user_id": user_id,
+                        "username": username,
+                        "gender": gender,
+                        "bio": bio,
+                        "attributes": attributes or {},
+                        "profile_number": profile_number,
+                    }
+                ]
+            )
+
+    async def upsert_profiles_many(self, profiles: list[dict[str, Any]]) -> None:
+        # Пачка анкет одной транзакцией через executemany. Итог тот же, что у upsert_profile
+        # по очереди: для пользователя побеждает последняя запись, номер анкеты — у последней
+        # записи с этим номером, прежние владельцы номера его теряют.
+        latest: dict[str, tuple[int, dict[str, Any]]] = {}
+        for index, profile in enumerate(profiles):
+            latest[profile["user_id"]] = (index, profile)
+        # ключ — int, как profile_number возвращает SQLite
+        number_owner: dict[int, tuple[int, str]] = {}
+        for user_id, (index, profile) in latest.items():
+            number = _profile_number(profile)
+            if number is not None and (number not in number_owner or number_owner[number][0] < index):
+                number_owner[number] = (index, user_id)
+
+        rows = []
+        for user_id, (_, profile) in latest.items():
+            number = _profile_number(profile)
+            if number is not None and number_owner[number][1] != user_id:
+                number = None
+            rows.append(
+                (
+                    user_id,
+                    profile.get("username"),
+                    profile.get("gender"),
+                    profile.get("bio"),
+                    json.dumps(profile.get("attributes") or {}, ensure_ascii=False),
+                    number,
+                )
+            )
+        if not rows:
+            return
+
+        displaced: list[str] = []
+        async with self._db.transaction() as conn:
+            owners = [(number, user_id) for number, (_, user_id) in number_owner.items()]
+            if owners:
+                numbers = list(number_owner)
+                for start in range(0, len(numbers), 500):
+                    part = numbers[start : start + 500]
+                    found = await conn.execute_fetchall(
+                        f"SELECT user_id, profile_number FROM profiles WHERE profile_number IN ({','.join('?' * len(part))})",
+                        part,
+                    )
+                    displaced += [r[0] for r in found if number_owner[r[1]][1] != r[0]]
+                await conn.executemany(
+                    "UPDATE profiles SET profile_number = NULL WHERE profile_number = ? AND user_id != ?",
+                    owners,
+                )
+            await conn.executemany(
+                """
+                INSERT INTO profiles (user_id, username, gender, bio, attributes, profile_number)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username=excluded.username,
+                    gender=excluded.gender,
+                    bio=excluded.bio,
+                    attributes=excluded.attributes,
+                    profile_number=excluded.profile_number,
+                    updated_at=CURRENT_TIMESTAMP
+                """,
+                rows,
+            )
+            await write_search_rows(
+                conn, [(uid, p.get("gender"), p.get("attributes")) for uid, (_, p) in latest.items()]
+            )
+        self._invalidate(*latest, *displaced)
+        if self._listeners:
+            self._notify([profile for _, profile in latest.values()])
+
+    def _invalidate(self, *user_ids: str) -> None:
+        self._generation += 1
+        for uid in user_ids:
+            cached = self._cache.pop(uid)
+            if cached and cached.get("profile_number") is not None:
+                self._by_number.pop(cached["profile_number"])
 
     async def get_profile(self, user_id: str) -> Optional[dict[str, Any]]:
-        assert self._db is not None
-        cur = await self._db.execute(
+        if self._cache.enabled:
+            cached = self._cache.get(user_id)
+            if cached is not None:
+                return cached
+        generation = self._generation
+        row = await self._db.fetchone(
             "SELECT user_id, username, gender, bio, attributes, profile_number FROM profiles WHERE user_id = ?",
             (user_id,),
         )
-        row = await cur.fetchone()
         if not row:
             return None
-        return {
+        profile = {
             "user_id": row[0],
             "username": row[1],
             "gender": row[2],
@@ -78,17 +266,31 @@ class ProfileStore:
             "attributes": json.loads(row[4] or "{}"),
             "profile_number": row[5],
         }
+        self._remember(profile, generation)
+        return profile
+
+    def _remember(self, profile: dict[str, Any], generation: int) -> None:
+        if not self._cache.enabled or generation != self._generation:
+            return
+        self._cache.set(profile["user_id"], profile)
+        if profile["profile_number"] is not None:
+            self._by_number.set(profile["profile_number"], profile["user_id"])
 
     async def find_by_number(self, profile_number: int) -> Optional[dict[str, Any]]:
-        assert self._db is not None
-        cur = await self._db.execute(
+        if self._cache.enabled:
+            user_id = self._by_number.get(profile_number)
+            if user_id is not None:
+                cached = self._cache.get(user_id)
+                if cached is not None and cached.get("profile_number") == profile_number:
+                    return cached
+        generation = self._generation
+        row = await self._db.fetchone(
             "SELECT user_id, username, gender, bio, attributes, profile_number FROM profiles WHERE profile_number = ?",
             (profile_number,),
         )
-        row = await cur.fetchone()
         if not row:
             return None
-        return {
+        profile = {
             "user_id": row[0],
             "username": row[1],
             "gender": row[2],
@@ -96,24 +298,134 @@ class ProfileStore:
             "attributes": json.loads(row[4] or "{}"),
             "profile_number": row[5],
         }
+        self._remember(profile, generation)
+        return profile
 
     async def list_profiles(self, limit: int = 50, offset: int = 0) -> list[dict[str, Any]]:
-        assert self._db is not None
-        cur = await self._db.execute(
-            "SELECT user_id, username, gender, bio, attributes, profile_number FROM profiles ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+        # OFFSET-пагинация оставлена для совместимости; глубокие страницы — через list_profiles_page
+        rows = await self._db.fetchall(
+            f"SELECT {_PROFILE_COLUMNS} FROM profiles ORDER BY updated_at DESC, user_id DESC LIMIT ? OFFSET ?",
             (limit, offset),
         )
-        rows = await cur.fetchall()
-        items = []
-        for r in rows:
-            items.append(
-                {
-                    "user_id": r[0],
-                    "username": r[1],
-                    "gender": r[2],
-                    "bio": r[3],
-                    "attributes": json.loads(r[4] or "{}"),
-                    "profile_number": r[5],
-                }
+        return [_profile_from_row(r) for r in rows]
+
+    async def list_profiles_page(
+        self, limit: int = 50, after: Optional[tuple[str, str]] = None
+    ) -> tuple[list[dict[str, Any]], Optional[tuple[str, str]]]:
+        # Keyset-пагинация по (updated_at, user_id), новые первыми: страница стоит одинаково
+        # на любой глубине (спуск по idx_profiles_updated_at). Возвращает ключ для следующей
+        # страницы или None, если это последняя.
+        if after is None:
+            rows = await self._db.fetchall(
+                f"SELECT {_PROFILE_COLUMNS}, updated_at FROM profiles ORDER BY updated_at DESC, user_id DESC LIMIT ?",
+                (limit + 1,),
             )
-        return items
+        else:
+            rows = await self._db.fetchall(
+                f"SELECT {_PROFILE_COLUMNS}, updated_at FROM profiles WHERE (updated_at, user_id) < (?, ?) "
+                "ORDER BY updated_at DESC, user_id DESC LIMIT ?",
+                (after[0], after[1], limit + 1),
+            )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_key = (rows[-1][6], rows[-1][0]) if more else None
+        return [_profile_from_row(r) for r in rows], next_key
+
+    async def iter_profiles(
+        self, *, updated_since: Optional[str] = None, batch_size: int = 1000
+    ) -> AsyncIterator[dict[str, Any]]:
+        # Все профили от старых изменений к новым, пачками по ключу (updated_at, user_id).
+        # Соединение-читатель занято только на время одной пачки; профиль, изменённый во
+        # время выгрузки, уходит в конец и попадёт в неё ещё раз — уже в новой версии.
+        key: tuple[str, str] = (updated_since or "", "")
+        while True:
+            rows = await self._db.fetchall(
+                f"SELECT {_PROFILE_COLUMNS}, updated_at FROM profiles WHERE (updated_at, user_id) > (?, ?) "
+                "ORDER BY updated_at, user_id LIMIT ?",
+                (key[0], key[1], batch_size),
+            )
+            for r in rows:
+                profile = _profile_from_row(r)
+                profile["updated_at"] = r[6]
+                yield profile
+            if len(rows) < batch_size:
+                return
+            key = (rows[-1][6], rows[-1][0])
+
+    async def search_profiles(
+        self,
+        *,
+        gender: Optional[str] = None,
+        age_min: Optional[int] = None,
+        age_max: Optional[int] = None,
+        language: Optional[str] = None,
+        limit: int = 50,
+        after: Optional[str] = None,
+        **fields: Optional[str],
+    ) -> tuple[list[dict[str, Any]], Optional[str]]:
+        # Фильтры по profile_search/profile_languages (индексы из миграции 6); текстовые
+        # значения сравниваются после той же нормализации, что и при записи. fields — поля
+        # из SEARCH_FIELDS (country, city, religiosity, ...). Страницы — по user_id.
+        unknown = set(fields) - set(SEARCH_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown search fields: {', '.join(sorted(unknown))}")
+        joins = ""
+        where: list[str] = []
+        params: list[Any] = []
+        # с фильтром по языку порядок user_id даёт первичный ключ profile_languages — без сортировки
+        key = "s.user_id"
+        if language:
+            joins = " JOIN profile_languages l ON l.user_id = s.user_id AND l.language = ?"
+            params.append(normalize_text(language))
+            key = "l.user_id"
+        if gender:
+            where.append("s.gender = ?")
+            params.append(gender)
+        if age_min is not None:
+            where.append("s.age >= ?")
+            params.append(age_min)
+        if age_max is not None:
+            where.append("s.age <= ?")
+            params.append(age_max)
+        for field, value in fields.items():
+            if value:
+                where.append(f"s.{field} = ?")
+                params.append(normalize_text(value))
+        if after is not None:
+            where.append(f"{key} > ?")
+            params.append(after)
+        rows = await self._db.fetchall(
+            f"""
+            SELECT {', '.join('p.' + c for c in _PROFILE_COLUMNS.split(', '))}
+            FROM (
+                SELECT {key} AS user_id FROM profile_search s{joins}
+                {'WHERE ' + ' AND '.join(where) if where else ''}
+                ORDER BY {key} LIMIT ?
+            ) ids
+            JOIN profiles p ON p.user_id = ids.user_id
+            ORDER BY p.user_id
+            """,
+            (*params, limit + 1),
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return [_profile_from_row(r) for r in rows], rows[-1][0] if more else None
+
+
+_PROFILE_COLUMNS = "user_id, username, gender, bio, attributes, profile_number"
+
+
+def _profile_from_row(r: Any) -> dict[str, Any]:
+    return {
+        "user_id": r[0],
+        "username": r[1],
+        "gender": r[2],
+        "bio": r[3],
+        "attributes": json.loads(r[4] or "{}"),
+        "profile_number": r[5],
+    }
+
+
+def _profile_number(profile: dict[str, Any]) -> Optional[int]:
+    number = profile.get("profile_number")
+    return int(number) if number is not None else None
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+import unittest
+from typing import Any, AsyncIterator, Optional
+
+from services.json_stream import JsonStreamError, iter_json_records
+
+
+async def _chunks(parts: list[bytes]) -> AsyncIterator[bytes]:
+    for part in parts:
+        yield part
+
+
+async def _parse(parts: list[bytes], **options: Any) -> list[tuple[Optional[Any], Optional[str]]]:
+    return [item async for item in iter_json_records(_chunks(parts), **options)]
+
+
+def _split(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class ArrayTest(unittest.IsolatedAsyncioTestCase):
+    async def test_every_split_point(self) -> None:
+        records = [{"user_id": "1", "about": "привет \"мир\"\\n"}, 12345, -0.5e3, "строка", True, None, [1, [2]]]
+        data = json.dumps(records, ensure_ascii=False).encode("utf-8")
+        for size in range(1, len(data) + 1):
+            with self.subTest(size=size):
+                self.assertEqual(await _parse(_split(data, size)), [(r, None) for r in records])
+
+    async def test_number_split_across_chunks(self) -> None:
+        self.assertEqual(await _parse([b"[12", b"34, 5", b"6]"]), [(1234, None), (56, None)])
+        self.assertEqual(await _parse([b"[1.", b"5e", b"2]"]), [(150.0, None)])
+
+    async def test_string_cut_mid_escape(self) -> None:
+        parts = [b'["a\\', b'"b\\u04', b'1f\\', b'n"]']
+        self.assertEqual(await _parse(parts), [('a"bП\n', None)])
+
+    async def test_utf8_cut_mid_character(self) -> None:
+        data = '["Москва"]'.encode("utf-8")
+        self.assertEqual(await _parse([data[:4], data[4:]]), [("Москва", None)])
+
+    async def test_empty_array(self) -> None:
+        self.assertEqual(await _parse([b" [ ", b"] "]), [])
+
+    async def test_malformed(self) -> None:
+        cases = {
+            "trailing comma": [b"[1,", b"]"],
+            "trailing comma after object": [b'[{"a": 1} , ]'],
+            "leading comma": [b"[,1]"],
+            "double comma": [b"[1,,2]"],
+            "missing comma": [b"[1 2]"],
+            "unterminated": [b"[1, 2"],
+            "data after array": [b"[1] 2"],
+            "bad token": [b"[nul]"],
+            "invalid utf-8": [b'["\xff"]'],
+        }
+        for name, parts in cases.items():
+            with self.subTest(name):
+                with self.assertRaises(JsonStreamError):
+                    await _parse(parts)
+
+    async def test_record_too_large(self) -> None:
+        with self.assertRaises(JsonStreamError):
+            await _parse([b'["' + b"x" * 100, b'"]'], max_record_size=50)
+
+
+class NdjsonTest(unittest.IsolatedAsyncioTestCase):
+    async def test_lines_split_across_chunks(self) -> None:
+        data = b'{"a": 1}\n{"a": 2}\n\n{"a": 3}\n'
+        for size in range(1, len(data) + 1):
+            with self.subTest(size=size):
+                self.assertEqual(await _parse(_split(data, size)), [({"a": i}, None) for i in (1, 2, 3)])
+
+    async def test_no_final_newline(self) -> None:
+        self.assertEqual(await _parse([b'{"a": 1}\n{"a"', b": 2}"]), [({"a": 1}, None), ({"a": 2}, None)])
+
+    async def test_crlf(self) -> None:
+        self.assertEqual(await _parse([b'{"a": 1}\r\n{"a": 2}\r\n']), [({"a": 1}, None), ({"a": 2}, None)])
+
+    async def test_bad_line_does_not_stop_the_stream(self) -> None:
+        items = await _parse([b'{"a": 1}\n{"a": \n{"a": 3}\n'])
+        self.assertEqual(items[0], ({"a": 1}, None))
+        self.assertIsNone(items[1][0])
+        self.assertTrue(items[1][1].startswith("invalid json"))
+        self.assertEqual(items[2], ({"a": 3}, None))
+
+    async def test_record_too_large(self) -> None:
+        with self.assertRaises(JsonStreamError):
+            await _parse([b'{"a": "' + b"x" * 100, b'"}\n'], max_record_size=50)
+
+
+if __name__ == "__main__":
+    unittest.main()